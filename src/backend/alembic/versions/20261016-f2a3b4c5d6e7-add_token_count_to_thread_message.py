@@ -0,0 +1,27 @@
+"""add-token-count-to-thread-message
+
+Revision ID: f2a3b4c5d6e7
+Revises: e1f2a3b4c5d6
+Create Date: 2026-10-16
+
+"""
+
+from typing import Sequence, Union
+import sqlalchemy as sa
+from alembic import op
+
+
+revision: str = 'f2a3b4c5d6e7'
+down_revision: Union[str, None] = 'e1f2a3b4c5d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('thread_message', sa.Column('token_count', sa.Integer(), nullable=True))
+    op.add_column('thread_message', sa.Column('token_count_model_id', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('thread_message', 'token_count_model_id')
+    op.drop_column('thread_message', 'token_count')
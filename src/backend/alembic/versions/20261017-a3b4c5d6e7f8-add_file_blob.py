@@ -0,0 +1,56 @@
+"""add-file-blob
+
+Revision ID: a3b4c5d6e7f8
+Revises: f2a3b4c5d6e7
+Create Date: 2026-10-17
+
+"""
+
+from typing import Sequence, Union
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+import sqlmodel
+
+
+revision: str = 'a3b4c5d6e7f8'
+down_revision: Union[str, None] = 'f2a3b4c5d6e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'file_blob',
+        sa.Column('hash', sqlmodel.AutoString(length=64), nullable=False),
+        sa.Column('content', sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint('hash')
+    )
+    # contents are already compressed (or not compressible) in most cases, and stored uncompressed they can be read in chunks
+    # without loading them entirely
+    op.execute("ALTER TABLE file_blob ALTER COLUMN content SET STORAGE EXTERNAL")
+    op.create_table(
+        'file_processed_content',
+        sa.Column('content_hash', sqlmodel.AutoString(length=64), nullable=False),
+        sa.Column('file_processor', postgresql.ENUM('BASIC', 'ENHANCED', name='fileprocessor', create_type=False), nullable=False),
+        sa.Column('processed_content', sqlmodel.AutoString(), nullable=False),
+        sa.PrimaryKeyConstraint('content_hash', 'file_processor')
+    )
+    op.add_column('file', sa.Column('content_hash', sqlmodel.AutoString(length=64), nullable=True))
+    op.execute("UPDATE file SET content_hash = encode(sha256(content), 'hex')")
+    op.execute("INSERT INTO file_blob (hash, content) SELECT DISTINCT ON (content_hash) content_hash, content FROM file")
+    op.alter_column('file', 'content_hash', nullable=False)
+    op.create_foreign_key(op.f('file_content_hash_fkey'), 'file', 'file_blob', ['content_hash'], ['hash'])
+    op.create_index(op.f('ix_file_content_hash'), 'file', ['content_hash'], unique=False)
+    op.drop_column('file', 'content')
+
+
+def downgrade() -> None:
+    op.add_column('file', sa.Column('content', sa.LargeBinary(), nullable=True))
+    op.execute("UPDATE file SET content = file_blob.content FROM file_blob WHERE file_blob.hash = file.content_hash")
+    op.alter_column('file', 'content', nullable=False)
+    op.drop_index(op.f('ix_file_content_hash'), table_name='file')
+    op.drop_constraint(op.f('file_content_hash_fkey'), 'file', type_='foreignkey')
+    op.drop_column('file', 'content_hash')
+    op.drop_table('file_processed_content')
+    op.drop_table('file_blob')
@@ -0,0 +1,35 @@
+"""add-minutes-saved-estimation
+
+Revision ID: b4c5d6e7f8a9
+Revises: a3b4c5d6e7f8
+Create Date: 2026-10-17
+
+"""
+
+from typing import Sequence, Union
+import sqlalchemy as sa
+from alembic import op
+
+
+revision: str = 'b4c5d6e7f8a9'
+down_revision: Union[str, None] = 'a3b4c5d6e7f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'minutes_saved_estimation',
+        sa.Column('answer_message_id', sa.Integer(), nullable=False),
+        sa.Column('thread_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('claimed_until', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['answer_message_id'], ['thread_message.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('answer_message_id')
+    )
+    op.create_index(op.f('ix_minutes_saved_estimation_claimed_until'), 'minutes_saved_estimation', ['claimed_until'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_minutes_saved_estimation_claimed_until'), table_name='minutes_saved_estimation')
+    op.drop_table('minutes_saved_estimation')
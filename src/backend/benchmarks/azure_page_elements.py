@@ -0,0 +1,89 @@
+"""
+Compares building the content of each page of a Document Intelligence result (for a chunk of 50 pages), grouping elements by page in
+one pass and sweeping paragraphs against tables, with the previous implementation which scanned all the result elements for each
+page and checked every paragraph against every table of the page.
+
+The pages of a sample result of the prebuilt-layout model (benchmarks/assets/analyze_result.json) are repeated to build the chunk,
+so no Document Intelligence service is required.
+
+Run it from src/backend with: python -m benchmarks.azure_page_elements
+"""
+import copy
+import json
+import os
+import time
+from typing import Callable
+
+from azure.ai.documentintelligence.models import AnalyzeResult
+
+from tero.files.processors.pdf.azure_document_intelligence import AzureDocumentIntelligencePdfProcessor, BoundedElement, \
+    BoundedParagraph, BoundedTable
+
+
+PAGES = 50
+ELEMENTS_SCALES = [1, 4, 16]
+RUNS = 5
+
+
+def _load_result(elements_scale: int) -> AnalyzeResult:
+    with open(os.path.join(os.path.dirname(__file__), "assets", "analyze_result.json")) as f:
+        sample = json.load(f)
+    sample_pages = len(sample["pages"])
+    ret: dict = {"pages": [], "paragraphs": [], "tables": []}
+    for page_number in range(1, PAGES + 1):
+        sample_page_number = (page_number - 1) % sample_pages + 1
+        ret["pages"].append({**sample["pages"][sample_page_number - 1], "pageNumber": page_number})
+        # elements are repeated in the same page to simulate denser pages
+        for _ in range(elements_scale):
+            for element_type in ["paragraphs", "tables"]:
+                for element in sample[element_type]:
+                    if element["boundingRegions"][0]["pageNumber"] == sample_page_number:
+                        element = copy.deepcopy(element)
+                        element["boundingRegions"][0]["pageNumber"] = page_number
+                        ret[element_type].append(element)
+    return AnalyzeResult(ret)
+
+
+def _build_pages_content_scanning(processor: AzureDocumentIntelligencePdfProcessor, result: AnalyzeResult) -> dict[int, str]:
+    ret = {}
+    for page in result.get("pages", []):
+        page_number = page.get("pageNumber", 1)
+        paragraphs = [e for e in result.get("paragraphs", []) if e.get("boundingRegions", [{}])[0].get("pageNumber", -1) == page_number]
+        tables = [e for e in result.get("tables", []) if e.get("boundingRegions", [{}])[0].get("pageNumber", -1) == page_number]
+        paragraph_elements = [e for e in (BoundedParagraph.from_paragraph(p) for p in paragraphs) if e]
+        table_elements: list[BoundedElement] = [e for e in (BoundedTable.from_cells(t) for t in tables) if e]
+        elements: list[BoundedElement] = [p for p in paragraph_elements if not p.bbox or not any(
+            t.bbox and p.bbox.y >= t.bbox.y and p.bbox.y + p.bbox.height <= t.bbox.y + t.bbox.height for t in table_elements)]
+        elements.extend(table_elements)
+        ret[page_number] = processor._combine_elements_content(elements)
+    return ret
+
+
+def _build_pages_content_indexed(processor: AzureDocumentIntelligencePdfProcessor, result: AnalyzeResult) -> dict[int, str]:
+    return processor._build_pages_content(result, 1)
+
+
+def _measure_ms(build: Callable[[AzureDocumentIntelligencePdfProcessor, AnalyzeResult], dict[int, str]],
+                processor: AzureDocumentIntelligencePdfProcessor, result: AnalyzeResult) -> tuple[float, dict[int, str]]:
+    # the result is built once outside the timed runs, which also warms them up
+    ret = build(processor, result)
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        build(processor, result)
+    return (time.perf_counter() - start) / RUNS * 1000, ret
+
+
+def main():
+    # the processor client is not needed to build pages content from a result
+    processor = AzureDocumentIntelligencePdfProcessor.__new__(AzureDocumentIntelligencePdfProcessor)
+    print(f"{'paragraphs':>11}{'tables':>8}{'scanning ms':>13}{'indexed ms':>12}{'speedup':>9}")
+    for scale in ELEMENTS_SCALES:
+        result = _load_result(scale)
+        scanning, expected = _measure_ms(_build_pages_content_scanning, processor, result)
+        indexed, actual = _measure_ms(_build_pages_content_indexed, processor, result)
+        assert actual == expected
+        print(f"{len(result['paragraphs']):>11}{len(result['tables']):>8}{scanning:>13.1f}{indexed:>12.1f}{scanning / indexed:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
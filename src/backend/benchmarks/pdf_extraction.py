@@ -0,0 +1,104 @@
+"""
+Compares extracting the text of big PDFs with the basic PDF processor, parsing the PDF once, against the previous pipeline which
+parsed the whole PDF again to count its pages and to write each chunk of 50 pages, and against extracting chunks in parallel
+(in a pool of PDF_EXTRACTION_MAX_CONCURRENCY processes).
+
+PDFs are generated (with a paragraph per page) so no asset is required.
+
+Run it from src/backend with: python -m benchmarks.pdf_extraction
+"""
+import io
+import time
+
+from pypdf import PdfReader, PdfWriter
+import pypdfium2
+
+from tero.api import app  # noqa: F401 imports all domain models
+from tero.core.env import env
+from tero.files.core import CurrentQuota, FileQuota
+from tero.files.domain import File
+from tero.files.processors.pdf import PyPdfiumPdfProcessor
+from tero.usage.domain import Usage, UsageType
+
+
+PAGES = [100, 500, 1000]
+CHUNK_SIZE = 50
+LINES_PER_PAGE = 40
+
+
+def _generate_pdf(pages: int) -> bytes:
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Kids [" + b" ".join(f"{4 + i * 2} 0 R".encode() for i in range(pages)) + f"] /Count {pages} >>".encode(),
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i in range(pages):
+        lines = b"".join(f"(Page {i + 1} line {j + 1}: the quick brown fox jumps over the lazy dog) Tj T* ".encode() for j in range(LINES_PER_PAGE))
+        stream = b"BT /F1 10 Tf 14 TL 40 800 Td " + lines + b"ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents {5 + i * 2} 0 R >>".encode())
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+    ret = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(ret))
+        ret += f"{number} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref_offset = len(ret)
+    ret += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode() + b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    ret += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF".encode()
+    return ret
+
+
+def _extract_reparsing(content: bytes) -> int:
+    total_pages = len(PdfReader(io.BytesIO(content)).pages)
+    extracted = 0
+    for start_page in range(1, total_pages + 1, CHUNK_SIZE):
+        end_page = min(start_page + CHUNK_SIZE - 1, total_pages)
+        pdf_reader = PdfReader(io.BytesIO(content))
+        pdf_writer = PdfWriter()
+        for page_num in range(start_page, end_page + 1):
+            pdf_writer.add_page(pdf_reader.pages[page_num - 1])
+        output_buffer = io.BytesIO()
+        pdf_writer.write(output_buffer)
+        with pypdfium2.PdfDocument(output_buffer.getvalue()) as pdf:
+            for page in pdf:
+                extracted += len(page.get_textpage().get_text_bounded())
+    return extracted
+
+
+def _extract_single_parse(content: bytes) -> int:
+    file = File(id=1, name="benchmark.pdf", content_type="application/pdf", user_id=1, content=content)
+    usage = Usage(user_id=1, agent_id=1, model_id=None, type=UsageType.PDF_PARSING)
+    return len(PyPdfiumPdfProcessor().extract_text(file, FileQuota(usage, None, CurrentQuota(0, 1))))
+
+
+def _extract_parallel(content: bytes) -> int:
+    return _extract_single_parse(content)
+
+
+def _extract_sequential(content: bytes) -> int:
+    max_concurrency = env.pdf_extraction_max_concurrency
+    env.pdf_extraction_max_concurrency = 1
+    try:
+        return _extract_single_parse(content)
+    finally:
+        env.pdf_extraction_max_concurrency = max_concurrency
+
+
+def _measure_ms(extract, content: bytes) -> float:
+    start = time.perf_counter()
+    extract(content)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    # warm up the processes pool, which is only started once
+    _extract_parallel(_generate_pdf(PAGES[0]))
+    print(f"{'pages':>6}{'MB':>8}{'reparsing ms':>14}{'single parse ms':>17}{'parallel ms':>13}{'speedup':>9}")
+    for pages in PAGES:
+        content = _generate_pdf(pages)
+        reparsing = _measure_ms(_extract_reparsing, content)
+        single_parse = _measure_ms(_extract_sequential, content)
+        parallel = _measure_ms(_extract_parallel, content)
+        print(f"{pages:>6}{len(content) / 1024 / 1024:>8.1f}{reparsing:>14.0f}{single_parse:>17.0f}{parallel:>13.0f}{reparsing / parallel:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Compares the time and memory required to extract the text of big xlsx workbooks, loading the whole workbook and reading each
+cell (as was done before), against reading rows in read only mode (as XlsxFileProcessor does).
+
+Loading the whole workbook is only measured for the smaller workbooks, since it takes hours with the bigger ones: besides
+loading all cells, openpyxl computes the sheet dimensions from all its cells every time they are accessed (for every row).
+
+Workbooks are generated (with a header and rows of mixed types, plus formatted but empty trailing rows and columns) so no asset
+is required.
+
+Run it from src/backend with: python -m benchmarks.spreadsheet_extraction
+"""
+import io
+import time
+import tracemalloc
+from typing import Callable
+
+import openpyxl
+
+from tero.api import app  # noqa: F401 imports all domain models
+from tero.files.core import CurrentQuota, FileQuota
+from tero.files.domain import File
+from tero.files.processors.spreadsheet import XlsxFileProcessor
+from tero.usage.domain import Usage, UsageType
+
+
+ROWS = [1000, 5000, 100000]
+LOADING_MAX_ROWS = 5000
+COLUMNS = 10
+EMPTY_TRAILING_ROWS = 1000
+
+
+def _generate_workbook(rows: int) -> bytes:
+    wb = openpyxl.Workbook(write_only=True)
+    sheet = wb.create_sheet("Export")
+    sheet.append([f"column {col}" for col in range(COLUMNS)])
+    for row in range(rows):
+        sheet.append([row, f"name {row}", row * 1.5, f"country {row % 50}", None, True, f"code-{row:08d}", row % 7, "", f"note {row}"])
+    # formatted cells add empty rows and columns to the sheet dimensions
+    for _ in range(EMPTY_TRAILING_ROWS):
+        sheet.append([None] * (COLUMNS + 5) + [""])
+    ret = io.BytesIO()
+    wb.save(ret)
+    return ret.getvalue()
+
+
+def _extract_loading_workbook(content: bytes) -> int:
+    wb = openpyxl.load_workbook(io.BytesIO(content))
+    sheets = [sheet for sheet in wb.worksheets if sheet.max_row]
+    text = "\n\n".join("\n".join(" | ".join(_format_cell(sheet.cell(row + 1, col + 1).value) for col in range(sheet.max_column))
+                                 for row in range(sheet.max_row)) for sheet in sheets)
+    return len(text)
+
+
+def _format_cell(value) -> str:
+    return str(value) if value is not None else ""
+
+
+def _extract_streaming(content: bytes) -> int:
+    file = File(id=1, name="benchmark.xlsx", content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", user_id=1,
+                content=content)
+    usage = Usage(user_id=1, agent_id=1, model_id=None, type=UsageType.PDF_PARSING)
+    return len(XlsxFileProcessor().extract_text(file, FileQuota(usage, None, CurrentQuota(0, 1))))
+
+
+def _measure(extract: Callable[[bytes], int], content: bytes) -> dict[str, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    extract(content)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"ms": elapsed * 1000, "peak_mb": peak / 1024 / 1024}
+
+
+def main():
+    print(f"{'rows':>8}{'MB':>6}{'loading ms':>12}{'peak MB':>9}{'streaming ms':>14}{'peak MB':>9}")
+    for rows in ROWS:
+        content = _generate_workbook(rows)
+        loading = f"{'-':>12}{'-':>9}"
+        if rows <= LOADING_MAX_ROWS:
+            m = _measure(_extract_loading_workbook, content)
+            loading = f"{m['ms']:>12.0f}{m['peak_mb']:>9.1f}"
+        streaming = _measure(_extract_streaming, content)
+        print(f"{rows:>8}{len(content) / 1024 / 1024:>6.1f}{loading}{streaming['ms']:>14.0f}{streaming['peak_mb']:>9.1f}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Compares the frames sent to clients when streaming an answer token by token, against streaming it with EventStreamResponse
+and coalesced text chunks.
+
+The answer is simulated (no LLM is used) with tokens generated in bursts, like most model providers do, and the app is called
+directly through ASGI with GZipMiddleware installed, measuring what would be written to the socket.
+
+Run it from src/backend with: python -m benchmarks.sse_streaming
+"""
+import asyncio
+import random
+import time
+import zlib
+from typing import AsyncIterator
+
+from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
+from sse_starlette.event import ServerSentEvent
+from starlette.types import Message, Scope
+
+from tero.core.api import EventStreamResponse, coalesce
+
+
+TOKENS = 1500
+COALESCE_WINDOW_SECONDS = 0.02
+
+
+async def _generate_tokens() -> AsyncIterator[str]:
+    rnd = random.Random(42)
+    for i in range(TOKENS):
+        # tokens usually arrive in bursts with small pauses between them
+        await asyncio.sleep(0.01 if i % 20 == 0 else rnd.uniform(0, 0.002))
+        yield rnd.choice(["the ", "answer ", "is ", "a ", "token ", "stream ", "of ", "words ", "\n"])
+
+
+async def _encode(tokens: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    async for token in tokens:
+        yield ServerSentEvent(data=token).encode()
+
+
+def _build_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(GZipMiddleware)
+
+    @app.get("/per-token")
+    async def per_token() -> StreamingResponse:
+        return StreamingResponse(_encode(_generate_tokens()), media_type="text/event-stream")
+
+    # starlette versions before 0.46 compressed event streams, which is simulated with a content type that is not excluded
+    @app.get("/per-token-gzip")
+    async def per_token_gzip() -> StreamingResponse:
+        return StreamingResponse(_encode(_generate_tokens()), media_type="application/x-event-stream")
+
+    @app.get("/coalesced")
+    async def coalesced() -> EventStreamResponse:
+        return EventStreamResponse(_encode(coalesce(_generate_tokens(), lambda _: True, lambda a, b: a + b, COALESCE_WINDOW_SECONDS)))
+
+    return app
+
+
+async def _measure(app: FastAPI, path: str) -> dict[str, float]:
+    frames, total_bytes = 0, 0
+    first_token_at = None
+    decompressor = None
+    start = time.perf_counter()
+
+    requested = False
+    finished = asyncio.Event()
+
+    async def receive() -> Message:
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        nonlocal frames, total_bytes, first_token_at, decompressor
+        if message["type"] == "http.response.start" and (b"content-encoding", b"gzip") in message["headers"]:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = message.get("body", b"") if message["type"] == "http.response.body" else b""
+        if body:
+            frames += 1
+            total_bytes += len(body)
+            # compressed frames might not include any token until the compressor flushes
+            if not first_token_at and (decompressor.decompress(body) if decompressor else body):
+                first_token_at = time.perf_counter()
+
+    scope: Scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http", "path": path,
+             "raw_path": path.encode(), "query_string": b"", "root_path": "", "headers": [(b"accept-encoding", b"gzip")],
+             "client": ("127.0.0.1", 1234), "server": ("127.0.0.1", 80)}
+    await app(scope, receive, send)
+    finished.set()
+    elapsed = time.perf_counter() - start
+    return {"bytes": total_bytes, "frames": frames, "frames_per_second": frames / elapsed,
+            "first_token_ms": ((first_token_at or start) - start) * 1000, "total_ms": elapsed * 1000}
+
+
+async def main():
+    app = _build_app()
+    # warm up
+    await _measure(app, "/per-token")
+    print(f"{'path':<16}{'bytes':>10}{'frames':>10}{'frames/s':>10}{'1st token ms':>14}{'total ms':>10}")
+    for path in ["/per-token", "/per-token-gzip", "/coalesced"]:
+        m = await _measure(app, path)
+        print(f"{path:<16}{m['bytes']:>10}{m['frames']:>10}{m['frames_per_second']:>10.0f}{m['first_token_ms']:>14.1f}{m['total_ms']:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+"""
+Compares the time and memory required to list the messages of a thread with big attachments, when loading the whole files
+(as was done before) against only loading files metadata (as ThreadMessageRepository.find_by_thread_id does).
+
+A sqlite database is used, so it can be run without further setup. With postgres, loading files contents is even more expensive
+since contents also have to be transferred through the network.
+
+Run it from src/backend with: python -m benchmarks.thread_file_loading
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Awaitable, Callable, List
+
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from sqlalchemy.orm import selectinload
+from sqlmodel import SQLModel, select, col
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from tero.api import app  # noqa: F401 imports all domain models
+from tero.core.repos import attr
+from tero.files.domain import File, FileStatus
+from tero.threads.domain import ThreadMessage, ThreadMessageFile, ThreadMessageOrigin
+from tero.threads.repos import ThreadMessageRepository
+
+
+THREAD_ID = 1
+MESSAGES = 20
+ATTACHMENTS_PER_USER_MESSAGE = 2
+ATTACHMENT_SIZE_BYTES = 4 * 1024 * 1024
+PROCESSED_CONTENT_SIZE_CHARS = 200 * 1024
+RUNS = 5
+
+
+async def _populate(engine: AsyncEngine):
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    rnd = random.Random(42)
+    async with AsyncSession(engine) as db:
+        for i in range(MESSAGES):
+            origin = ThreadMessageOrigin.USER if i % 2 == 0 else ThreadMessageOrigin.AGENT
+            message = ThreadMessage(thread_id=THREAD_ID, text=f"message {i}", origin=origin)
+            db.add(message)
+            await db.flush()
+            for j in range(ATTACHMENTS_PER_USER_MESSAGE if origin == ThreadMessageOrigin.USER else 0):
+                file = File(name=f"file-{i}-{j}.pdf", content_type="application/pdf", user_id=1, content=rnd.randbytes(ATTACHMENT_SIZE_BYTES),
+                            status=FileStatus.PROCESSED, processed_content="x" * PROCESSED_CONTENT_SIZE_CHARS)
+                db.add(file.blob)
+                db.add(file)
+                await db.flush()
+                db.add(ThreadMessageFile(thread_message_id=message.id, file_id=file.id))
+        await db.commit()
+
+
+async def _find_with_contents(db: AsyncSession) -> List[ThreadMessage]:
+    stmt = (
+        select(ThreadMessage)
+        .where(ThreadMessage.thread_id == THREAD_ID)
+        .order_by(col(ThreadMessage.timestamp))
+        .options(selectinload(attr(ThreadMessage.files)).selectinload(attr(ThreadMessageFile.file))))
+    ret = await db.exec(stmt)
+    return list(ret.all())
+
+
+async def _find_metadata(db: AsyncSession) -> List[ThreadMessage]:
+    return await ThreadMessageRepository(db).find_by_thread_id(THREAD_ID)
+
+
+async def _measure(engine: AsyncEngine, find: Callable[[AsyncSession], Awaitable[List[ThreadMessage]]]) -> dict[str, float]:
+    elapsed = 0.0
+    peak = 0
+    for _ in range(RUNS):
+        async with AsyncSession(engine) as db:
+            tracemalloc.start()
+            start = time.perf_counter()
+            messages = await find(db)
+            elapsed += time.perf_counter() - start
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            assert sum(len(m.files) for m in messages) == MESSAGES // 2 * ATTACHMENTS_PER_USER_MESSAGE
+    return {"ms": elapsed / RUNS * 1000, "peak_mb": peak / 1024 / 1024}
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp_dir, 'benchmark.db')}")
+        try:
+            await _populate(engine)
+            print(f"{MESSAGES} messages with {MESSAGES // 2 * ATTACHMENTS_PER_USER_MESSAGE} attachments of {ATTACHMENT_SIZE_BYTES // 1024 // 1024} MB")
+            print(f"{'loading':<12}{'avg ms':>10}{'peak MB':>10}")
+            for name, find in [("contents", _find_with_contents), ("metadata", _find_metadata)]:
+                m = await _measure(engine, find)
+                print(f"{name:<12}{m['ms']:>10.1f}{m['peak_mb']:>10.1f}")
+        finally:
+            await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,7 +3,7 @@ from enum import Enum
 from typing import Annotated, Optional, List, cast
 from zipfile import BadZipFile
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, BackgroundTasks, Request, Response
 from fastapi.responses import StreamingResponse
 from sqlmodel.ext.asyncio.session import AsyncSession
 
@@ -13,7 +13,7 @@ from ..core.auth import get_current_user
 from ..core.domain import CamelCaseModel
 from ..core.env import env
 from ..core.repos import get_db
-from ..files.api import build_file_download_response
+from ..files.api import build_file_download_response, build_generated_file_download_response, read_upload
 from ..files.core import QuotaExceededError, add_encoding_to_content_type
 from ..files.domain import File, FileStatus, FileUpdate, FileMetadata, FileMetadataWithContent
 from ..files.repos import FileRepository
@@ -253,11 +253,13 @@ async def upload_agent_tool_file(agent_id: int, tool_id: str, file: UploadFile,
         user: Annotated[User, Depends(get_current_user)], db: Annotated[AsyncSession, Depends(get_db)],
         background_tasks: BackgroundTasks) -> FileMetadata:
         tool = await _find_editable_configured_agent_tool(agent_id, tool_id, user, db)
+        blob = await read_upload(file)
         f = File(
             user_id=user.id,
             name=file.filename or _DEFAULT_FILE_NAME,
             content_type=file.content_type or "",
-            content=await file.read(),
+            blob=blob,
+            content_hash=blob.hash,
             status=FileStatus.PENDING
         )
         return await upload_tool_file(f, tool, agent_id, user, db, background_tasks)
@@ -276,10 +278,10 @@ AGENT_TOOL_FILE_CONTENT_PATH = f"{AGENT_TOOL_FILE_PATH}/content"
 @router.get(AGENT_TOOL_FILE_CONTENT_PATH)
 async def download_agent_tool_file(agent_id: int, tool_id: str, file_id: int,
         user: Annotated[User, Depends(get_current_user)],
-        db: Annotated[AsyncSession, Depends(get_db)]) -> StreamingResponse:
+        request: Request, db: Annotated[AsyncSession, Depends(get_db)]) -> Response:
     await _find_configured_agent_tool(agent_id, tool_id, user, db)
-    ret = await AgentToolConfigFileRepository(db).find_with_content_by_ids(agent_id, tool_id, file_id)
-    return build_file_download_response(ret)
+    ret = await AgentToolConfigFileRepository(db).find_metadata_by_ids(agent_id, tool_id, file_id)
+    return await build_file_download_response(ret, request, db)
 
 
 @router.get(AGENT_TOOL_FILE_PATH)
@@ -299,15 +301,17 @@ async def update_agent_tool_file(agent_id: int, tool_id: str, file_id: int, file
         background_tasks: BackgroundTasks) -> FileMetadata:
     tool = await _find_editable_configured_agent_tool(agent_id, tool_id, user, db)
     f = await _find_agent_tool_file(agent_id, tool_id, file_id, db)
-    file_content = await file.read()
+    blob = await read_upload(file)
     update = FileUpdate(
-        content=file_content if len(file_content) > 0 else None,
-        content_type=add_encoding_to_content_type(file.content_type, file_content),
+        content_type=add_encoding_to_content_type(file.content_type, blob.content),
         name=file.filename or _DEFAULT_FILE_NAME,
         user_id=user.id,
         status=FileStatus.PENDING
     )
     f.update_with(update)
+    if len(blob.content) > 0:
+        f.blob = blob
+        f.content_hash = blob.hash
     await FileRepository(db).update(f)
     # Pass IDs instead of objects to avoid session conflicts
     # The background task will create its own session and re-fetch the entities
@@ -324,7 +328,7 @@ async def _find_agent_tool_file(agent_id: int, tool_id: str, file_id: int, db: A
 
 async def _update_tool_file(file_id: int, tool_id: str, agent_id: int, user_id: int, tool_config: dict):
     async with AsyncSession(repos_module.engine, expire_on_commit=False) as db:
-        file = cast(File, await FileRepository(db).find_by_id(file_id))
+        file = cast(File, await FileRepository(db).find_with_content_by_id(file_id))
         user = cast(User, await UserRepository(db).find_by_id(user_id))
         agent = cast(Agent, await AgentRepository(db).find_by_id(agent_id))
         tool = cast(AgentTool, ToolRepository().find_by_id(tool_id))
@@ -421,7 +425,7 @@ async def _clone_agent_evaluator(agent: Agent, cloned_agent: Agent, db: AsyncSes
 async def download_agent_distribution(agent_id: int, user: Annotated[User, Depends(get_current_user)], db: Annotated[AsyncSession, Depends(get_db)]) -> StreamingResponse:
     agent = await find_agent_by_id(agent_id, user, db)
     _require_editor_for_protected(agent, user, "export this protected agent")
-    return build_file_download_response(await distribution.generate_agent_zip(agent, user.id,db))
+    return build_generated_file_download_response(await distribution.generate_agent_zip(agent, user.id,db))
 
 
 @router.put(f"{AGENT_PATH}/dist")
@@ -429,7 +433,8 @@ async def update_agent_from_distribution(agent_id: int, file: UploadFile, user:
         background_tasks: BackgroundTasks) -> AgentImportResult:
     agent = await find_editable_agent(agent_id, user, db)
     try:
-        return await distribution.update_agent_from_zip(agent, await file.read(), user, db, background_tasks)
+        # the zip is read from the spooled upload, avoiding loading the whole zip in memory besides its extracted files
+        return await distribution.update_agent_from_zip(agent, file.file, user, db, background_tasks)
     except BadZipFile:
         logger.error(f"Error updating agent {agent_id} from distribution", exc_info=True)
         raise HTTPException(
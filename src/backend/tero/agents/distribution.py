@@ -4,7 +4,7 @@ from io import BytesIO
 import logging
 import mimetypes
 import re
-from typing import Any, Dict, List, Optional, cast
+from typing import Any, BinaryIO, Dict, List, Optional, cast
 from urllib.parse import quote
 from zipfile import ZipFile, ZIP_DEFLATED
 
@@ -74,8 +74,8 @@ async def generate_agent_zip(agent: Agent, user_id: int, db: AsyncSession) -> Fi
         tool_file_repo = AgentToolConfigFileRepository(db)
         for tool in tools:
             for file in tool.files:
-                await tool_file_repo.find_with_content_by_ids(agent.id, tool.id, file.id)
-                zip_file.writestr(f"{agent_name}/{tool.id}/{file.name}", file.content)
+                file_with_content = cast(File, await tool_file_repo.find_with_content_by_ids(agent.id, tool.id, file.id))
+                zip_file.writestr(f"{agent_name}/{tool.id}/{file.name}", file_with_content.content)
     return File(id=0, name=f"{agent_name}.zip", content=zip_buffer.getvalue(), content_type="application/zip", user_id=user_id, status=FileStatus.PENDING)
 
 
@@ -175,7 +175,7 @@ async def _format_evaluator(evaluator: Optional[Evaluator], db: AsyncSession) ->
     }
 
 
-async def update_agent_from_zip(agent: Agent, zip_content: bytes, user: User, db: AsyncSession, background_tasks: BackgroundTasks) -> AgentImportResult:
+async def update_agent_from_zip(agent: Agent, zip_content: BinaryIO, user: User, db: AsyncSession, background_tasks: BackgroundTasks) -> AgentImportResult:
     with _open_zip_file(zip_content) as zip_file:
         try:
             found_root_folder = [ name.rsplit('/', 1)[0] for name in zip_file.namelist() if name.endswith('/agent.md') ]
@@ -204,18 +204,17 @@ async def update_agent_from_zip(agent: Agent, zip_content: bytes, user: User, db
             raise MissingRequiredConfigurationError() from e
 
 
-def _open_zip_file(zip_content: bytes) -> ZipFile:
-    zip_bytes = BytesIO(zip_content)
+def _open_zip_file(zip_content: BinaryIO) -> ZipFile:
     try:
         # we test with utf-8 encoding in case the file was zipped in mac since python zip encoding auto detection does not
         # work when zip contains files with special characters (like ñ) on their names
-        ret = ZipFile(zip_bytes, metadata_encoding='utf-8')
+        ret = ZipFile(zip_content, metadata_encoding='utf-8')
         ret.namelist()  # Test if metadata can be decoded
         return ret
     except (UnicodeDecodeError, Exception):
-        zip_bytes.seek(0)
+        zip_content.seek(0)
         # since some zip files might not use utf-8 encoding, we fallback to python zip encoding auto detection when utf-8 decoding fails
-        return ZipFile(zip_bytes)
+        return ZipFile(zip_content)
 
 
 async def _find_tools(parsed_tools: List[Dict[str, Any]]) -> tuple[Dict[str, AgentTool], List[str]]:
@@ -428,8 +427,8 @@ async def _remove_tool_file(file: File, tc: AgentToolConfig, db: AsyncSession):
 
 
 async def _update_tool_file(file: File, new_file: File, tc: AgentToolConfig, tool: AgentTool, user: User, db: AsyncSession, background_tasks: BackgroundTasks):
-    existing_file = cast(File, await AgentToolConfigFileRepository(db).find_with_content_by_ids(tc.agent_id, tc.tool_id, file.id))
-    if existing_file.content != new_file.content:
+    existing_file = cast(File, await AgentToolConfigFileRepository(db).find_by_ids(tc.agent_id, tc.tool_id, file.id))
+    if existing_file.content_hash != new_file.content_hash:
         await _remove_tool_file(existing_file, tc, db)
         await upload_tool_file(new_file, tool, tc.agent_id, user, db, background_tasks)
 
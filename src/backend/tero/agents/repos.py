@@ -1,7 +1,7 @@
 from datetime import datetime, timedelta, timezone
 from typing import Any, List, Optional, cast
 
-from sqlalchemy.orm import selectinload, defer
+from sqlalchemy.orm import selectinload, defer, joinedload
 from sqlalchemy.sql.elements import ColumnElement
 from sqlmodel import select, func, or_, and_, delete, col, update
 from sqlmodel.ext.asyncio.session import AsyncSession
@@ -11,6 +11,7 @@ from ..core.env import env
 from ..core.repos import attr, scalar
 from ..files.domain import File
 from ..teams.domain import GLOBAL_TEAM_ID, TeamRoleStatus
+from ..threads.core import agent_graph_cache
 from ..threads.domain import Thread, ThreadMessage
 from ..usage.domain import Usage
 from ..users.domain import User
@@ -163,6 +164,7 @@ class AgentRepository:
         self._db.add(agent)
         await self._db.commit()
         await self._db.refresh(agent)
+        agent_graph_cache.invalidate_agent(agent.id)
         return agent
     
     async def remove_team_agents(self, team_id: int):
@@ -191,6 +193,7 @@ class AgentToolConfigRepository:
     async def add(self, agent_tool_config: AgentToolConfig):
         await self._db.merge(agent_tool_config)
         await self._db.commit()
+        agent_graph_cache.invalidate_agent(agent_tool_config.agent_id)
 
     async def delete(self, agent_id: int, tool_id: str):
         stmt = (
@@ -199,6 +202,7 @@ class AgentToolConfigRepository:
         )
         await self._db.exec(scalar(stmt))
         await self._db.commit()
+        agent_graph_cache.invalidate_agent(agent_id)
 
     async def delete_drafts(self, agent_id: int):
         stmt = (
@@ -223,6 +227,8 @@ class AgentToolConfigRepository:
     async def add_many(self, configs: List[AgentToolConfig]) -> None:
         self._db.add_all(configs)
         await self._db.commit()
+        for agent_id in {c.agent_id for c in configs}:
+            agent_graph_cache.invalidate_agent(agent_id)
 
 
 class AgentToolConfigFileRepository:
@@ -239,14 +245,12 @@ class AgentToolConfigFileRepository:
             select(File)
             .join(AgentToolConfigFile, and_(AgentToolConfigFile.file_id == File.id))
             .where(and_(AgentToolConfigFile.agent_id == agent_id, AgentToolConfigFile.tool_id == tool_id))
-            .order_by(col(File.id).asc())
-            .options(defer(attr(File.content))))
+            .order_by(col(File.id).asc()))
         ret = await self._db.exec(stmt)
         return list(ret.all())
 
     async def find_by_ids(self, agent_id: int, tool_id: str, file_id: int) -> Optional[File]:
-        stmt = (self._select_by_ids(agent_id, tool_id, file_id)
-                .options(defer(attr(File.content))))
+        stmt = self._select_by_ids(agent_id, tool_id, file_id)
         ret = await self._db.exec(stmt)
         return ret.one_or_none()
 
@@ -259,8 +263,15 @@ class AgentToolConfigFileRepository:
                 AgentToolConfigFile.tool_id == tool_id,
                    File.id == file_id)))
 
+    async def find_metadata_by_ids(self, agent_id: int, tool_id: str, file_id: int) -> Optional[File]:
+        stmt = (self._select_by_ids(agent_id, tool_id, file_id)
+                .options(defer(attr(File.processed_content))))
+        ret = await self._db.exec(stmt)
+        return ret.one_or_none()
+
     async def find_with_content_by_ids(self, agent_id: int, tool_id: str, file_id: int) -> Optional[File]:
-        stmt = self._select_by_ids(agent_id, tool_id, file_id)
+        stmt = (self._select_by_ids(agent_id, tool_id, file_id)
+                .options(joinedload(attr(File.blob))))
         ret = await self._db.exec(stmt)
         return ret.one_or_none()
 
@@ -280,18 +291,3 @@ class AgentToolConfigFileRepository:
         )
         await self._db.exec(scalar(stmt))
         await self._db.commit()
-
-    async def find_with_content_by_agent_and_tool(self, agent_id: int, tool_id: str) -> List[File]:
-        stmt = (
-            select(File)
-            .join(AgentToolConfigFile, and_(AgentToolConfigFile.file_id == File.id))
-            .where(
-                and_(
-                    AgentToolConfigFile.agent_id == agent_id,
-                    AgentToolConfigFile.tool_id == tool_id
-                )
-            )
-            .order_by(col(File.id).asc())
-        )
-        ret = await self._db.exec(stmt)
-        return list(ret.all())
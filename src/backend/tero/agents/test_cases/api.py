@@ -6,11 +6,10 @@ import re
 from typing import Annotated, List, Optional, cast
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import StreamingResponse
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sse_starlette.event import ServerSentEvent
 
-from ...core.api import with_heartbeat
+from ...core.api import with_heartbeat, EventStreamResponse
 from ...core.auth import get_current_user
 from ...core.repos import get_db
 from ...users.domain import User
@@ -244,7 +243,7 @@ async def stream_test_suite_updates(
     suite_run_id: int,
     user: Annotated[User, Depends(get_current_user)],
     db: Annotated[AsyncSession, Depends(get_db)]
-) -> StreamingResponse:
+) -> EventStreamResponse:
     await _find_test_suite_run(suite_run_id, agent_id, user, db)
 
     async def event_generator():
@@ -275,10 +274,7 @@ async def stream_test_suite_updates(
             logger.exception(f"Error streaming events for suite {suite_run_id}")
             stop_event.set()
 
-    return StreamingResponse(
-        with_heartbeat(event_generator()),
-        media_type="text/event-stream"
-    )
+    return EventStreamResponse(with_heartbeat(event_generator()))
 
 
 TEST_SUITE_RUN_RESULTS_PATH = f"{TEST_SUITE_RUN_PATH}/results"
@@ -31,7 +31,7 @@ async def upload_tool_file(file: File, tool: AgentTool, agent_id: int, user: Use
 
 async def _add_tool_file(file_id: int, user_id: int, tool_id: str, agent_id: int, tool_config: dict):
     async with AsyncSession(repos_module.engine, expire_on_commit=False) as db:
-        f = cast(File, await FileRepository(db).find_by_id(file_id))
+        f = cast(File, await FileRepository(db).find_with_content_by_id(file_id))
         user = cast(User, await UserRepository(db).find_by_id(user_id))
         agent = cast(Agent, await AgentRepository(db).find_by_id(agent_id))
         tool = cast(AgentTool, ToolRepository().find_by_id(tool_id))
@@ -1,9 +1,10 @@
+import asyncio
+from contextlib import asynccontextmanager
 import logging
 import os
 
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
@@ -12,13 +13,16 @@ from .agents.evaluators.api import router as evaluators_router
 from .agents.prompts.api import router as agents_prompts_router
 from .agents.test_cases.api import router as test_cases_router
 from .ai_models.api import router as ai_models_router
-from .core.api import BASE_PATH
+from .core.api import BASE_PATH, RangeAwareGZipMiddleware, UploadSizeLimitMiddleware
+from .core.auth import close_openid_config, get_auth_cache_stats
 from .core.domain import CamelCaseModel
 from .core.env import env
 from .external_agents.api import router as external_agents_router
+from .files.processors.pdf import close_pdf_process_pool
 from .mcp_server import setup_mcp_server
 from .teams.api import router as teams_router
-from .threads.api import router as threads_router
+from .threads.engine import get_prompt_overhead_stats
+from .threads.api import router as threads_router, minutes_saved_estimations
 from .tools.api import router as tools_router
 from .usage.api import router as usage_router
 from .users.api import router as users_router
@@ -35,12 +39,39 @@ def _setup_logging():
     access_logger.addFilter(HealthCheckFilter())
 
 
+async def _log_cache_stats():
+    while True:
+        await asyncio.sleep(env.cache_stats_log_period_minutes * 60)
+        auth_stats = get_auth_cache_stats()
+        if auth_stats:
+            logger.info(f"Auth cache stats: {auth_stats}")
+        logger.info(f"Prompt overhead tokens cache stats: {get_prompt_overhead_stats()}")
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    stats_logging = asyncio.create_task(_log_cache_stats()) if env.cache_stats_log_period_minutes > 0 else None
+    sweep_period = env.minutes_saved_estimation_sweep_period_minutes * 60
+    estimations_sweep = asyncio.create_task(minutes_saved_estimations.sweep_periodically(sweep_period)) if sweep_period > 0 else None
+    try:
+        yield
+    finally:
+        if stats_logging:
+            stats_logging.cancel()
+        if estimations_sweep:
+            estimations_sweep.cancel()
+        await close_openid_config()
+        # waits for running extractions to finish without blocking the event loop
+        await asyncio.to_thread(close_pdf_process_pool)
+
+
 logger = logging.getLogger(__name__)
 _setup_logging()
-app = FastAPI()
+app = FastAPI(lifespan=_lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"],
                    allow_headers=["*"], expose_headers=["Content-Disposition", "Content-Type", "Location"])
-app.add_middleware(GZipMiddleware)
+app.add_middleware(RangeAwareGZipMiddleware)
+app.add_middleware(UploadSizeLimitMiddleware, max_size=env.upload_max_size_mb * 1024 * 1024)
 if env.frontend_path:
     app.mount("/assets", StaticFiles(directory=os.path.join(env.frontend_path, "assets")), name="assets")
 setup_mcp_server(app)
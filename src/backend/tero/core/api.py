@@ -1,12 +1,22 @@
 
 import asyncio
-from typing import AsyncIterator
+from collections.abc import Callable
+import logging
+from typing import AsyncIterator, Optional, TypeVar
 
+from fastapi import HTTPException, status
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from sse_starlette.event import ServerSentEvent
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 
 BASE_PATH = "/api"
 MCP_PATH = "/mcp"
+logger = logging.getLogger(__name__)
+T = TypeVar('T')
+_UPLOAD_TOO_LARGE = "Upload too large"
 
 
 import contextlib
@@ -38,6 +48,106 @@ async def with_heartbeat(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
                 break
 
 
+class EventStreamResponse(StreamingResponse):
+    """
+    Streams server sent events to clients as soon as they are generated.
+
+    GZipMiddleware already skips text/event-stream responses, so each frame is sent uncompressed without being buffered,
+    and the headers avoid proxies (like nginx) buffering the response.
+    """
+    def __init__(self, content: AsyncIterator[bytes]):
+        super().__init__(content, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+class RangeAwareGZipMiddleware(GZipMiddleware):
+    """
+    Compresses responses like GZipMiddleware, except for requests of byte ranges, since compressing partial contents
+    would break the ranges requested by clients.
+    """
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and "range" in Headers(scope=scope):
+            await self.app(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects uploads (multipart requests) bigger than a max size while receiving them, before the whole body is spooled by the
+    multipart parser.
+    """
+    def __init__(self, app: ASGIApp, max_size: int):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        headers = Headers(scope=scope) if scope["type"] == "http" else None
+        if not headers or not headers.get("content-type", "").startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+        content_length = headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.max_size:
+            await JSONResponse({"detail": _UPLOAD_TOO_LARGE}, status_code=status.HTTP_413_CONTENT_TOO_LARGE)(scope, receive, send)
+            return
+
+        received = 0
+
+        # chunked requests have no content length, so received bytes are counted too
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=_UPLOAD_TOO_LARGE)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def coalesce(stream: AsyncIterator[T], can_merge: Callable[[T], bool], merge: Callable[[T, T], T], window_seconds: float) -> AsyncIterator[T]:
+    """
+    Merges consecutive mergeable items (eg: chunks of text) generated within a time window, reducing the number of frames
+    sent to clients. The first item after a quiet period, and items which can't be merged, are never delayed.
+    """
+    async with BackgroundIterator(stream) as iterator:
+        loop = asyncio.get_event_loop()
+        pending: Optional[T] = None
+        last_sent = -window_seconds
+
+        while True:
+            try:
+                item = await iterator.next(timeout=max(0, last_sent + window_seconds - loop.time()) if pending is not None else None)
+            except asyncio.TimeoutError:
+                yield pending # type: ignore
+                pending = None
+                last_sent = loop.time()
+                continue
+            except StopAsyncIteration:
+                break
+            except Exception:
+                if pending is not None:
+                    yield pending
+                raise
+
+            if not can_merge(item):
+                if pending is not None:
+                    yield pending
+                    pending = None
+                yield item
+                last_sent = loop.time()
+            elif pending is not None:
+                pending = merge(pending, item)
+            elif loop.time() - last_sent >= window_seconds:
+                yield item
+                last_sent = loop.time()
+            else:
+                pending = item
+
+        if pending is not None:
+            yield pending
+
+
 class BackgroundIterator:
     """
     Iterates over an async stream in a background task and buffers items in a queue.
@@ -66,7 +176,7 @@ class BackgroundIterator:
             with contextlib.suppress(asyncio.CancelledError):
                 await self._task
 
-    async def next(self, timeout: float) -> Any:
+    async def next(self, timeout: Optional[float]) -> Any:
         item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
         if item is self._STOP:
             raise StopAsyncIteration
@@ -83,3 +193,86 @@ class BackgroundIterator:
         except Exception as e:
             await self._queue.put(e)
 
+
+
+class ReplayableStream:
+    """
+    Iterates over an async stream of server sent events in a background task, numbering them and keeping the last ones.
+    This allows clients to attach to the stream at any point, and to reattach after losing the connection (sending the
+    Last-Event-ID header) getting the events they missed, even after the stream ended.
+    """
+    def __init__(self, stream: AsyncIterator[bytes], max_events: int):
+        self._stream = stream
+        self._max_events = max_events
+        self._events: dict[int, bytes] = {}
+        self._last_event_id = 0
+        self._new_events = asyncio.Event()
+        self._error: Optional[Exception] = None
+        self.task = asyncio.create_task(self._producer())
+
+    def can_resume(self, last_event_id: int) -> bool:
+        return last_event_id >= self._last_event_id or last_event_id + 1 in self._events
+
+    async def iterate(self, last_event_id: int = 0) -> AsyncIterator[bytes]:
+        event_id = last_event_id + 1
+        while True:
+            new_events = self._new_events
+            while event_id <= self._last_event_id:
+                event = self._events.get(event_id)
+                if event is None:
+                    raise RuntimeError(f"Event {event_id} is no longer available for replay")
+                yield event
+                event_id += 1
+            if self.task.done():
+                if self._error:
+                    raise self._error
+                return
+            await new_events.wait()
+
+    async def _producer(self):
+        try:
+            async for item in self._stream:
+                self._last_event_id += 1
+                self._events[self._last_event_id] = _add_event_id(item, self._last_event_id)
+                self._events.pop(self._last_event_id - self._max_events, None)
+                self._notify_new_events()
+        except Exception as e:
+            logger.exception("Problem generating replayable stream")
+            self._error = e
+        finally:
+            self._notify_new_events()
+
+    def _notify_new_events(self):
+        self._new_events.set()
+        self._new_events = asyncio.Event()
+
+
+def _add_event_id(event: bytes, event_id: int) -> bytes:
+    separator = b"\r\n"
+    return event[:-len(separator)] + f"id: {event_id}".encode() + separator * 2
+
+
+class ReplayableStreams:
+    """
+    Keeps replayable streams by key while they run, and for some time after they end, so clients can reattach to them.
+    """
+    def __init__(self, max_events: int, retention_seconds: int):
+        self._max_events = max_events
+        self._retention_seconds = retention_seconds
+        self._streams: dict[Any, ReplayableStream] = {}
+
+    def start(self, key: Any, stream: AsyncIterator[bytes]) -> ReplayableStream:
+        ret = ReplayableStream(stream, self._max_events)
+        self._streams[key] = ret
+        ret.task.add_done_callback(lambda _: asyncio.get_running_loop().call_later(self._retention_seconds, self._remove, key, ret))
+        return ret
+
+    def find(self, key: Any) -> Optional[ReplayableStream]:
+        return self._streams.get(key)
+
+    async def join(self):
+        await asyncio.gather(*[s.task for s in self._streams.values()], return_exceptions=True)
+
+    def _remove(self, key: Any, stream: ReplayableStream):
+        if self._streams.get(key) is stream:
+            del self._streams[key]
@@ -1,8 +1,14 @@
+import asyncio
+from collections import OrderedDict
+import contextlib
+from dataclasses import dataclass
 import datetime
+import hashlib
 import json
 import logging
+import time
 import traceback
-from typing import Optional, Annotated, Any, AsyncGenerator
+from typing import Optional, Annotated, Any
 
 import aiohttp
 from fastapi import Depends, HTTPException, status
@@ -15,7 +21,7 @@ from starlette.requests import Request
 from .env import env
 from .repos import get_db
 from ..users.domain import User
-from ..users.repos import UserRepository
+from ..users.repos import UserRepository, user_cache
 
 
 class BearerOpenIdConnect(OpenIdConnect):
@@ -44,49 +50,149 @@ else:
     auth_scheme = lambda: None
 
 
+@dataclass
+class AuthCacheStats:
+    token_hits: int = 0
+    token_misses: int = 0
+    key_refreshes: int = 0
+
+
 class OpenIdConfig:
 
-    def __init__(self, url: str, http_cli: aiohttp.ClientSession):
+    def __init__(self, url: str, rotation_period: datetime.timedelta):
         self.url = url
-        self._http_cli = http_cli
+        self.stats = AuthCacheStats()
+        self._rotation_period = rotation_period
+        self._http_cli: Optional[aiohttp.ClientSession] = None
         self._last_update = None
         self._keys = None
+        self._lock = asyncio.Lock()
+        self._rotation_task: Optional[asyncio.Task] = None
 
     async def get_updated_keys(self, period: datetime.timedelta) -> Any:
-        if self._last_update is None or datetime.datetime.now(datetime.UTC) - self._last_update > period:
-            await self._update_keys()
+        if self._is_outdated(period):
+            async with self._lock:
+                # another request may have refreshed the keys while we were waiting for the lock
+                if self._is_outdated(period):
+                    await self._update_keys()
+        self._start_rotation()
         return self._keys
 
+    def _is_outdated(self, period: datetime.timedelta) -> bool:
+        return self._last_update is None or datetime.datetime.now(datetime.UTC) - self._last_update > period
+
     async def _update_keys(self):
-        async with self._http_cli.get(self.url) as config_resp:
+        http_cli = self._get_http_cli()
+        async with http_cli.get(self.url) as config_resp:
             config_resp.raise_for_status()
             jwks_uri = (await config_resp.json())['jwks_uri']
-        async with self._http_cli.get(jwks_uri) as ret_resp:
+        async with http_cli.get(jwks_uri) as ret_resp:
             ret_resp.raise_for_status()
             self._keys = await ret_resp.json()
         self._last_update = datetime.datetime.now(datetime.UTC)
+        self.stats.key_refreshes += 1
+        logger.info("OpenID keys refreshed (%s)", self.stats)
+
+    def _get_http_cli(self) -> aiohttp.ClientSession:
+        if self._http_cli is None or self._http_cli.closed:
+            self._http_cli = aiohttp.ClientSession()
+        return self._http_cli
+
+    def _start_rotation(self):
+        if self._rotation_task is None or self._rotation_task.done():
+            self._rotation_task = asyncio.create_task(self._rotate_keys())
+
+    async def _rotate_keys(self):
+        # refresh keys in background so requests don't have to wait for the identity provider when keys are rolled
+        while True:
+            await asyncio.sleep(self._rotation_period.total_seconds())
+            try:
+                async with self._lock:
+                    await self._update_keys()
+            except Exception:
+                logger.warning("Problem refreshing OpenID keys", exc_info=True)
+
+    async def close(self):
+        if self._rotation_task:
+            self._rotation_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._rotation_task
+            self._rotation_task = None
+        if self._http_cli:
+            await self._http_cli.close()
+            self._http_cli = None
+
+
+class VerifiedTokenCache:
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._build_key(token)
+        claims = self._entries.get(key)
+        if claims is None:
+            return None
+        if claims["exp"] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return claims
+
+    def put(self, token: str, claims: dict):
+        # tokens without expiration are not cached since we would have no way to know when to stop trusting them
+        if not isinstance(claims.get("exp"), (int, float)) or self._max_size <= 0:
+            return
+        key = self._build_key(token)
+        self._entries[key] = claims
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def _build_key(self, token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+
+# openid keys rolled according to recommendation from
+# https://learn.microsoft.com/en-us/entra/identity-platform/signing-key-rollover
+_KEYS_ROTATION_PERIOD = datetime.timedelta(days=1)
+_KEYS_RETRY_PERIOD = datetime.timedelta(minutes=5)
+_openid_config = OpenIdConfig(config_url, _KEYS_ROTATION_PERIOD) if config_url else None
+_verified_tokens = VerifiedTokenCache(env.auth_token_cache_max_size)
+
+
+def _get_openid_config() -> Optional[OpenIdConfig]:
+    return _openid_config
+
+
+def get_auth_cache_stats() -> Optional[AuthCacheStats]:
+    return _openid_config.stats if _openid_config else None
+
+
+async def close_openid_config():
+    if _openid_config:
+        await _openid_config.close()
+
+
+async def _decode_token(token: str, openid_config: OpenIdConfig) -> dict:
+    ret = _verified_tokens.get(token)
+    if ret is not None:
+        openid_config.stats.token_hits += 1
+        return ret
+    openid_config.stats.token_misses += 1
+    ret = await _verify_token(token, openid_config)
+    _verified_tokens.put(token, ret)
+    return ret
 
 
-async def get_http_cli() -> AsyncGenerator[aiohttp.ClientSession, None]:
-    async with aiohttp.ClientSession() as cli:
-        yield cli
-
-
-def _get_openid_config(http_cli: Annotated[aiohttp.ClientSession, Depends(get_http_cli)]) -> Optional[OpenIdConfig]:
-    if not config_url:
-        return None
-    return OpenIdConfig(config_url, http_cli)
-
-
-async def _decode_token(token: str, openid_config: Annotated[OpenIdConfig, Depends(_get_openid_config)]) -> dict:
-    # openid keys rolled according to recommendation from
-    # https://learn.microsoft.com/en-us/entra/identity-platform/signing-key-rollover
-    openid_keys = await openid_config.get_updated_keys(datetime.timedelta(days=1))
+async def _verify_token(token: str, openid_config: OpenIdConfig) -> dict:
+    openid_keys = await openid_config.get_updated_keys(_KEYS_ROTATION_PERIOD)
     options = {"verify_aud": False}
     try:
         return jwt.decode(token, openid_keys, options=options)
     except JWTError as e:
-        new_keys = await openid_config.get_updated_keys(datetime.timedelta(minutes=5))
+        new_keys = await openid_config.get_updated_keys(_KEYS_RETRY_PERIOD)
         if new_keys == openid_keys:
             raise e
         return jwt.decode(token, new_keys, options=options)
@@ -110,6 +216,9 @@ async def get_current_user(token: Annotated[Optional[str], Depends(auth_scheme)]
             raise _build_auth_exception()
         if env.allowed_users and username not in env.allowed_users:
             raise _build_auth_exception()
+        cached = user_cache.get(username)
+        if cached and cached.is_active():
+            return cached
         user_repo = UserRepository(db)
         ret = await user_repo.find_by_username(username)
         if ret and not ret.is_active():
@@ -122,6 +231,7 @@ async def get_current_user(token: Annotated[Optional[str], Depends(auth_scheme)]
         elif not ret.name and name:
             ret.name = name
             ret = await user_repo.update_user(ret)
+        user_cache.put(ret)
         return ret
     except JWTError as e:
         traceback.print_exception(e)
@@ -27,6 +27,10 @@ class Settings(BaseSettings):
     openid_client_id : str
     openid_scope : str
     allowed_users : list[str] = []
+    auth_token_cache_max_size : int = 10000
+    cache_stats_log_period_minutes : int = 60
+    user_cache_ttl_seconds : int = 30
+    user_cache_max_size : int = 10000
     disable_publish_global : Optional[bool] = False
     contact_email : str
     azure_app_insights_connection : Optional[str] = None
@@ -37,15 +41,26 @@ class Settings(BaseSettings):
     azure_doc_intelligence_endpoint : Optional[str] = None
     azure_doc_intelligence_key : Optional[SecretStr] = None
     azure_doc_intelligence_cost_per_1k_pages_usd : Optional[float] = None
+    pdf_extraction_max_concurrency : int = 4
+    message_files_extraction_max_concurrency : int = 4
+    upload_max_size_mb : int = 100
     temperatures: dict[str, float]
     monthly_usd_limit_default : int
     internal_generator_model : str
     internal_generator_temperature : float
     internal_generator_reasoning_effort : str
     internal_evaluator_model : Optional[str] = None
+    minutes_saved_estimation_queue_max_size : int = 1000
+    minutes_saved_estimation_max_concurrency : int = 4
+    minutes_saved_estimation_max_retries : int = 5
+    minutes_saved_estimation_retry_delay_seconds : int = 5
+    minutes_saved_estimation_sweep_period_minutes : int = 5
     agent_default_model : Optional[str] = None
     agent_basic_models : List[str]
     agent_base_cost_model : Optional[str] = None
+    agent_graph_cache_max_size : int = 200
+    message_tokens_cache_max_size : int = 100000
+    tools_tokens_cache_max_size : int = 1000
     default_agent_name : str
     embedding_model : str
     embedding_context_limit : int = 8191
@@ -77,6 +92,15 @@ class Settings(BaseSettings):
     web_tool_google_cost_per_1k_searches_usd : float
     browser_tool_playwright_mcp_url : str
     browser_tool_playwright_output_dir : str
+    mcp_session_pool_max_size : int = 200
+    mcp_session_idle_ttl_seconds : int = 300
+    mcp_session_health_check_seconds : int = 60
+    tool_load_max_concurrency : int = 8
+    tool_load_timeout_seconds : int = 30
+    thread_stop_ack_timeout_seconds : int = 3
+    answer_stream_replay_max_events : int = 5000
+    answer_stream_retention_seconds : int = 300
+    answer_stream_coalesce_ms : int = 20
 
     def is_local_env(self) -> bool:
         found = re.search('@([^/]+)(?:\\d+)?/', self.db_url)
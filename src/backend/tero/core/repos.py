@@ -19,6 +19,13 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+def get_psycopg_db_url() -> str:
+    # SQLModel has no support for PostgreSQL LISTEN/NOTIFY, so psycopg is used directly in such cases.
+    # psycopg requires a plain PostgreSQL URL without SQLAlchemy's async driver prefixes.
+    url = engine.url.render_as_string(hide_password=False)
+    return url.replace("+psycopg", "").replace("+asyncpg", "")
+
+
 # this method allows to easily cast a query to SelectOfScalar to avoid type errors when using sqlmodel exec method
 # for example when using delete statements
 # this is related to https://github.com/fastapi/sqlmodel/issues/909
@@ -1,16 +1,103 @@
+import hashlib
 from io import BytesIO
-from typing import Optional
+import mmap
+import re
+from typing import AsyncIterator, Optional, Tuple
 from urllib.parse import quote
 
+from fastapi import HTTPException, Request, Response, UploadFile, status
 from fastapi.responses import StreamingResponse
-from fastapi import HTTPException, status
+from starlette.formparsers import MultiPartParser
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from .domain import File
+from ..core import repos as repos_module
+from .domain import File, FileBlob, FileContent
+from .repos import FileBlobRepository
 
 
-def build_file_download_response(f: Optional[File]) -> StreamingResponse:
+_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+_UPLOAD_CHUNK_SIZE = 1024 * 1024
+_RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+async def read_upload(f: UploadFile) -> FileBlob:
+    # uploads are already spooled (to disk when big) while received, so they are read in chunks hashing them on the fly
+    sha256 = hashlib.sha256()
+    while chunk := await f.read(_UPLOAD_CHUNK_SIZE):
+        sha256.update(chunk)
+    return FileBlob(hash=sha256.hexdigest(), content=await _view_upload(f))
+
+
+async def _view_upload(f: UploadFile) -> FileContent:
+    # uploads spooled to disk are mapped instead of read, so their contents are not copied in memory. Mapped contents outlive uploads
+    if f.size is not None and f.size > MultiPartParser.spool_max_size:
+        return memoryview(mmap.mmap(f.file.fileno(), 0, access=mmap.ACCESS_READ))
+    await f.seek(0)
+    return await f.read()
+
+
+async def build_file_download_response(f: Optional[File], request: Request, db: AsyncSession) -> Response:
     if not f:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    # contents never change for a given hash, so it can be used as a strong ETag
+    etag = f'"{f.content_hash}"'
+    headers = {"Content-Disposition": _build_content_disposition(f), "ETag": etag, "Accept-Ranges": "bytes"}
+    if_none_match = _parse_etags(request.headers.get("if-none-match"))
+    if etag in if_none_match or "*" in if_none_match:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    size = await FileBlobRepository(db).find_size(f.content_hash)
+    if size is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    # ranges are ignored when they refer to other contents than the current ones
+    if_range = request.headers.get("if-range")
+    byte_range = _parse_range(request.headers.get("range"), size) if if_range is None or if_range == etag else None
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(_stream_content(f.content_hash, start, end), media_type=f.content_type, headers=headers,
+                             status_code=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK)
+
+
+def _build_content_disposition(f: File) -> str:
     # quote filename to properly handle non-ASCII characters
-    return StreamingResponse(BytesIO(f.content), media_type=f.content_type,
-                             headers={"Content-Disposition": f'attachment; filename="{quote(f.name)}"'})
+    return f'attachment; filename="{quote(f.name)}"'
+
+
+def _parse_etags(header: Optional[str]) -> list[str]:
+    return [etag.strip().removeprefix("W/") for etag in header.split(",")] if header else []
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    # only single ranges are supported, other (or invalid) ranges are ignored sending the whole content, as allowed by RFC 9110
+    match = _RANGE_PATTERN.fullmatch(header.strip()) if header else None
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    if start >= size or start > end:
+        raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+async def _stream_content(content_hash: str, start: int, end: int) -> AsyncIterator[bytes]:
+    offset = start
+    while offset <= end:
+        # a session per chunk avoids holding a db connection while slow clients download the file
+        length = min(_DOWNLOAD_CHUNK_SIZE, end - offset + 1)
+        async with AsyncSession(repos_module.engine) as db:
+            chunk = await FileBlobRepository(db).find_chunk(content_hash, offset, length)
+        # headers (with the content length) are already sent, so the response is aborted to avoid clients taking it as complete
+        if not chunk or len(chunk) < length:
+            raise RuntimeError(f"File content {content_hash} ended at byte {offset + len(chunk or b'')} while expecting {end + 1} bytes")
+        yield chunk
+        offset += len(chunk)
+
+
+def build_generated_file_download_response(f: File) -> StreamingResponse:
+    return StreamingResponse(BytesIO(f.content), media_type=f.content_type, headers={"Content-Disposition": _build_content_disposition(f)})
@@ -1,19 +1,39 @@
 import abc
-from typing import Optional
+import codecs
+from functools import cache
+import threading
+from typing import Any, Iterable, Iterator, Optional, cast
 
 import chardet
-from langchain_core.messages import HumanMessage
+from chardet.universaldetector import UniversalDetector
 
 from ..ai_models import ai_factory
 from ..agents.domain import Agent
 from ..usage.domain import Usage
-from .domain import File
+from .domain import File, FileContent
+
+
+_ENCODING_SAMPLE_WINDOWS = 3
+_ENCODING_SAMPLE_WINDOW_SIZE = 64 * 1024
 
 
 class CurrentQuota:
     def __init__(self, current_usage: float, user_quota: float):
         self.current_usage = current_usage
         self.user_quota = user_quota
+        self._lock = threading.Lock()
+
+    # files may be processed concurrently (in different threads) sharing the quota, so usage is checked and reserved atomically
+    def reserve(self, usd_cost: float) -> bool:
+        with self._lock:
+            if self.current_usage > self.user_quota:
+                return False
+            self.current_usage += usd_cost
+            return True
+
+    def release(self, usd_cost: float):
+        with self._lock:
+            self.current_usage -= usd_cost
 
 
 class FileQuota:
@@ -21,25 +41,69 @@ class FileQuota:
     def __init__(self, pdf_parsing_usage: Usage, agent: Optional[Agent], current_quota: CurrentQuota):
         self.pdf_parsing_usage = pdf_parsing_usage
         self.current_quota = current_quota
-        self.model = ai_factory.build_streaming_chat_model(agent.model_id, agent.model_temperature, agent.model_reasoning_effort) if agent else None
         self.available_tokens = agent.model.token_limit - agent.model.output_token_limit if agent else None
-
-    def has_reached_token_limit(self, text: str) -> bool:
-        if not self.model or not self.available_tokens:
+        self.used_tokens = 0
+        self.reached_token_limit = False
+        self._model_id = agent.model_id if agent else None
+
+    def take_text(self, parts: Iterable[str]) -> str:
+        # parts are consumed lazily, so processors can avoid extracting (and paying for) parts that don't fit in the token limit
+        ret = []
+        for part in parts:
+            ret.append(self.take_tokens(part))
+            if self.reached_token_limit:
+                break
+        return "".join(ret)
+
+    def take_tokens(self, text: str) -> str:
+        if self.available_tokens is None or not text:
+            return text
+        if self.reached_token_limit:
+            return ""
+        remaining_tokens = self.available_tokens - self.used_tokens
+        # only new text is counted, avoiding counting all the accumulated text again for every part
+        tokens = self._count_tokens(text)
+        if tokens <= remaining_tokens:
+            self.used_tokens += tokens
+            return text
+        self.reached_token_limit = True
+        ret = self._find_fitting_prefix(text, remaining_tokens)
+        self.used_tokens += self._count_tokens(ret)
+        return ret
+
+    def _find_fitting_prefix(self, text: str, max_tokens: int) -> str:
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._count_tokens(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
+
+    def _count_tokens(self, text: str) -> int:
+        return _build_token_counting_model(cast(str, self._model_id)).get_num_tokens(text)
+
+    def reserve_usage(self, quantity: int, cost_per_1k_units: float) -> bool:
+        if not self.current_quota.reserve(quantity / 1000 * cost_per_1k_units):
             return False
+        self.pdf_parsing_usage.increment(new_quantity=quantity, cost_per_1k_units=cost_per_1k_units)
+        return True
 
-        current_tokens = self.model.get_num_tokens_from_messages(messages=[HumanMessage(content=text)])
-        return current_tokens >= self.available_tokens
+    def release_usage(self, quantity: int, cost_per_1k_units: float):
+        self.current_quota.release(quantity / 1000 * cost_per_1k_units)
+        self.pdf_parsing_usage.increment(new_quantity=-quantity, cost_per_1k_units=cost_per_1k_units)
 
-    def has_reached_quota_limit(self) -> bool:
-        return self.current_quota.current_usage + self.pdf_parsing_usage.usd_cost > self.current_quota.user_quota
 
+# models are only used to count tokens, so they are built once and shared by all files
+@cache
+def _build_token_counting_model(model_id: str) -> Any:
+    return ai_factory.build_chat_model(model_id)
 
-class BaseFileProcessor(abc.ABC):
 
-    @abc.abstractmethod
-    def supports(self, file: File) -> bool:
-        pass
+class BaseFileProcessor(abc.ABC):
+    file_extensions: set[str]
+    content_types: set[str] = set()
 
     @abc.abstractmethod
     def extract_text(self, file: File, file_quota: FileQuota) -> str:
@@ -50,10 +114,51 @@ class QuotaExceededError(Exception):
     pass
 
 
-def add_encoding_to_content_type(content_type: Optional[str], content: bytes) -> str:
+def add_encoding_to_content_type(content_type: Optional[str], content: FileContent) -> str:
     # add the encoding to the content type so later on it can be used (for exammple in tools file processing) and is avaible to frontend for proper file visualization
     if content_type and content_type.startswith('text/') and not 'charset=' in content_type:
-        detected = chardet.detect(content)
-        encoding = detected['encoding'] if detected and detected['encoding'] else 'utf-8'
+        encoding = _detect_encoding(content) or 'utf-8'
         content_type = f"{content_type}; charset={encoding.lower()}"
     return content_type or "application/octet-stream"
+
+
+def _detect_encoding(content: FileContent) -> Optional[str]:
+    if len(content) <= _ENCODING_SAMPLE_WINDOWS * _ENCODING_SAMPLE_WINDOW_SIZE:
+        # chardet only accepts bytes, and contents might be other bytes-like objects
+        return chardet.detect(bytes(content))['encoding']
+    # chardet is too slow for big contents. These are usually utf-8 (or ascii), which can be quickly validated, and otherwise only
+    # some windows of the content are analyzed
+    utf8_encoding = _detect_utf8(content)
+    if utf8_encoding:
+        return utf8_encoding
+    detector = UniversalDetector()
+    for window in _sample_windows(content):
+        detector.feed(window)
+        if detector.done:
+            break
+    return detector.close()['encoding']
+
+
+def _detect_utf8(content: FileContent) -> Optional[str]:
+    # content is decoded in chunks to avoid allocating a string for the whole content
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    view = memoryview(content)
+    is_ascii = True
+    try:
+        for start in range(0, len(view), _ENCODING_SAMPLE_WINDOW_SIZE):
+            is_ascii = decoder.decode(view[start:start + _ENCODING_SAMPLE_WINDOW_SIZE]).isascii() and is_ascii
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return None
+    return 'utf-8-sig' if view[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 'ascii' if is_ascii else 'utf-8'
+
+
+def _sample_windows(content: FileContent) -> Iterator[bytes]:
+    last_start = len(content) - _ENCODING_SAMPLE_WINDOW_SIZE
+    for i in range(_ENCODING_SAMPLE_WINDOWS):
+        start = last_start * i // (_ENCODING_SAMPLE_WINDOWS - 1)
+        # windows start in a new line to avoid splitting multi byte characters
+        if start > 0:
+            new_line = bytes(content[start:start + _ENCODING_SAMPLE_WINDOW_SIZE]).find(b"\n")
+            start = start + new_line + 1 if new_line >= 0 else start
+        yield bytes(content[start:start + _ENCODING_SAMPLE_WINDOW_SIZE])
@@ -1,8 +1,11 @@
 from datetime import datetime, timezone
 from enum import Enum
-from typing import Optional
+import hashlib
+from typing import Any, Optional, cast
 
-from sqlmodel import Field
+from pydantic import ConfigDict
+from sqlalchemy import LargeBinary
+from sqlmodel import Field, Relationship
 
 from ..core.domain import CamelCaseModel
 
@@ -27,23 +30,65 @@ class FileUpdate(CamelCaseModel):
     user_id: Optional[int] = None
 
 
+# contents of big uploads are memoryviews over the uploaded files (to avoid copying them in memory)
+FileContent = bytes | memoryview
+
+
+# file contents are stored once per SHA-256 hash, and shared by all files (of any user) with same contents
+class FileBlob(CamelCaseModel, table=True):
+    model_config = ConfigDict(arbitrary_types_allowed=True) # type: ignore # sqlmodel defines model_config as SQLModelConfig
+    __tablename__: Any = "file_blob"
+    hash: str = Field(primary_key=True, max_length=64)
+    content: FileContent = Field(sa_type=LargeBinary)
+
+    @staticmethod
+    def from_content(content: FileContent) -> 'FileBlob':
+        return FileBlob(hash=hashlib.sha256(content).hexdigest(), content=content)
+
+
+# text extracted from file contents, to avoid parsing (and paying for parsing) again same contents with same processor.
+# There is no foreign key to blobs since contents are processed before storing files (and their blobs).
+class FileProcessedContent(CamelCaseModel, table=True):
+    __tablename__: Any = "file_processed_content"
+    content_hash: str = Field(primary_key=True, max_length=64)
+    file_processor: FileProcessor = Field(primary_key=True)
+    processed_content: str
+
+
 class File(CamelCaseModel, table=True):
     id: int = Field(primary_key=True, default=None)
     name: str = Field(max_length=200)
     content_type: str = Field(max_length=100)
     user_id: int = Field(foreign_key="user.id")
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
-    content: bytes
+    content_hash: str = Field(foreign_key="file_blob.hash", index=True, max_length=64)
+    # blobs are view only since they are shared and FileRepository takes care of storing them (if not already stored).
+    # They are only loaded when explicitly requested, since contents may be quite big
+    blob: Optional[FileBlob] = Relationship(sa_relationship_kwargs={"viewonly": True})
     status: FileStatus = Field(default=FileStatus.PENDING, index=True)
     processed_content: Optional[str] = Field(default=None)
     file_processor: FileProcessor = Field(default=FileProcessor.BASIC)
 
+    def __init__(self, content: Optional[FileContent] = None, **data: Any):
+        super().__init__(**data)
+        if content is not None:
+            self.content = content
+
+    @property
+    def content(self) -> FileContent:
+        return cast(FileBlob, self.blob).content
+
+    @content.setter
+    def content(self, content: FileContent):
+        self.blob = FileBlob.from_content(content)
+        self.content_hash = self.blob.hash
+
     def clone(self, user_id: int) -> 'File':
         return File(
             name=self.name,
             content_type=self.content_type,
             user_id=user_id,
-            content=self.content,
+            content_hash=self.content_hash,
             status=self.status,
             processed_content=self.processed_content,
             file_processor=self.file_processor
@@ -51,7 +96,10 @@ class File(CamelCaseModel, table=True):
     
     def update_with(self, update: FileUpdate):
         update_dict = update.model_dump(exclude_none=True)
+        content = update_dict.pop("content", None)
         self.sqlmodel_update(update_dict)
+        if content is not None:
+            self.content = content
         self.timestamp = datetime.now(timezone.utc)
 
 
@@ -1,13 +1,17 @@
 import asyncio
+from functools import cache
 import logging
+import os
+
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from ..files.domain import File, FileProcessor
 from .core import BaseFileProcessor, FileQuota
-from .domain import File, FileProcessor
+from .domain import File, FileProcessor, FileProcessedContent
 from .processors.plaintext import PlainTextFileProcessor
 from .processors.spreadsheet import XlsxFileProcessor, XlsFileProcessor
 from .processors.image import ImageFileProcessor
 from .processors.pdf import build_basic_pdf_processor, build_enhanced_pdf_processor
+from .repos import FileProcessedContentRepository
 
 
 logger = logging.getLogger(__name__)
@@ -18,20 +22,39 @@ class UnsupportedFileError(Exception):
         super().__init__(f"Unsupported file type: {file_name}")
 
 
-async def extract_file_text(file: File, file_quota: FileQuota) -> str:
+async def extract_file_text(file: File, file_quota: FileQuota, db: AsyncSession) -> str:
+    repo = FileProcessedContentRepository(db)
+    # cached contents are complete, so they only need to be truncated to the token limit instead of processing the file again
+    ret = await repo.find(file.content_hash, file.file_processor)
+    if ret is not None:
+        return file_quota.take_tokens(ret)
     processor = _find_file_processor(file)
-    return await asyncio.to_thread(processor.extract_text, file, file_quota)
+    ret = await asyncio.to_thread(processor.extract_text, file, file_quota)
+    # truncated contents are not cached since other agents might allow more tokens
+    if not file_quota.reached_token_limit:
+        await repo.add(FileProcessedContent(content_hash=file.content_hash, file_processor=file.file_processor, processed_content=ret))
+    return ret
 
 
 def _find_file_processor(file: File) -> BaseFileProcessor:
+    registry = _build_processors_registry(file.file_processor)
+    # files are identified by their extension, and their content type is only used when they have no known extension
+    extension = os.path.splitext(file.name)[1].lower()
+    content_type = file.content_type.split(';', 1)[0].strip().lower()
+    found = registry.get(extension) or registry.get(content_type)
+    if found is None:
+        raise UnsupportedFileError(file.name)
+    return found
+
+
+@cache
+def _build_processors_registry(file_processor: FileProcessor) -> dict[str, BaseFileProcessor]:
+    # processors keep no state of processed files, so they are only built once (the enhanced pdf processor even builds a client)
     processors = [
         PlainTextFileProcessor(),
         XlsxFileProcessor(),
         XlsFileProcessor(),
         ImageFileProcessor(),
-        build_basic_pdf_processor() if file.file_processor == FileProcessor.BASIC else build_enhanced_pdf_processor()
+        build_basic_pdf_processor() if file_processor == FileProcessor.BASIC else build_enhanced_pdf_processor()
     ]
-    found = next((processor for processor in processors if processor.supports(file)), None)
-    if found is None:
-        raise UnsupportedFileError(file.name)
-    return found
+    return {key: processor for processor in processors for key in [*processor.file_extensions, *processor.content_types]}
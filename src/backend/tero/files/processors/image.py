@@ -11,9 +11,8 @@ logger = logging.getLogger(__name__)
 
 
 class ImageFileProcessor(BaseFileProcessor):
-
-    def supports(self, file: File) -> bool:
-        return any(file.name.lower().endswith(ext) for ext in {'.jpg', '.jpeg', '.png'})
+    file_extensions = {'.jpg', '.jpeg', '.png'}
+    content_types = {'image/jpeg', 'image/png'}
 
     def extract_text(self, file: File, file_quota: FileQuota) -> str:
         try:
@@ -1,5 +1,5 @@
 from ...core import BaseFileProcessor
-from .pypdfium import PyPdfiumPdfProcessor
+from .pypdfium import PyPdfiumPdfProcessor, close_pdf_process_pool
 from .azure_document_intelligence import AzureDocumentIntelligencePdfProcessor
 
 
@@ -1,8 +1,14 @@
+from collections import defaultdict
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import nullcontext, AbstractContextManager
 from dataclasses import dataclass
+from functools import cache
+import io
 import logging
 from typing import cast, Generic, Optional, TypeVar, Callable
 
 from pydantic import SecretStr
+from pypdf import PdfReader, PdfWriter
 from tabulate import tabulate
 
 from azure.ai.documentintelligence import DocumentIntelligenceClient
@@ -10,6 +16,7 @@ from azure.ai.documentintelligence.models import AnalyzeDocumentRequest, Analyze
 from azure.core.credentials import AzureKeyCredential
 
 from ....core.env import env
+from ...domain import FileContent
 from .core import BasePdfProcessor
 
 
@@ -38,9 +45,6 @@ class BoundingBox:
         height = max(y_coords) - y
         return cls(x=x, y=y, width=width, height=height)
 
-    def contains(self, other: 'BoundingBox') -> bool:
-        return (other.y >= self.y and other.y + other.height <= self.y + self.height)
-
 
 @dataclass
 class BoundedElement(Generic[T]):
@@ -138,7 +142,7 @@ class BoundedTable(BoundedElement['BoundedTable']):
         return f"\n{table}\n"
 
 
-class AzureDocumentIntelligencePdfProcessor(BasePdfProcessor):
+class AzureDocumentIntelligencePdfProcessor(BasePdfProcessor[PdfReader]):
 
     @staticmethod
     def is_configured() -> bool:
@@ -150,41 +154,100 @@ class AzureDocumentIntelligencePdfProcessor(BasePdfProcessor):
             endpoint=cast(str, env.azure_doc_intelligence_endpoint),
             credential=AzureKeyCredential(cast(SecretStr, env.azure_doc_intelligence_key).get_secret_value()))
 
-    def _extract_pages_content(self, pdf_chunk: bytes, page_offset: int) -> dict[int, str]:
-        ret = {}
+    def _open_document(self, content: FileContent) -> AbstractContextManager[PdfReader]:
+        return nullcontext(PdfReader(io.BytesIO(content)))
+
+    def _get_total_pages(self, document: PdfReader) -> int:
+        return len(document.pages)
+
+    def _get_executor(self) -> Optional[Executor]:
+        return _get_thread_pool()
+
+    def _submit_pages_extraction(self, executor: Executor, document: PdfReader, start_page: int, end_page: int) \
+            -> Future[dict[int, str]]:
+        # pypdf readers are not thread safe, so only the analysis of each chunk is run concurrently
+        return executor.submit(self._analyze_pdf_chunk, self._write_pdf_chunk(document, start_page, end_page), start_page)
+
+    def _extract_pages_content(self, document: PdfReader, start_page: int, end_page: int) -> dict[int, str]:
+        return self._analyze_pdf_chunk(self._write_pdf_chunk(document, start_page, end_page), start_page)
+
+    def _analyze_pdf_chunk(self, pdf_chunk: bytes, start_page: int) -> dict[int, str]:
         request = AnalyzeDocumentRequest(bytes_source=pdf_chunk)
         # https://tech-depth-and-breadth.medium.com/azure-ai-document-intelligence-for-rag-use-cases-4e242b0ba7de
         poller = self._client.begin_analyze_document("prebuilt-layout", request)
-        result = poller.result()
+        return self._build_pages_content(poller.result(), start_page)
+
+    def _build_pages_content(self, result: AnalyzeResult, start_page: int) -> dict[int, str]:
+        ret = {}
+        # elements are grouped by page in one pass, instead of looking for the elements of each page in the whole result
+        paragraphs = self._group_elements_by_page(result, "paragraphs")
+        tables = self._group_elements_by_page(result, "tables")
         for page in result.get("pages", []):
             page_number = page.get("pageNumber", 1)
-            elements = self._create_page_elements(result, page_number)
-            ret[page_number + page_offset - 1] = self._combine_elements_content(elements)
+            elements = self._create_page_elements(paragraphs.get(page_number, []), tables.get(page_number, []))
+            ret[page_number + start_page - 1] = self._combine_elements_content(elements)
         return ret
 
-    def _create_page_elements(self, result: AnalyzeResult, page_number: int) -> list[BoundedElement]:
-        paragraph_elements = self._create_page_elements_by_type("paragraphs", BoundedParagraph.from_paragraph, result, page_number)
-        table_elements = self._create_page_elements_by_type("tables", BoundedTable.from_cells, result, page_number)
-        ret = []
-        for paragraph_element in paragraph_elements:
-            if paragraph_element.bbox and not any(table_element.bbox and table_element.bbox.contains(paragraph_element.bbox) for table_element in table_elements):
-                ret.append(paragraph_element)
-            elif not paragraph_element.bbox:
-                ret.append(paragraph_element)
+    # Document Intelligence charges per analyzed page, so only the pages of each chunk are sent
+    def _write_pdf_chunk(self, document: PdfReader, start_page: int, end_page: int) -> bytes:
+        try:
+            pdf_writer = PdfWriter()
+            for page_num in range(start_page, end_page + 1):
+                pdf_writer.add_page(document.pages[page_num - 1])
+
+            output_buffer = io.BytesIO()
+            pdf_writer.write(output_buffer)
+            return output_buffer.getvalue()
+
+        except Exception as e:
+            logger.warning(f"Failed to write PDF chunk {start_page}-{end_page}: {e}. Using original content.")
+            return cast(io.BytesIO, document.stream).getvalue()
+
+    def _group_elements_by_page(self, result: AnalyzeResult, element_type: str) -> dict[int, list]:
+        ret: dict[int, list] = defaultdict(list)
+        for element in result.get(element_type, []):
+            ret[element.get("boundingRegions", [{}])[0].get("pageNumber", -1)].append(element)
+        return ret
+
+    def _create_page_elements(self, paragraphs: list, tables: list) -> list[BoundedElement]:
+        paragraph_elements = self._create_elements(paragraphs, BoundedParagraph.from_paragraph)
+        table_elements = self._create_elements(tables, BoundedTable.from_cells)
+        in_table = self._find_contained_elements(paragraph_elements, table_elements)
+        ret = [paragraph_element for idx, paragraph_element in enumerate(paragraph_elements) if idx not in in_table]
         ret.extend(table_elements)
         return ret
 
-    def _create_page_elements_by_type(self, element_type: str, factory: Callable[[dict], Optional[BoundedElement]], result: AnalyzeResult, page_number: int) -> list[BoundedElement]:
+    def _create_elements(self, elements: list, factory: Callable[[dict], Optional[BoundedElement]]) -> list[BoundedElement]:
         ret = []
-        for element in self._get_page_elements(result, element_type, page_number):
+        for element in elements:
             elem = factory(element)
             if elem:
                 ret.append(cast(BoundedElement, elem))
         return ret
 
-    def _get_page_elements(self, result: AnalyzeResult, element_type: str, page_number: int) -> list:
-        return [element for element in result.get(element_type, []) if element.get("boundingRegions", [{}])[0].get("pageNumber", -1) == page_number]
+    def _find_contained_elements(self, elements: list[BoundedElement], containers: list[BoundedElement]) -> set[int]:
+        # sweeping elements and containers sorted by their top, while keeping the lowest bottom of the containers starting above each
+        # element, avoids checking every element against every container
+        container_boxes = sorted((container.bbox for container in containers if container.bbox), key=lambda bbox: bbox.y)
+        bounded_elements = sorted(((idx, element.bbox) for idx, element in enumerate(elements) if element.bbox), key=lambda e: e[1].y)
+        ret = set()
+        container_idx = 0
+        lowest_bottom = None
+        for idx, bbox in bounded_elements:
+            while container_idx < len(container_boxes) and container_boxes[container_idx].y <= bbox.y:
+                container_bottom = container_boxes[container_idx].y + container_boxes[container_idx].height
+                lowest_bottom = container_bottom if lowest_bottom is None else max(lowest_bottom, container_bottom)
+                container_idx += 1
+            if lowest_bottom is not None and bbox.y + bbox.height <= lowest_bottom:
+                ret.add(idx)
+        return ret
 
     def _combine_elements_content(self, elements: list[BoundedElement]) -> str:
         elements.sort(key=lambda x: x.y)
         return "\n".join(element.content for element in elements)
+
+
+@cache
+def _get_thread_pool() -> ThreadPoolExecutor:
+    # shared by all documents to limit concurrent requests to Document Intelligence
+    return ThreadPoolExecutor(max_workers=env.pdf_extraction_max_concurrency, thread_name_prefix="doc-intelligence")
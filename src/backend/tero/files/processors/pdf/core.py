@@ -1,74 +1,104 @@
 import abc
-import io
+from collections import deque
+from concurrent.futures import Executor, Future
+from contextlib import AbstractContextManager
 import logging
+from typing import Any, Callable, Generic, Iterator, Optional, TypeVar
 
-from pypdf import PdfReader, PdfWriter
-
+from ....core.env import env
 from ...core import BaseFileProcessor, FileQuota, QuotaExceededError
-from ...domain import File
+from ...domain import File, FileContent
 
 
 logger = logging.getLogger(__name__)
 _PAGES_CHUNK_SIZE = 50
+D = TypeVar('D')
+
+
+class BasePdfProcessor(BaseFileProcessor, Generic[D], abc.ABC):
+    """
+    Extracts the text of PDFs in chunks of pages, checking quotas between chunks.
 
+    The PDF is parsed only once (with the document type of each processor) and each chunk is extracted from the parsed document.
+    Processors providing an executor extract several chunks concurrently, and their pages are merged in order.
+    """
 
-class BasePdfProcessor(BaseFileProcessor, abc.ABC):
+    file_extensions = {'.pdf'}
+    content_types = {'application/pdf'}
 
     def __init__(self, cost_per_1k_pages_usd: float):
         self._cost_per_1k_pages_usd = cost_per_1k_pages_usd
 
-    def supports(self, file: File) -> bool:
-        return file.name.lower().endswith('.pdf')
-
     def extract_text(self, file: File, file_quota: FileQuota) -> str:
-        content = file.content
-        total_pages = self._get_total_pages(content)
-        all_pages_content = {}
-
-        for start_page in range(1, total_pages + 1, _PAGES_CHUNK_SIZE):
-            end_page = min(start_page + _PAGES_CHUNK_SIZE - 1, total_pages)
-
-            if file_quota.has_reached_quota_limit():
-                raise QuotaExceededError(f"Quota exceeded when analyzing pdf {file.id} {file.name}")
-
-            current_content = self._format_pages_content(all_pages_content)
-            if file_quota.has_reached_token_limit(current_content):
-                logger.warning(f"Token limit reached when analyzing pdf {file.id} {file.name}. Stopping analysis at page {start_page-1}")
-                break
+        with self._open_document(file.content) as document:
+            return file_quota.take_text(self._iter_pages_text(file, document, file_quota))
+
+    def _iter_pages_text(self, file: File, document: D, file_quota: FileQuota) -> Iterator[str]:
+        # chunks are only extracted when previous pages fit in the token limit, since this generator stops being consumed otherwise
+        total_pages = self._get_total_pages(document)
+        chunks = deque((start_page, min(start_page + _PAGES_CHUNK_SIZE - 1, total_pages)) for start_page in range(1, total_pages + 1, _PAGES_CHUNK_SIZE))
+        executor = self._get_executor() if len(chunks) > 1 and env.pdf_extraction_max_concurrency > 1 else None
+        max_concurrency = env.pdf_extraction_max_concurrency if executor else 1
+        in_flight: deque[tuple[int, Future[dict[int, str]]]] = deque()
+        separator = ""
+        try:
+            while chunks or in_flight:
+                # usage of submitted chunks is reserved before extracting them, so the quota takes into account the ones in flight
+                while chunks and len(in_flight) < max_concurrency:
+                    start_page, end_page = chunks[0]
+                    chunk_pages = end_page - start_page + 1
+                    if not file_quota.reserve_usage(chunk_pages, self._cost_per_1k_pages_usd):
+                        break
+                    chunks.popleft()
+                    future = self._submit_pages_extraction(executor or _INLINE_EXECUTOR, document, start_page, end_page)
+                    in_flight.append((chunk_pages, future))
+
+                # the quota is only exceeded once chunks in flight (which fit in the quota) are extracted
+                if not in_flight:
+                    raise QuotaExceededError(f"Quota exceeded when analyzing pdf {file.id} {file.name}")
+
+                _, future = in_flight.popleft()
+                pages_content = future.result()
+                for page_num in sorted(pages_content.keys()):
+                    yield f"{separator}## Page {page_num}\n{pages_content[page_num]}"
+                    separator = "\n\n"
+                    if file_quota.reached_token_limit:
+                        logger.warning(f"Token limit reached when analyzing pdf {file.id} {file.name}. Stopping analysis at page {page_num}")
+                        return
+        finally:
+            # chunks not yet started are not extracted (nor paid for) when the token limit is reached or extraction fails
+            for chunk_pages, future in in_flight:
+                if future.cancel():
+                    file_quota.release_usage(chunk_pages, self._cost_per_1k_pages_usd)
+
+    def _get_executor(self) -> Optional[Executor]:
+        return None
+
+    def _submit_pages_extraction(self, executor: Executor, document: D, start_page: int, end_page: int) -> Future[dict[int, str]]:
+        return executor.submit(self._extract_pages_content, document, start_page, end_page)
 
-            pdf_chunk = self._write_pdf_chunk(content, start_page, end_page)
-            chunk_pages = end_page - start_page + 1
+    @abc.abstractmethod
+    def _open_document(self, content: FileContent) -> AbstractContextManager[D]:
+        pass
 
-            pages_content = self._extract_pages_content(pdf_chunk, start_page)
-            file_quota.pdf_parsing_usage.increment(new_quantity=chunk_pages, cost_per_1k_units=self._cost_per_1k_pages_usd)
+    @abc.abstractmethod
+    def _get_total_pages(self, document: D) -> int:
+        pass
 
-            all_pages_content.update(pages_content)
+    @abc.abstractmethod
+    def _extract_pages_content(self, document: D, start_page: int, end_page: int) -> dict[int, str]:
+        pass
 
-        return self._format_pages_content(all_pages_content)
 
-    def _get_total_pages(self, content: bytes):
-        pdf = PdfReader(io.BytesIO(content))
-        return len(pdf.pages)
+class _InlineExecutor(Executor):
 
-    def _write_pdf_chunk(self, content: bytes, start_page: int, end_page: int) -> bytes:
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        ret: Future = Future()
         try:
-            pdf_reader = PdfReader(io.BytesIO(content))
-            pdf_writer = PdfWriter()
-
-            for page_num in range(start_page, end_page + 1):
-                pdf_writer.add_page(pdf_reader.pages[page_num - 1])
-
-            output_buffer = io.BytesIO()
-            pdf_writer.write(output_buffer)
-            return output_buffer.getvalue()
-
+            ret.set_result(fn(*args, **kwargs))
         except Exception as e:
-            logger.warning(f"Failed to write PDF chunk {start_page}-{end_page}: {e}. Using original content.")
-            return content
+            ret.set_exception(e)
+        return ret
 
-    @abc.abstractmethod
-    def _extract_pages_content(self, pdf_chunk: bytes, page_offset: int) -> dict[int, str]:
-        pass
 
-    def _format_pages_content(self, all_pages_content: dict) -> str:
-        return "\n\n".join(f"## Page {page_num}\n{all_pages_content[page_num]}" for page_num in sorted(all_pages_content.keys()))
+_INLINE_EXECUTOR = _InlineExecutor()
@@ -1,24 +1,145 @@
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import AbstractContextManager, closing, suppress
 import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from typing import Optional
 
 import pypdfium2
 
+from ....core.env import env
+from ...domain import FileContent
 from .core import BasePdfProcessor
 
 
 logger = logging.getLogger(__name__)
+# pdfium is not thread safe and files are extracted concurrently in different threads, so its usage in the current process is serialized.
+# Chunks of pages extracted by the process pool don't need it, since each process extracts one chunk at a time
+_PDFIUM_LOCK = threading.Lock()
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
 
 
-class PyPdfiumPdfProcessor(BasePdfProcessor):
+class _PdfiumDocument:
+    """
+    Document parsed in the current process, which also provides a temporary file with its content for other processes.
+
+    The file is written once per document, so processes extracting chunks of pages open it instead of receiving the whole content with each chunk.
+    """
+
+    def __init__(self, content: FileContent):
+        self._content = content
+        self._path: Optional[str] = None
+        # pdfium only opens bytes, so other bytes-like contents (like big uploads) are opened from the temporary file
+        source = content if isinstance(content, bytes) else self.path
+        try:
+            with _PDFIUM_LOCK:
+                self.document = pypdfium2.PdfDocument(source)
+        except BaseException:
+            self._remove_file()
+            raise
+
+    @property
+    def path(self) -> str:
+        if self._path is None:
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+                f.write(self._content)
+            self._path = f.name
+        return self._path
+
+    def close(self):
+        with _PDFIUM_LOCK:
+            self.document.close()
+        self._remove_file()
+
+    def _remove_file(self):
+        if self._path:
+            with suppress(FileNotFoundError):
+                os.remove(self._path)
+
+
+class PyPdfiumPdfProcessor(BasePdfProcessor[_PdfiumDocument]):
 
     def __init__(self):
         super().__init__(0.0)
 
-    def _extract_pages_content(self, pdf_chunk: bytes, page_offset: int) -> dict[int, str]:
-        pages_content = {}
-        with pypdfium2.PdfDocument(pdf_chunk) as pdf:
-            for relative_page_number, page in enumerate(pdf, start=1):
-                actual_page_number = relative_page_number + page_offset - 1
-                textpage = page.get_textpage()
-                content = textpage.get_text_bounded()
-                pages_content[actual_page_number] = content.replace("\r", "").strip()
-        return pages_content
+    def _open_document(self, content: FileContent) -> AbstractContextManager[_PdfiumDocument]:
+        return closing(_PdfiumDocument(content))
+
+    def _get_total_pages(self, document: _PdfiumDocument) -> int:
+        with _PDFIUM_LOCK:
+            return len(document.document)
+
+    def _get_executor(self) -> Optional[Executor]:
+        return _get_process_pool()
+
+    def _submit_pages_extraction(self, executor: Executor, document: _PdfiumDocument, start_page: int, end_page: int) -> Future[dict[int, str]]:
+        if isinstance(executor, ProcessPoolExecutor):
+            # pdfium is not thread safe and its documents can't be shared with other processes, so each process opens its own document
+            return _submit_to_process_pool(executor, document.path, start_page, end_page)
+        return super()._submit_pages_extraction(executor, document, start_page, end_page)
+
+    def _extract_pages_content(self, document: _PdfiumDocument, start_page: int, end_page: int) -> dict[int, str]:
+        with _PDFIUM_LOCK:
+            return _extract_document_pages_content(document.document, start_page, end_page)
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    with _process_pool_lock:
+        if not _process_pool:
+            # processes are spawned since forking a process with running threads (like the ones of the event loop executor) is unsafe
+            _process_pool = ProcessPoolExecutor(max_workers=env.pdf_extraction_max_concurrency, mp_context=multiprocessing.get_context("spawn"))
+        return _process_pool
+
+
+def _submit_to_process_pool(pool: ProcessPoolExecutor, path: str, start_page: int, end_page: int) -> Future[dict[int, str]]:
+    try:
+        ret = pool.submit(_extract_pdf_pages_content, path, start_page, end_page)
+    except BrokenProcessPool:
+        # the pool broke while no chunk was being extracted, so the chunk can be safely extracted by a new pool
+        _discard_process_pool(pool)
+        pool = _get_process_pool()
+        ret = pool.submit(_extract_pdf_pages_content, path, start_page, end_page)
+    # chunks being extracted when a process dies (eg: killed for using too much memory, or crashed by a malformed PDF) fail,
+    # and the broken pool is discarded so following extractions use a new one
+    ret.add_done_callback(lambda f: _discard_process_pool(pool) if not f.cancelled() and isinstance(f.exception(), BrokenProcessPool) else None)
+    return ret
+
+
+def _discard_process_pool(pool: ProcessPoolExecutor):
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            logger.warning("PDF extraction process pool is broken, a new one will be used by following extractions")
+            _process_pool = None
+
+
+def close_pdf_process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool:
+        pool.shutdown(cancel_futures=True)
+
+
+def _extract_pdf_pages_content(path: str, start_page: int, end_page: int) -> dict[int, str]:
+    with pypdfium2.PdfDocument(path) as document:
+        return _extract_document_pages_content(document, start_page, end_page)
+
+
+def _extract_document_pages_content(document: pypdfium2.PdfDocument, start_page: int, end_page: int) -> dict[int, str]:
+    pages_content = {}
+    for page_number in range(start_page, end_page + 1):
+        page = document[page_number - 1]
+        textpage = page.get_textpage()
+        try:
+            pages_content[page_number] = textpage.get_text_bounded().replace("\r", "").strip()
+        finally:
+            # pages are closed as soon as possible to avoid keeping all of them in memory for big documents
+            textpage.close()
+            page.close()
+    return pages_content
@@ -7,23 +7,26 @@ from ..domain import File
 logger = logging.getLogger(__name__)
 
 class PlainTextFileProcessor(BaseFileProcessor):
-
-    def supports(self, file: File) -> bool:
-        return any(file.name.lower().endswith(ext) for ext in {'.txt', '.md', '.csv', '.har', '.json', '.svg'})
+    file_extensions = {'.txt', '.md', '.csv', '.har', '.json', '.svg'}
+    content_types = {'text/plain', 'text/markdown', 'text/csv', 'application/json', 'image/svg+xml'}
 
     def extract_text(self, file: File, file_quota: FileQuota) -> str:
+        return file_quota.take_tokens(self._decode(file))
+
+    def _decode(self, file: File) -> str:
         encoding = self._get_encoding(file.content_type)
+        # contents are decoded with str, since they might be other bytes-like objects than bytes
         try:
-            return file.content.decode(encoding)
+            return str(file.content, encoding)
         except (UnicodeDecodeError, LookupError):
             logger.warning(f"Failed to decode {file.name} with {encoding}. Trying fallback encodings.", exc_info=True)
             for fallback_encoding in [ e for e in ['utf-8', 'latin-1', 'cp1252'] if e != encoding]:
                 try:
-                    return file.content.decode(fallback_encoding)
+                    return str(file.content, fallback_encoding)
                 except (UnicodeDecodeError, LookupError):
                     continue
             logger.warning(f"All encodings failed for {file.name}, using {encoding} with error replacement")
-            return file.content.decode(encoding, errors='replace')
+            return str(file.content, encoding, errors='replace')
 
     def _get_encoding(self, content_type: Optional[str]) -> str:
         charset_param = '; charset='
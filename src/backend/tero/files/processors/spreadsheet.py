@@ -1,120 +1,136 @@
 from abc import ABC, abstractmethod
+from contextlib import AbstractContextManager, contextmanager
 from io import BytesIO
-from typing import Any
+from typing import Any, Iterator, Sequence, cast
 
 import openpyxl
-import openpyxl.worksheet.worksheet
+from openpyxl.worksheet._read_only import ReadOnlyWorksheet
 import xlrd
 
 from ..core import BaseFileProcessor, FileQuota
-from ..domain import File
+from ..domain import File, FileContent
 
 
-class Sheet(ABC):
+_ROWS_BATCH_SIZE = 100
 
-    @property
-    @abstractmethod
-    def title(self) -> str:
-        pass
 
-    @property
-    @abstractmethod
-    def row_count(self) -> int:
-        pass
+class Sheet(ABC):
 
     @property
     @abstractmethod
-    def column_count(self) -> int:
+    def title(self) -> str:
         pass
 
     @abstractmethod
-    def cell(self, row_idx: int, col_idx: int) -> Any:
+    def iter_rows(self) -> Iterator[Sequence[Any]]:
         pass
 
 
 class SpreadsheetFileProcessor(BaseFileProcessor, ABC):
-    file_extension: str
-
-    def supports(self, file: File) -> bool:
-        return file.name.lower().endswith(self.file_extension)
 
     def extract_text(self, file: File, file_quota: FileQuota) -> str:
-        sheets = self._load_sheets(file.content)
-        sheet_count = sum(1 for sheet in sheets if sheet.row_count)
-        return "\n\n".join(self._format_sheet(sheet, include_sheet_name=sheet_count > 1) for sheet in sheets if sheet.row_count)
+        with self._open_sheets(file.content) as sheets:
+            return file_quota.take_text(self._iter_sheets_text(sheets))
 
     @abstractmethod
-    def _load_sheets(self, content: bytes) -> list[Sheet]:
+    def _open_sheets(self, content: FileContent) -> AbstractContextManager[list[Sheet]]:
         pass
 
-    def _format_sheet(self, sheet: Sheet, include_sheet_name: bool) -> str:
-        prefix = f"## Sheet {sheet.title}\n\n" if include_sheet_name else ""
-        return prefix + "\n".join(self._format_row(row_idx, sheet) for row_idx in range(sheet.row_count))
-
-    def _format_row(self, row_idx: int, sheet: Sheet) -> str:
-        return " | ".join(self._format_cell(row_idx, col_idx, sheet) for col_idx in range(sheet.column_count))
-
-    def _format_cell(self, row_idx: int, col_idx: int, sheet: Sheet) -> str:
-        ret = sheet.cell(row_idx, col_idx)
-        return str(ret) if ret is not None else ""
+    def _iter_sheets_text(self, sheets: list[Sheet]) -> Iterator[str]:
+        # rows are read and generated in batches so sheets are not fully loaded, and reading stops when the token limit is reached
+        separator = ""
+        for sheet in sheets:
+            prefix = separator + (f"## Sheet {sheet.title}\n\n" if len(sheets) > 1 else "")
+            for rows in self._iter_rows_batches(sheet):
+                yield prefix + "\n".join(rows)
+                prefix = "\n"
+                separator = "\n\n"
+
+    def _iter_rows_batches(self, sheet: Sheet) -> Iterator[list[str]]:
+        batch: list[str] = []
+        empty_rows = 0
+        for row in sheet.iter_rows():
+            formatted_row = self._format_row(row)
+            # empty rows are only added when followed by non empty ones, to skip trailing empty (but formatted) rows
+            if not formatted_row:
+                empty_rows += 1
+                continue
+            batch.extend([""] * empty_rows)
+            empty_rows = 0
+            batch.append(formatted_row)
+            if len(batch) >= _ROWS_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _format_row(self, row: Sequence[Any]) -> str:
+        cells = [self._format_cell(value) for value in row]
+        # trailing empty cells are skipped, since sheets usually include formatted but empty columns
+        while cells and not cells[-1]:
+            cells.pop()
+        return " | ".join(cells)
+
+    def _format_cell(self, value: Any) -> str:
+        return str(value) if value is not None else ""
 
 
 class XlsxSheet(Sheet):
 
-    def __init__(self, sheet:openpyxl.worksheet.worksheet.Worksheet):
+    def __init__(self, sheet: ReadOnlyWorksheet):
         self._sheet = sheet
 
     @property
     def title(self) -> str:
         return self._sheet.title
 
-    @property
-    def row_count(self) -> int:
-        return self._sheet.max_row
-
-    @property
-    def column_count(self) -> int:
-        return self._sheet.max_column
-
-    def cell(self, row_idx: int, col_idx: int) -> Any:
-        return self._sheet.cell(row_idx + 1, col_idx + 1).value
+    def iter_rows(self) -> Iterator[Sequence[Any]]:
+        return self._sheet.iter_rows(values_only=True)
 
 
 class XlsxFileProcessor(SpreadsheetFileProcessor):
-    file_extension = '.xlsx'
+    file_extensions = {'.xlsx'}
+    content_types = {'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'}
 
-    def _load_sheets(self, content: bytes) -> list[Sheet]:
-        wb = openpyxl.load_workbook(BytesIO(content))
-        return [XlsxSheet(sheet) for sheet in wb.worksheets]
+    @contextmanager
+    def _open_sheets(self, content: FileContent) -> Iterator[list[Sheet]]:
+        # read only mode parses rows while iterating them, instead of loading all cells of the workbook in memory
+        wb = openpyxl.load_workbook(BytesIO(content), read_only=True)
+        try:
+            yield [XlsxSheet(cast(ReadOnlyWorksheet, sheet)) for sheet in wb.worksheets]
+        finally:
+            wb.close()
 
 
 class XlsSheet(Sheet):
 
-    def __init__(self, sheet: xlrd.sheet.Sheet):
-        self._sheet = sheet
-
-    def is_empyt(self) -> bool:
-        return self._sheet.nrows == 0
+    def __init__(self, workbook: xlrd.book.Book, index: int):
+        self._workbook = workbook
+        self._index = index
 
     @property
     def title(self) -> str:
-        return self._sheet.name
-
-    @property
-    def row_count(self) -> int:
-        return self._sheet.nrows
+        return self._workbook.sheet_names()[self._index]
 
-    @property
-    def column_count(self) -> int:
-        return self._sheet.ncols
-
-    def cell(self, row_idx: int, col_idx: int) -> Any:
-        return self._sheet.cell(row_idx, col_idx).value
+    def iter_rows(self) -> Iterator[Sequence[Any]]:
+        sheet = self._workbook.sheet_by_index(self._index)
+        try:
+            for row_idx in range(sheet.nrows):
+                yield sheet.row_values(row_idx)
+        finally:
+            # sheets are loaded on demand and released once read, to only keep one of them in memory at a time
+            self._workbook.unload_sheet(self._index)
 
 
 class XlsFileProcessor(SpreadsheetFileProcessor):
-    file_extension = '.xls'
-
-    def _load_sheets(self, content: bytes) -> list[Sheet]:
-        wb = xlrd.open_workbook(file_contents=content)
-        return [XlsSheet(sheet) for sheet in wb.sheets()]
+    file_extensions = {'.xls'}
+    content_types = {'application/vnd.ms-excel'}
+
+    @contextmanager
+    def _open_sheets(self, content: FileContent) -> Iterator[list[Sheet]]:
+        # xlrd requires bytes, and contents might be other bytes-like objects
+        wb = xlrd.open_workbook(file_contents=bytes(content), on_demand=True)
+        try:
+            yield [XlsSheet(wb, index) for index in range(wb.nsheets)]
+        finally:
+            wb.release_resources()
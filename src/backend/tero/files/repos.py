@@ -1,9 +1,14 @@
 from datetime import datetime, timezone
 from typing import Optional
 
+from sqlalchemy import inspect
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import InstanceState, joinedload
+from sqlmodel import select, delete, exists, and_, func
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from .domain import File
+from ..core.repos import attr, scalar
+from .domain import File, FileBlob, FileProcessedContent, FileProcessor
 
 
 class FileRepository:
@@ -12,19 +17,88 @@ class FileRepository:
         self._db = db
 
     async def add(self, file: File) -> File:
-        self._db.add(file)
+        await self.add_pending(file)
         await self._db.commit()
         await self._db.refresh(file, ['id'])
         return file
 
+    # adds the file (and its blob) to the session without committing, so it is saved in the same transaction as other changes
+    async def add_pending(self, file: File):
+        await self._add_blob(file)
+        self._db.add(file)
+
     async def find_by_id(self, file_id: int) -> Optional[File]:
         return await self._db.get(File, file_id)
 
+    async def find_with_content_by_id(self, file_id: int) -> Optional[File]:
+        return await self._db.get(File, file_id, options=[joinedload(attr(File.blob))])
+
     async def update(self, file: File):
         file.timestamp = datetime.now(timezone.utc)
+        await self._add_blob(file)
+        state: InstanceState[File] = inspect(file, raiseerr=True)
+        previous_hashes = state.attrs.content_hash.history.deleted
         await self._db.merge(file)
         await self._db.commit()
+        for content_hash in previous_hashes:
+            await self._delete_unused_blob(content_hash)
 
     async def delete(self, file: File):
         await self._db.delete(file)
         await self._db.commit()
+        await self._delete_unused_blob(file.content_hash)
+
+    async def _add_blob(self, file: File):
+        # only new contents need to be stored, and they might already be stored by other files with same contents.
+        # The blob is checked without accessing it, since it is not loaded when only file metadata is required.
+        file_state: InstanceState[File] = inspect(file, raiseerr=True)
+        blob = file_state.attrs.blob.loaded_value
+        if not isinstance(blob, FileBlob):
+            return
+        blob_state: InstanceState[FileBlob] = inspect(blob, raiseerr=True)
+        if not blob_state.transient:
+            return
+        await self._db.exec(scalar(insert(FileBlob).values(hash=blob.hash, content=blob.content).on_conflict_do_nothing()))
+        # the blob is locked until the file referencing it is committed, so it is not deleted as unused meanwhile
+        await self._db.exec(select(FileBlob.hash).where(FileBlob.hash == blob.hash).with_for_update(read=True))
+
+    async def _delete_unused_blob(self, content_hash: str):
+        # waits for files being added with the blob, so they are visible when checking if the blob is unused
+        await self._db.exec(select(FileBlob.hash).where(FileBlob.hash == content_hash).with_for_update())
+        unused = ~exists().where(and_(File.content_hash == content_hash))
+        await self._db.exec(scalar(delete(FileProcessedContent).where(and_(FileProcessedContent.content_hash == content_hash, unused))))
+        await self._db.exec(scalar(delete(FileBlob).where(and_(FileBlob.hash == content_hash, unused))))
+        await self._db.commit()
+
+
+class FileBlobRepository:
+
+    def __init__(self, db: AsyncSession):
+        self._db = db
+
+    async def find_size(self, content_hash: str) -> Optional[int]:
+        ret = await self._db.exec(select(func.length(FileBlob.content)).where(FileBlob.hash == content_hash))
+        return ret.one_or_none()
+
+    # allows reading contents in chunks, avoiding loading whole contents in memory
+    async def find_chunk(self, content_hash: str, offset: int, length: int) -> Optional[bytes]:
+        ret = await self._db.exec(select(func.substr(FileBlob.content, offset + 1, length)).where(FileBlob.hash == content_hash))
+        return ret.one_or_none()
+
+
+class FileProcessedContentRepository:
+
+    def __init__(self, db: AsyncSession):
+        self._db = db
+
+    async def find(self, content_hash: str, file_processor: FileProcessor) -> Optional[str]:
+        stmt = (select(FileProcessedContent.processed_content)
+            .where(and_(FileProcessedContent.content_hash == content_hash, FileProcessedContent.file_processor == file_processor)))
+        ret = await self._db.exec(stmt)
+        return ret.one_or_none()
+
+    async def add(self, processed_content: FileProcessedContent):
+        # same contents might be concurrently processed by different uploads, and any of the results is equally valid
+        stmt = insert(FileProcessedContent).values(processed_content.model_dump()).on_conflict_do_nothing()
+        await self._db.exec(scalar(stmt))
+        await self._db.commit()
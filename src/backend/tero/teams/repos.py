@@ -7,6 +7,7 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 
 from ..core.repos import scalar, attr
 from ..users.domain import User
+from ..users.repos import user_cache
 from .domain import Team, TeamRole, TeamRoleStatus, TeamUser, Role, GLOBAL_TEAM_ID
 
 
@@ -60,6 +61,7 @@ class TeamRepository:
     async def save_team_role(self, team_role: TeamRole):
         await self._db.merge(team_role)
         await self._db.commit()
+        user_cache.invalidate_user(team_role.user_id)
 
     async def delete_team_role(self, team_id: int, user_id: int):
         stmt = (
@@ -68,6 +70,7 @@ class TeamRepository:
         )
         await self._db.exec(scalar(stmt))
         await self._db.commit()
+        user_cache.invalidate_user(user_id)
 
     async def find_teams(self) -> List[Team]:
         stmt = (
@@ -86,6 +89,8 @@ class TeamRepository:
     async def update(self, team: Team):
         await self._db.merge(team)
         await self._db.commit()
+        # cached users include team names
+        user_cache.clear()
 
     async def remove_team_roles(self, team_id: int):
         stmt = (
@@ -94,10 +99,12 @@ class TeamRepository:
         )
         await self._db.exec(scalar(stmt))
         await self._db.commit()
+        user_cache.clear()
 
     async def delete(self, team: Team):
         await self._db.delete(team)
         await self._db.commit()
+        user_cache.clear()
 
     async def find_user_team_roles(self, user_id: int) -> List[TeamRole]:
         query = select(TeamRole).where(TeamRole.user_id == user_id)
@@ -1,25 +1,26 @@
 import asyncio
 from contextlib import AsyncExitStack
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 import io
 import json
 import logging
 from typing import Annotated, Optional, List, AsyncIterator, cast
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, Request, File as FastAPIFile
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, Request, Response, Header, File as FastAPIFile
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sse_starlette.event import ServerSentEvent
 from langgraph.errors import GraphRecursionError
 
 from ..agents.repos import AgentRepository
 from ..ai_models import ai_factory
-from ..core.api import BASE_PATH, with_heartbeat
+from ..core.api import BASE_PATH, with_heartbeat, coalesce, EventStreamResponse, ReplayableStreams
 from ..core.auth import get_current_user
 from ..core.domain import CamelCaseModel
+from ..core import repos as repos_module
 from ..core.env import env
 from ..core.repos import get_db
-from ..files.api import build_file_download_response
+from ..files.api import build_file_download_response, read_upload
 from ..files.core import FileQuota, CurrentQuota, QuotaExceededError, add_encoding_to_content_type
 from ..files.domain import File, FileStatus, FileMetadata, FileProcessor, FileMetadataWithContent
 from ..files.parser import extract_file_text
@@ -31,16 +32,17 @@ from ..usage.repos import UsageRepository
 from ..users.domain import User
 from .domain import ThreadListItem, Thread, ThreadMessage, ThreadMessageOrigin, ThreadUpdate,\
     ThreadMessagePublic, ThreadMessageFile, ThreadMessageUpdate, AgentActionEvent, AgentFileEvent,\
-    AgentMessageEvent, ThreadTranscriptionResult, ModelRateLimitError
+    AgentMessageEvent, ThreadTranscriptionResult, ModelRateLimitError, MinutesSavedEstimation
 from .engine import build_thread_name, AgentEngine
-from .repos import ThreadRepository, ThreadMessageRepository, ThreadMessageFileRepository
-from .time_saved_estimation import estimate_minutes_saved
+from .repos import ThreadRepository, ThreadMessageRepository, ThreadMessageFileRepository, ThreadTurnRepository, MinutesSavedEstimationRepository
+from .stop_signals import thread_stop_signals
+from .time_saved_estimation import estimate_minutes_saved, MinutesSavedEstimationJob, MinutesSavedEstimationQueue
 
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 THREADS_PATH = f"{BASE_PATH}/threads"
-active_streaming_connections: dict[int, asyncio.Event] = {}
+answer_streams = ReplayableStreams(env.answer_stream_replay_max_events, env.answer_stream_retention_seconds)
 
 
 @router.get(THREADS_PATH)
@@ -137,7 +139,7 @@ class ThreadMessageOriginApi(Enum):
 
 @router.post(THREAD_MESSAGES_PATH, status_code=status.HTTP_201_CREATED)
 async def add_message(thread_id: int, request: Request, user: Annotated[User, Depends(get_current_user)],
-        db: Annotated[AsyncSession, Depends(get_db)], files: List[UploadFile] = []) -> StreamingResponse:
+        db: Annotated[AsyncSession, Depends(get_db)], files: List[UploadFile] = []) -> EventStreamResponse:
     thread = await _find_thread(thread_id, user.id, db)
     current_usage = await UsageRepository(db).find_current_month_user_usage_usd(user.id)
     if current_usage >= user.monthly_usd_limit:
@@ -171,13 +173,12 @@ async def add_message(thread_id: int, request: Request, user: Annotated[User, De
         user_message = await repo.add(initial_thread_message)
 
         await _attach_existing_files_to_message(existing_files, user_message, db)
-        await _handle_file_contents(files, user_message, user, thread, db)
+        await _handle_file_contents(files, user_message, user, thread, current_usage, db)
         user_message = await repo.refresh_with_files(user_message)
 
-        return StreamingResponse(
-            with_heartbeat(_agent_response(user_message, thread, user.id, db, is_in_agent_edition)),
-            media_type="text/event-stream",
-        )
+        answer_stream = answer_streams.start((thread.id, user_message.id),
+            _background_agent_response(user_message.id, thread.id, user.id, is_in_agent_edition))
+        return EventStreamResponse(with_heartbeat(answer_stream.iterate()))
     except ToolAuthRequestException as e:
         raise build_tool_auth_request_http_exception(e.request)
 
@@ -204,24 +205,53 @@ async def _attach_existing_files_to_message(files: List[ThreadMessageFile], user
         await repo.add(ThreadMessageFile(thread_message_id=user_message.id, file_id=f.file_id))
 
 
-async def _handle_file_contents(files: List[UploadFile], user_message: ThreadMessage, user: User, thread: Thread, db: AsyncSession):
-    file_repo = FileRepository(db)
-    if files:
-        for f in files:
-            content = await f.read()
-            content_type = add_encoding_to_content_type(f.content_type, content)
-            file_processor = FileProcessor.ENHANCED if is_enhanced_pdf_processor_available() else FileProcessor.BASIC
-            file = File(name=f.filename or "uploaded-file", content_type=content_type, content=content, user_id=user.id, file_processor=file_processor)
-            pdf_parsing_usage = Usage(message_id=user_message.id, user_id=user.id, agent_id=thread.agent_id, model_id=None, type=UsageType.PDF_PARSING)
-            current_usage = await UsageRepository(db).find_current_month_user_usage_usd(user.id)
-            file_quota = FileQuota(pdf_parsing_usage, thread.agent, CurrentQuota(current_usage, user.monthly_usd_limit))
-            try:
-                file.processed_content = await extract_file_text(file, file_quota)
-                file.status = FileStatus.PROCESSED
-                saved_file = await file_repo.add(file)
-                await ThreadMessageFileRepository(db).add(ThreadMessageFile(thread_message_id=user_message.id, file_id=saved_file.id))
-            finally:
-                await UsageRepository(db).add(pdf_parsing_usage)
+async def _handle_file_contents(files: List[UploadFile], user_message: ThreadMessage, user: User, thread: Thread, current_usage: float,
+        db: AsyncSession):
+    if not files:
+        return
+    file_processor = FileProcessor.ENHANCED if is_enhanced_pdf_processor_available() else FileProcessor.BASIC
+    uploaded_files = [await _read_uploaded_file(f, user, file_processor) for f in files]
+    # files are processed concurrently sharing the user quota, which reserves the usage of each processed chunk of pages atomically
+    current_quota = CurrentQuota(current_usage, user.monthly_usd_limit)
+    file_quotas = [FileQuota(Usage(message_id=user_message.id, user_id=user.id, agent_id=thread.agent_id, model_id=None, type=UsageType.PDF_PARSING),
+                             thread.agent, current_quota) for _ in uploaded_files]
+    concurrency = asyncio.Semaphore(env.message_files_extraction_max_concurrency)
+    results = await asyncio.gather(*[_extract_uploaded_file_text(file, file_quota, concurrency) for file, file_quota in zip(uploaded_files, file_quotas)],
+                                   return_exceptions=True)
+    usages = [file_quota.pdf_parsing_usage for file_quota in file_quotas]
+    # successfully processed files are kept even when other files fail
+    processed_files = []
+    for file, result in zip(uploaded_files, results):
+        if not isinstance(result, BaseException):
+            file.processed_content = result
+            file.status = FileStatus.PROCESSED
+            processed_files.append(file)
+    await ThreadMessageFileRepository(db).add_uploaded(user_message.id, processed_files, usages)
+    error = next((result for result in results if isinstance(result, BaseException)), None)
+    if error:
+        raise error
+
+
+async def _read_uploaded_file(f: UploadFile, user: User, file_processor: FileProcessor) -> File:
+    blob = await read_upload(f)
+    content_type = add_encoding_to_content_type(f.content_type, blob.content)
+    return File(name=f.filename or "uploaded-file", content_type=content_type, blob=blob, content_hash=blob.hash, user_id=user.id,
+                file_processor=file_processor)
+
+
+async def _extract_uploaded_file_text(file: File, file_quota: FileQuota, concurrency: asyncio.Semaphore) -> str:
+    # each file uses its own session since sessions can't be used concurrently
+    async with concurrency, AsyncSession(repos_module.engine, expire_on_commit=False) as db:
+        return await extract_file_text(file, file_quota, db)
+
+
+async def _background_agent_response(message_id: int, thread_id: int, user_id: int, is_in_agent_edition: bool) -> AsyncIterator[bytes]:
+    # the answer is generated in background, so clients can reconnect to it, and it may outlive the request and its db session
+    async with AsyncSession(repos_module.engine, expire_on_commit=False) as db:
+        thread = cast(Thread, await ThreadRepository(db).find_by_id(thread_id, user_id))
+        message = cast(ThreadMessage, await ThreadMessageRepository(db).find_with_file_contents_by_id(message_id))
+        async for event in _agent_response(message, thread, user_id, db, is_in_agent_edition):
+            yield event
 
 
 async def _agent_response(message: ThreadMessage, thread: Thread, user_id: int, db: AsyncSession, is_in_agent_edition: bool) \
@@ -235,20 +265,29 @@ async def _agent_response(message: ThreadMessage, thread: Thread, user_id: int,
     complete_answer = ""
     files: List[FileMetadata] = []
     status_updates: List[AgentActionEvent] = []
+    thread_name_task: Optional[asyncio.Task[Optional[str]]] = None
+    usage_saved = False
+    stop_event = thread_stop_signals.register(thread.id)
     try:
-        stop_event = asyncio.Event()
-        active_streaming_connections[thread.id] = stop_event
-
         message_usage = MessageUsage(user_id=user_id, agent_id=thread.agent_id, model_id=thread.agent.model_id, message_id=message.id)
         thread_messages = await repo.find_previous_messages(message)
 
+        # the thread name is generated while answering to avoid delaying the answer and is sent as soon as it is available
         if len(thread_messages) == 0:
-            thread.name = await build_thread_name(message.text, message_usage, db)
-            await ThreadRepository(db).update(thread)
+            thread_name_task = asyncio.create_task(_generate_thread_name(thread.id, message.text, message_usage))
 
-        answer_stream = AgentEngine(thread.agent, user_id, db).answer([*thread_messages, message], message_usage, stop_event)
+        # text chunks are merged to avoid sending a frame per generated token
+        answer_stream = coalesce(AgentEngine(thread.agent, user_id, db).answer([*thread_messages, message], message_usage, stop_event),
+            lambda event: isinstance(event, AgentMessageEvent),
+            lambda event, other: AgentMessageEvent(content=cast(AgentMessageEvent, event).content + cast(AgentMessageEvent, other).content),
+            env.answer_stream_coalesce_ms / 1000)
 
         async for event in answer_stream:
+            if thread_name_task and thread_name_task.done():
+                thread_name_event = _build_thread_name_event(thread_name_task.result())
+                thread_name_task = None
+                if thread_name_event:
+                    yield thread_name_event
             if isinstance(event, AgentActionEvent):
                 status_updates.append(event)
                 payload = json.dumps(event.model_dump(mode="json", by_alias=True))
@@ -261,29 +300,28 @@ async def _agent_response(message: ThreadMessage, thread: Thread, user_id: int,
             else:
                 raise RuntimeError(f"Unsupported event type: {type(event)}")
 
-        if stop_event.is_set() or is_in_agent_edition:
-            minutes_saved = 0
-        else:
-            minutes_saved = await estimate_minutes_saved(
-                user_message=message.text,
-                agent_response=complete_answer,
-                thread=thread,
-                thread_messages=thread_messages,
-                message_usage=message_usage,
-                db=db
-            )
+        if thread_name_task:
+            thread_name_event = _build_thread_name_event(await thread_name_task)
+            thread_name_task = None
+            if thread_name_event:
+                yield thread_name_event
 
-        answer = await repo.add(ThreadMessage(
+        # minutes saved are estimated in background to avoid delaying the answer
+        estimate_minutes = not stop_event.is_set() and not is_in_agent_edition
+        answer = await ThreadTurnRepository(db).add(ThreadMessage(
             thread_id=thread.id,
             text=complete_answer,
             origin=ThreadMessageOrigin.AGENT,
             parent_id=message.id,
-            minutes_saved=minutes_saved,
+            minutes_saved=None if estimate_minutes else 0,
             stopped=stop_event.is_set(),
             status_updates=_dump_status_updates(status_updates)
-        ))
-        for f in files:
-            await ThreadMessageFileRepository(db).add(ThreadMessageFile(thread_message_id=answer.id, file_id=f.id))
+        ), [f.id for f in files], message_usage,
+            MinutesSavedEstimation(thread_id=thread.id, user_id=user_id, claimed_until=_minutes_saved_estimation_claim_expiration())
+            if estimate_minutes else None)
+        usage_saved = True
+        if estimate_minutes:
+            minutes_saved_estimations.put_nowait(MinutesSavedEstimationJob(answer_message_id=answer.id, thread_id=thread.id, user_id=user_id))
 
         yield ServerSentEvent(event="metadata", data=json.dumps({
             "answerMessageId": answer.id,
@@ -320,9 +358,86 @@ async def _agent_response(message: ThreadMessage, thread: Thread, user_id: int,
             status_updates=_dump_status_updates(status_updates)
         ))
         yield ServerSentEvent(event="error").encode()
+    finally:
+        # wait for the name generation to register its usage
+        if thread_name_task:
+            await thread_name_task
+        if not usage_saved:
+            await UsageRepository(db).add(message_usage)
+        thread_stop_signals.unregister(thread.id, stop_event)
+
+
+async def _generate_thread_name(thread_id: int, first_message: str, message_usage: MessageUsage) -> Optional[str]:
+    try:
+        # a new db session is used since this runs concurrently with the answer, which uses the request one
+        async with AsyncSession(repos_module.engine, expire_on_commit=False) as db:
+            ret = await build_thread_name(first_message, message_usage, db)
+            await ThreadRepository(db).update_name(thread_id, ret)
+            return ret
+    except Exception:
+        logger.warning(f"Problem generating name for thread {thread_id}", exc_info=True)
+        return None
+
+
+# pending estimations are claimed by the process estimating them until the next sweep, when they are recovered if not estimated yet
+def _minutes_saved_estimation_claim_expiration() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(minutes=env.minutes_saved_estimation_sweep_period_minutes)
+
+
+async def _estimate_answer_minutes_saved(job: MinutesSavedEstimationJob):
+    async with AsyncSession(repos_module.engine, expire_on_commit=False) as db:
+        try:
+            await _estimate_missing_minutes_saved(job, db)
+        except ModelRateLimitError:
+            # kept as pending to be recovered by sweeps if retries are exhausted
+            raise
+        except Exception:
+            await db.rollback()
+            await MinutesSavedEstimationRepository(db).delete(job.answer_message_id)
+            raise
+        await MinutesSavedEstimationRepository(db).delete(job.answer_message_id)
+
+
+async def _estimate_missing_minutes_saved(job: MinutesSavedEstimationJob, db: AsyncSession):
+    repo = ThreadMessageRepository(db)
+    thread = await ThreadRepository(db).find_by_id(job.thread_id, job.user_id)
+    answer = await repo.find_by_id(job.answer_message_id)
+    if not thread or not answer or answer.parent_id is None or answer.minutes_saved is not None:
+        return
+    user_message = cast(ThreadMessage, await repo.find_by_id(answer.parent_id))
+    message_usage = MessageUsage(user_id=job.user_id, agent_id=thread.agent_id, model_id=thread.agent.model_id, message_id=user_message.id)
+    try:
+        minutes_saved = await estimate_minutes_saved(
+            user_message=user_message.text,
+            agent_response=answer.text,
+            thread=thread,
+            thread_messages=await repo.find_previous_messages(user_message),
+            message_usage=message_usage,
+            db=db
+        )
     finally:
         await UsageRepository(db).add(message_usage)
-        del active_streaming_connections[thread.id]
+    await repo.update_missing_minutes_saved(answer.id, minutes_saved)
+
+
+async def _claim_pending_minutes_saved_estimations(limit: int) -> List[MinutesSavedEstimationJob]:
+    async with AsyncSession(repos_module.engine, expire_on_commit=False) as db:
+        estimations = await MinutesSavedEstimationRepository(db).claim_expired(_minutes_saved_estimation_claim_expiration(), limit)
+        return [MinutesSavedEstimationJob(answer_message_id=e.answer_message_id, thread_id=e.thread_id, user_id=e.user_id) for e in estimations]
+
+
+minutes_saved_estimations = MinutesSavedEstimationQueue(
+    _estimate_answer_minutes_saved,
+    _claim_pending_minutes_saved_estimations,
+    env.minutes_saved_estimation_queue_max_size,
+    env.minutes_saved_estimation_max_concurrency,
+    env.minutes_saved_estimation_max_retries,
+    env.minutes_saved_estimation_retry_delay_seconds
+)
+
+
+def _build_thread_name_event(name: Optional[str]) -> Optional[bytes]:
+    return ServerSentEvent(event="threadName", data=json.dumps({"name": name})).encode() if name else None
 
 
 def _dump_status_updates(status_updates: List[AgentActionEvent]) -> Optional[List[dict]]:
@@ -331,16 +446,23 @@ def _dump_status_updates(status_updates: List[AgentActionEvent]) -> Optional[Lis
 @router.post(THREAD_PATH + "/stop", status_code=status.HTTP_200_OK)
 async def stop_message(thread_id: int,
                       user: Annotated[User, Depends(get_current_user)], db: Annotated[AsyncSession, Depends(get_db)]):
-    stop_event = active_streaming_connections.get(thread_id)
-    if stop_event:
-        stop_event.set()
-    else:
+    if not await thread_stop_signals.stop(thread_id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
 
 
 THREAD_MESSAGE_PATH = f"{THREAD_PATH}/messages/{{message_id}}"
 
 
+@router.get(THREAD_MESSAGE_PATH)
+async def find_message(thread_id: int, message_id: int, user: Annotated[User, Depends(get_current_user)],
+                       db: Annotated[AsyncSession, Depends(get_db)]) -> ThreadMessagePublic:
+    await _find_thread(thread_id, user.id, db)
+    thread_message = await _find_thread_message(message_id, db)
+    if thread_message.thread_id != thread_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return ThreadMessagePublic.from_message(thread_message)
+
+
 @router.put(THREAD_MESSAGE_PATH)
 async def update_message(thread_id: int, message_id: int, updated_message: ThreadMessageUpdate,
                       user: Annotated[User, Depends(get_current_user)], db: Annotated[AsyncSession, Depends(get_db)]):
@@ -368,6 +490,16 @@ async def update_message(thread_id: int, message_id: int, updated_message: Threa
     return thread_message
 
 
+@router.get(THREAD_MESSAGE_PATH + "/stream")
+async def resume_message_stream(thread_id: int, message_id: int, user: Annotated[User, Depends(get_current_user)],
+        db: Annotated[AsyncSession, Depends(get_db)], last_event_id: Annotated[int, Header()] = 0) -> EventStreamResponse:
+    await _find_thread(thread_id, user.id, db)
+    answer_stream = answer_streams.find((thread_id, message_id))
+    if not answer_stream or not answer_stream.can_resume(last_event_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return EventStreamResponse(with_heartbeat(answer_stream.iterate(last_event_id)))
+
+
 async def _find_thread_message(message_id:int, db: AsyncSession) -> ThreadMessage:
     ret = await ThreadMessageRepository(db).find_by_id(message_id)
     if not ret:
@@ -388,10 +520,11 @@ async def find_thread_file(thread_id: int, file_id: int, user: Annotated[User, D
 
 
 @router.get(f"{THREAD_FILE_PATH}/content")
-async def download_thread_file(thread_id: int, file_id: int, user: Annotated[User, Depends(get_current_user)], db: Annotated[AsyncSession, Depends(get_db)]) -> StreamingResponse:
+async def download_thread_file(thread_id: int, file_id: int, user: Annotated[User, Depends(get_current_user)], request: Request,
+        db: Annotated[AsyncSession, Depends(get_db)]) -> Response:
     await _find_thread(thread_id, user.id, db)
-    file = await ThreadMessageFileRepository(db).find_with_content_by_ids(thread_id, file_id)
-    return build_file_download_response(file)
+    file = await ThreadMessageFileRepository(db).find_file_by_ids(thread_id, file_id)
+    return await build_file_download_response(file, request, db)
 
 
 AUDIO_FORMAT = "audio/webm"
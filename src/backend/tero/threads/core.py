@@ -1,9 +1,18 @@
-from typing import Callable, List, Optional, Type
+from collections import OrderedDict
+import hashlib
+from itertools import accumulate
+import json
+from typing import Any, Callable, Generic, List, Optional, Type, TypeVar
 
 from langchain_core.messages import BaseMessage
 from langchain_core.messages.utils import _default_text_splitter, _first_max_tokens
 
 from ..ai_models.domain import LlmModel
+from ..core.env import env
+
+
+K = TypeVar('K')
+V = TypeVar('V')
 
 
 def trim_messages_to_fit_model(
@@ -23,6 +32,8 @@ def trim_messages_to_fit_model(
         - reserved_tokens
         - model.output_token_limit,
     )
+    if isinstance(token_counter, MessageTokenCounter):
+        token_counter = token_counter.for_messages(messages)
     return _first_max_tokens(
         messages,
         max_tokens=max_tokens,
@@ -31,3 +42,90 @@ def trim_messages_to_fit_model(
         partial_strategy="first",
         end_on=end_on,
     )
+
+
+class LruCache(Generic[K, V]):
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._entries: OrderedDict[K, V] = OrderedDict()
+
+    def get(self, key: K) -> Optional[V]:
+        ret = self._entries.get(key)
+        if ret is not None:
+            self._entries.move_to_end(key)
+        return ret
+
+    def put(self, key: K, value: V):
+        if self._max_size <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+
+# LRU of compiled agents. Keys are tuples whose first element is the agent id so all the entries of an agent can be invalidated
+# when the agent or its tool configurations change.
+class AgentGraphCache(LruCache[tuple, V]):
+
+    def invalidate_agent(self, agent_id: int):
+        for key in [key for key in self._entries if key[0] == agent_id]:
+            del self._entries[key]
+
+
+agent_graph_cache: AgentGraphCache[Any] = AgentGraphCache(env.agent_graph_cache_max_size)
+
+
+class MessageTokenCounter:
+    """
+    Counts the tokens of a list of messages adding up the tokens of each message, which are cached by model and message content.
+
+    This way the conversation history is only tokenized once instead of on every model invocation.
+    """
+
+    def __init__(self, token_counter: Callable[[List[BaseMessage]], int], model_id: str, cache: LruCache[tuple[str, str], int]):
+        self._token_counter = token_counter
+        self._model_id = model_id
+        self._cache = cache
+        self._base_tokens: Optional[int] = None
+
+    def __call__(self, messages: List[BaseMessage]) -> int:
+        return self._get_base_tokens() + sum(self.count_message(m) for m in messages)
+
+    def count_message(self, message: BaseMessage) -> int:
+        key = self._build_key(message)
+        ret = self._cache.get(key)
+        if ret is None:
+            ret = self._token_counter([message]) - self._get_base_tokens()
+            self._cache.put(key, ret)
+        return ret
+
+    def find_message_count(self, message: BaseMessage) -> Optional[int]:
+        return self._cache.get(self._build_key(message))
+
+    def add_message_count(self, message: BaseMessage, tokens: int):
+        self._cache.put(self._build_key(message), tokens)
+
+    def for_messages(self, messages: List[BaseMessage]) -> Callable[[List[BaseMessage]], int]:
+        # precompute prefix sums so counting any prefix of the given messages (which is what trimming does) requires no tokenization at all
+        prefix_sums = [0, *accumulate(self.count_message(m) for m in messages)]
+        base_tokens = self._get_base_tokens()
+
+        def counter(prefix: List[BaseMessage]) -> int:
+            length = len(prefix)
+            if length <= len(messages) and (length == 0 or (prefix[0] is messages[0] and prefix[-1] is messages[length - 1])):
+                return base_tokens + prefix_sums[length]
+            return self(prefix)
+
+        return counter
+
+    def _get_base_tokens(self) -> int:
+        # some counters add fixed tokens to every count (eg: OpenAI adds tokens for priming the reply)
+        if self._base_tokens is None:
+            self._base_tokens = self._token_counter([])
+        return self._base_tokens
+
+    def _build_key(self, message: BaseMessage) -> tuple[str, str]:
+        content = json.dumps([message.type, message.content, getattr(message, "tool_calls", None)], default=str, sort_keys=True)
+        return (self._model_id, hashlib.sha256(content.encode()).hexdigest())
@@ -101,6 +101,9 @@ class ThreadMessage(CamelCaseModel, table=True):
     feedback_text: Optional[str] = None
     has_positive_feedback: Optional[bool] = None
     status_updates: Optional[List] = Field(default=None, sa_column=Column(JSON))
+    # tokens of the message (including attached files contents) for the model that last answered it, to avoid recounting history
+    token_count: Optional[int] = None
+    token_count_model_id: Optional[str] = None
     files: List["ThreadMessageFile"] = Relationship(back_populates="thread_message")
 
     def update_with(self, update: ThreadMessageUpdate):
@@ -117,6 +120,16 @@ class ThreadMessageFile(CamelCaseModel, table=True):
     file: "File" = Relationship()
 
 
+# answers pending minutes saved estimation, so estimations interrupted by restarts are recovered.
+# claimed_until avoids several processes estimating the same answer at once
+class MinutesSavedEstimation(SQLModel, table=True):
+    __tablename__ : Any = "minutes_saved_estimation"
+    answer_message_id: int = Field(primary_key=True, default=None, foreign_key="thread_message.id", ondelete="CASCADE")
+    thread_id: int
+    user_id: int
+    claimed_until: datetime = Field(index=True)
+
+
 # Explicitly declared fastapi response model due to "feedback" field being ignored otherwise
 class ThreadMessagePublic(CamelCaseModel, table=False):
     id: int
@@ -1,9 +1,13 @@
 import asyncio
 import base64
-from collections.abc import AsyncIterator
+from collections.abc import AsyncIterator, Awaitable
 from contextlib import AsyncExitStack
+from dataclasses import dataclass, replace
 from datetime import datetime, timezone
+import hashlib
 import json
+import logging
+import time
 from typing import Callable, List, Any, cast, Optional
 
 from langchain_core.language_models import BaseChatModel
@@ -18,21 +22,27 @@ from langchain_core.messages.utils import _is_message_type
 from langchain_core.tools import tool, BaseTool
 from langchain_core.utils.function_calling import convert_to_openai_tool
 from langgraph.prebuilt import create_react_agent
-from langgraph.prebuilt.tool_node import ToolNode
+from langgraph.prebuilt.tool_node import ToolNode, ToolCallRequest
+from langgraph.types import Command
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from ..agents.domain import Agent
+from ..agents.domain import Agent, AgentToolConfig
 from ..agents.repos import AgentToolConfigRepository
 from ..ai_models import ai_factory
+from ..ai_models.domain import LlmModel
 from ..ai_models.repos import AiModelRepository
+from ..core import repos as repos_module
 from ..core.env import env
-from ..threads.core import trim_messages_to_fit_model
+from ..threads.core import trim_messages_to_fit_model, agent_graph_cache, LruCache, MessageTokenCounter
 from ..tools.core import AgentTool, AgentToolMetadata
 from ..tools.repos import ToolRepository
 from ..usage.domain import MessageUsage
 from .domain import ThreadMessage, ThreadMessageOrigin, MAX_THREAD_NAME_LENGTH, AgentEvent, AgentActionEvent, AgentFileEvent, AgentMessageEvent, AgentAction, ModelRateLimitError
 
 
+logger = logging.getLogger(__name__)
+
+
 # adding this tool because we are going to add more tools in the future and right now
 # is easier to add a lame tool and make it work with it than without any tools
 @tool
@@ -41,6 +51,123 @@ def clock() -> str:
     return f"{datetime.now(timezone.utc)}."
 
 
+# Tools of each run are passed in the run configuration so compiled agents can be shared between users and threads
+_RUN_TOOLS_CONFIG_KEY = "run_tools"
+
+
+@dataclass
+class LoadedTools:
+    tool_configs: List[AgentToolConfig]
+    agent_tools: List[AgentTool]
+    tools: List[BaseTool]
+    # tools which took too long to load and are not available for the run
+    timed_out: List[AgentTool]
+
+
+@dataclass
+class CompiledAgent:
+    graph: Any
+    llm: BaseChatModel
+    tools: List[BaseTool]
+    prompt_overhead: "PromptOverheadCounter"
+    message_token_counter: MessageTokenCounter
+
+
+@dataclass
+class PromptOverheadStats:
+    hits: int = 0
+    misses: int = 0
+    total_seconds: float = 0.0
+    last_seconds: float = 0.0
+
+
+prompt_overhead_stats = PromptOverheadStats()
+# tools tokens by model and tools schema fingerprint, shared by all agents using the same set of tools
+_tools_tokens_cache: LruCache[tuple[str, str], int] = LruCache(env.tools_tokens_cache_max_size)
+# messages tokens by model and message content hash, shared by all threads
+_message_tokens_cache: LruCache[tuple[str, str], int] = LruCache(env.message_tokens_cache_max_size)
+
+
+def get_prompt_overhead_stats() -> PromptOverheadStats:
+    return prompt_overhead_stats
+
+
+class PromptOverheadCounter:
+    """
+    Counts the tokens that are sent to the model on every step besides the conversation messages (tool schemas and system prompt).
+
+    Tool schemas and system prompt don't change during a run, and only change between runs when the agent is updated,
+    so they are only tokenized once instead of on every step of the ReAct loop.
+    """
+
+    def __init__(self, llm: BaseChatModel, tools: List[BaseTool], model_id: str, tools_fingerprint: str):
+        self._llm = llm
+        self._tools = tools
+        self._tools_key = (model_id, tools_fingerprint)
+        self._system_prompt_tokens: Optional[tuple[Any, int]] = None
+
+    def count(self, system_message: BaseMessage) -> int:
+        return self.count_tools_tokens() + self._count_system_prompt_tokens(system_message)
+
+    def count_tools_tokens(self) -> int:
+        ret = _tools_tokens_cache.get(self._tools_key)
+        if ret is None:
+            ret = self._measure(lambda: AgentEngine._count_tools_tokens(self._tools, self._llm))
+            _tools_tokens_cache.put(self._tools_key, ret)
+        else:
+            prompt_overhead_stats.hits += 1
+        return ret
+
+    def _count_system_prompt_tokens(self, system_message: BaseMessage) -> int:
+        if self._system_prompt_tokens is None or self._system_prompt_tokens[0] != system_message.content:
+            tokens = self._measure(lambda: self._llm.get_num_tokens_from_messages([system_message]))
+            self._system_prompt_tokens = (system_message.content, tokens)
+        else:
+            prompt_overhead_stats.hits += 1
+        return self._system_prompt_tokens[1]
+
+    def _measure(self, counter: Callable[[], int]) -> int:
+        start = time.perf_counter()
+        ret = counter()
+        elapsed = time.perf_counter() - start
+        prompt_overhead_stats.misses += 1
+        prompt_overhead_stats.total_seconds += elapsed
+        prompt_overhead_stats.last_seconds = elapsed
+        logger.debug(f"Counted {ret} prompt overhead tokens for {self._tools_key[0]} in {elapsed * 1000:.1f} ms ({prompt_overhead_stats})")
+        return ret
+
+
+class RunBoundTool(BaseTool):
+    """
+    Placeholder of a tool registered in a compiled (and cached) agent.
+
+    It exposes the same schema as the tool it was built from, but it holds no user, thread or db state.
+    The actual tool instance of each run is resolved when the tool is called (check _invoke_run_tool).
+    """
+
+    def __init__(self, source: BaseTool):
+        super().__init__(
+            name=source.name,
+            description=source.description,
+            args_schema=source.args_schema,
+            return_direct=source.return_direct,
+            response_format=source.response_format,
+        )
+        self._input_schema = source.get_input_schema()
+
+    def get_input_schema(self, config: Any = None) -> Any:
+        return self._input_schema
+
+    def _run(self, *args: Any, **kwargs: Any) -> Any:
+        raise RuntimeError(f"Tool {self.name} is not bound to any agent run")
+
+
+async def _invoke_run_tool(request: ToolCallRequest, execute: Callable[[ToolCallRequest], Awaitable[ToolMessage | Command]]) -> ToolMessage | Command:
+    run_tools = request.runtime.config.get("configurable", {}).get(_RUN_TOOLS_CONFIG_KEY, {})
+    # override only supports replacing the tool call, but the request is a dataclass so the tool can be replaced as well
+    return await execute(replace(request, tool=run_tools.get(request.tool_call["name"], request.tool)))
+
+
 class AgentEngine:
     _MEMORY_INPUT_KEY = "input"
 
@@ -50,38 +177,88 @@ class AgentEngine:
         self._db = db
 
     async def load_tools(self, stack: AsyncExitStack, thread_id: Optional[int] = None) -> List[AgentTool]:
+        ret = await self._load_tools(stack, thread_id, build_langchain_tools=False)
+        return ret.agent_tools
+
+    # tools are loaded concurrently so the time to load all of them is the time of the slowest one instead of the sum of all
+    async def _load_tools(self, stack: AsyncExitStack, thread_id: Optional[int], build_langchain_tools: bool = True) -> LoadedTools:
         tool_configs = await AgentToolConfigRepository(self._db).find_by_agent_id(
             agent_id=self._agent.id
         )
-        ret = []
+        agent_tools = []
         for tc in tool_configs:
             agent_tool = ToolRepository().find_by_id(tc.tool_id)
             if not agent_tool:
                 raise ValueError(f"Tool {tc.tool_id} not found")
-            agent_tool.configure(self._agent, self._user_id, tc.config, self._db, thread_id=thread_id)
-            tool = await stack.enter_async_context(agent_tool.load())
-            ret.append(tool)
-        return ret
+            agent_tools.append(agent_tool)
+        semaphore = asyncio.Semaphore(env.tool_load_max_concurrency)
+        results = await asyncio.gather(
+            *[self._load_tool(agent_tool, tc.config, thread_id, semaphore) for agent_tool, tc in zip(agent_tools, tool_configs)],
+            return_exceptions=True)
+        loaded = [r for r in results if isinstance(r, tuple)]
+        error = next((r for r in results if isinstance(r, BaseException)), None)
+        if error:
+            for tool_stack, _ in reversed(loaded):
+                await tool_stack.aclose()
+            raise error
+        # tools are registered in the stack in configuration order so they are unloaded in reverse order, as when loaded sequentially
+        for tool_stack, _ in loaded:
+            await stack.enter_async_context(tool_stack)
+        loaded_tools = [tool for _, tool in loaded]
+        return LoadedTools(
+            tool_configs=tool_configs,
+            agent_tools=loaded_tools,
+            # langchain tools are built once loaded, since they may use the request db session
+            tools=[t for tool in loaded_tools for t in await tool.build_langchain_tools()] if build_langchain_tools else [],
+            timed_out=[agent_tool for agent_tool, r in zip(agent_tools, results) if r is None])
+
+    async def _load_tool(self, agent_tool: AgentTool, config: dict, thread_id: Optional[int], semaphore: asyncio.Semaphore) \
+            -> Optional[tuple[AsyncExitStack, AgentTool]]:
+        async with semaphore:
+            tool_stack = AsyncExitStack()
+            try:
+                timeout = asyncio.timeout(env.tool_load_timeout_seconds)
+                try:
+                    async with timeout:
+                        # a session can't be used concurrently, so each tool uses its own one while loading, which is closed once loaded
+                        async with AsyncSession(repos_module.engine, expire_on_commit=False) as db:
+                            agent_tool.configure(self._agent, self._user_id, config, db, thread_id=thread_id)
+                            tool = await tool_stack.enter_async_context(agent_tool.load())
+                except TimeoutError:
+                    # timeouts raised by the tool itself are errors of the tool, not a slow load
+                    if not timeout.expired():
+                        raise
+                    await tool_stack.aclose()
+                    logger.warning(f"Tool {agent_tool.id} of agent {self._agent.id} took more than {env.tool_load_timeout_seconds} seconds to load, skipping it")
+                    return None
+                # once loaded, tools use the request session (as when loaded sequentially) instead of holding a connection each.
+                # Objects bound to a session (like oauth clients) are built by tools from the session they are configured with when used
+                tool.configure(self._agent, self._user_id, config, self._db, thread_id=thread_id)
+                return tool_stack, tool
+            except BaseException:
+                await tool_stack.aclose()
+                raise
 
     async def answer(self, messages: List[ThreadMessage], message_usage: MessageUsage, stop_event: asyncio.Event) -> AsyncIterator[AgentEvent]:
         provider = ai_factory.get_provider(self._agent.model.id)
-        llm = provider.build_streaming_chat_model(self._agent.model.id, self._agent.model_temperature,  self._agent.model_reasoning_effort)
         async with AsyncExitStack() as stack:
-            agent_tools = await self.load_tools(stack, thread_id=messages[0].thread_id)
-            tools = [ lt for t in agent_tools for lt in await t.build_langchain_tools() ]
-            tools.append(clock)
-            # Enable error handling so ToolException from MCP tools (execution errors)
-            # are shown to the LLM instead of crashing the agent
-            agent = create_react_agent(
-                llm, ToolNode(tools, handle_tool_errors=True), pre_model_hook=self._build_message_trimmer(llm, tools)
-            )
+            loaded_tools = await self._load_tools(stack, thread_id=messages[0].thread_id)
+            for agent_tool in loaded_tools.timed_out:
+                yield AgentActionEvent(action=AgentAction.TOOL_ERROR, tool_name=agent_tool.name, description="Tool took too long to load and is not available")
+            tools = [*loaded_tools.tools, clock]
+            compiled_agent = self._find_compiled_agent(loaded_tools.tool_configs, tools)
+            llm = compiled_agent.llm
 
             input = self._build_input(messages)
+            # first message is the system prompt
+            history = list(zip(messages, input["messages"][1:]))
+            self._load_message_token_counts(history, compiled_agent.message_token_counter)
             generated_content = ""
-            stream = agent.astream(
+            stream = compiled_agent.graph.astream(
                 input,
                 {
-                    "recursion_limit": self._agent.recursion_limit
+                    "recursion_limit": self._agent.recursion_limit,
+                    "configurable": {_RUN_TOOLS_CONFIG_KEY: {t.name: t for t in tools}},
                 },
                 stream_mode=["updates", "messages", "custom"],
             )
@@ -118,7 +295,7 @@ class AgentEngine:
 
             # If the response was stopped, approximate the token usage
             if stop_event.is_set():
-                approximate_input_tokens = llm.get_num_tokens_from_messages(input["messages"]) + self._count_tools_tokens(tools, llm)
+                approximate_input_tokens = compiled_agent.message_token_counter(input["messages"]) + compiled_agent.prompt_overhead.count_tools_tokens()
                 approximate_output_tokens = llm.get_num_tokens(generated_content) if generated_content else 0
                 message_usage.increment_with_metadata(
                     {
@@ -127,6 +304,65 @@ class AgentEngine:
                         "total_tokens": approximate_input_tokens + approximate_output_tokens
                     }, self._agent.model)
 
+            self._save_message_token_counts(history, compiled_agent.message_token_counter)
+
+    def _find_compiled_agent(self, tool_configs: List[AgentToolConfig], tools: List[BaseTool]) -> CompiledAgent:
+        tools_fingerprint = self._build_tools_fingerprint(tools)
+        key = (
+            self._agent.id,
+            self._agent.last_update,
+            self._agent.model.id,
+            self._agent.model_temperature,
+            self._agent.model_reasoning_effort,
+            self._build_tool_configs_fingerprint(tool_configs),
+            # tools exposed by a tool (eg: MCP servers) might change without any change in the tool config
+            tools_fingerprint,
+        )
+        ret = agent_graph_cache.get(key)
+        if ret is None:
+            ret = self._compile_agent(tools, tools_fingerprint)
+            agent_graph_cache.put(key, ret)
+        return ret
+
+    def _build_tool_configs_fingerprint(self, tool_configs: List[AgentToolConfig]) -> str:
+        configs = sorted(((tc.tool_id, tc.config) for tc in tool_configs), key=lambda c: c[0])
+        return hashlib.sha256(json.dumps(configs, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _build_tools_fingerprint(self, tools: List[BaseTool]) -> str:
+        schemas = [[convert_to_openai_tool(t), t.return_direct] for t in tools]
+        return hashlib.sha256(json.dumps(schemas, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _compile_agent(self, tools: List[BaseTool], tools_fingerprint: str) -> CompiledAgent:
+        provider = ai_factory.get_provider(self._agent.model.id)
+        llm = provider.build_streaming_chat_model(self._agent.model.id, self._agent.model_temperature,  self._agent.model_reasoning_effort)
+        graph_tools: List[BaseTool] = [RunBoundTool(t) for t in tools]
+        prompt_overhead = PromptOverheadCounter(llm, graph_tools, self._agent.model.id, tools_fingerprint)
+        message_token_counter = MessageTokenCounter(llm.get_num_tokens_from_messages, self._agent.model.id, _message_tokens_cache)
+        # Enable error handling so ToolException from MCP tools (execution errors)
+        # are shown to the LLM instead of crashing the agent
+        graph = create_react_agent(
+            llm,
+            ToolNode(graph_tools, handle_tool_errors=True, awrap_tool_call=_invoke_run_tool),
+            pre_model_hook=self._build_message_trimmer(message_token_counter, prompt_overhead, self._agent.model)
+        )
+        return CompiledAgent(graph=graph, llm=llm, tools=graph_tools, prompt_overhead=prompt_overhead,
+            message_token_counter=message_token_counter)
+
+    def _load_message_token_counts(self, history: List[tuple[ThreadMessage, BaseMessage]], counter: MessageTokenCounter):
+        for message, input_message in history:
+            if message.token_count is not None and message.token_count_model_id == self._agent.model.id:
+                counter.add_message_count(input_message, message.token_count)
+
+    # counts are persisted with the next commit of the session the messages belong to
+    def _save_message_token_counts(self, history: List[tuple[ThreadMessage, BaseMessage]], counter: MessageTokenCounter):
+        for message, input_message in history:
+            if message.token_count_model_id == self._agent.model.id:
+                continue
+            token_count = counter.find_message_count(input_message)
+            if token_count is not None:
+                message.token_count = token_count
+                message.token_count_model_id = self._agent.model.id
+
     def _get_content(self, msg: str | list[str | dict]) -> str:
         if isinstance(msg, str):
             return msg
@@ -170,8 +406,10 @@ class AgentEngine:
                     result.append(tool_calls["name"])
                 yield AgentActionEvent(action=AgentAction.PLANNING, result=result)
 
+    # this is a static method to avoid compiled agents (which are shared between users and threads) keeping a reference to the engine
+    @staticmethod
     def _build_message_trimmer(
-        self, llm: BaseChatModel, tools: List[BaseTool]
+        token_counter: MessageTokenCounter, prompt_overhead: PromptOverheadCounter, model: LlmModel
     ) -> Callable[[Any], Any]:
         def pre_model_hook(state):
             # this is mostly the same logic (but simplified) as invoking langchain trim_messages with last strategy and allow partial
@@ -181,7 +419,6 @@ class AgentEngine:
             messages = state["messages"]
             system_message = messages[0]
             messages = messages[1:]
-            token_counter = llm.get_num_tokens_from_messages
 
             # Reverse messages to use _first_max_tokens with reversed logic
             messages = messages[::-1]
@@ -193,14 +430,12 @@ class AgentEngine:
             )
             messages = messages[end_index:]
 
-            tools_tokens = self._count_tools_tokens(tools, llm)
-            system_message_tokens = token_counter([system_message])
-            reserved_tokens = tools_tokens + system_message_tokens
+            reserved_tokens = prompt_overhead.count(system_message)
 
             result = trim_messages_to_fit_model(
                 messages,
                 token_counter=token_counter,
-                model=self._agent.model,
+                model=model,
                 reserved_tokens=reserved_tokens,
                 end_on=HumanMessage,
             )
@@ -209,7 +444,8 @@ class AgentEngine:
 
         return pre_model_hook
 
-    def _count_tools_tokens(self, tools: List[BaseTool], llm: BaseChatModel) -> int:
+    @staticmethod
+    def _count_tools_tokens(tools: List[BaseTool], llm: BaseChatModel) -> int:
         openai_tools = [convert_to_openai_tool(tool) for tool in tools]
         tools_json = json.dumps(openai_tools)
         return llm.get_num_tokens(tools_json)
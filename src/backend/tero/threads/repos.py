@@ -1,14 +1,18 @@
-from datetime import datetime
-from typing import Optional, List
+from datetime import datetime, timezone
+from typing import Optional, List, cast
 
-from sqlalchemy.orm import selectinload, aliased
-from sqlmodel import select, func, or_, and_, col, delete
+from sqlalchemy import literal
+from sqlalchemy.orm import Load, selectinload, aliased, defer, joinedload
+from sqlmodel import select, func, or_, and_, col, delete, update
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from ..agents.domain import Agent
 from ..core.repos import attr, scalar
 from ..files.domain import File
-from .domain import Thread, ThreadListItem, ThreadMessage, ThreadMessageFile
+from ..files.repos import FileRepository
+from ..usage.domain import MessageUsage, Usage
+from ..usage.repos import UsageRepository
+from .domain import Thread, ThreadListItem, ThreadMessage, ThreadMessageFile, MinutesSavedEstimation
 
 
 class ThreadRepository:
@@ -77,6 +81,11 @@ class ThreadRepository:
         await self._db.refresh(merged_thread)
         return merged_thread
 
+    async def update_name(self, thread_id: int, name: str):
+        stmt = scalar(update(Thread).where(and_(Thread.id == thread_id)).values(name=name))
+        await self._db.exec(stmt)
+        await self._db.commit()
+
     async def find_empty_thread(self, agent_id: int, user_id: int) -> Optional[Thread]:
         stmt = (
             select(Thread)
@@ -110,27 +119,35 @@ class ThreadMessageRepository:
 
     async def refresh_with_files(self, thread_message: ThreadMessage) -> ThreadMessage:
         self._db.expire(thread_message, ['files'])
+        return cast(ThreadMessage, await self.find_by_id(thread_message.id))
+
+    # loads files contents, which are only required when answering the message
+    async def find_with_file_contents_by_id(self, message_id: int) -> Optional[ThreadMessage]:
         stmt = (
             select(ThreadMessage)
-            .where(ThreadMessage.id == thread_message.id)
-            .options(
-                selectinload(attr(ThreadMessage.files)).selectinload(attr(ThreadMessageFile.file))
-            ))
+            .where(ThreadMessage.id == message_id)
+            .options(_load_file_contents()))
         ret = await self._db.exec(stmt)
-        return ret.one()
+        return ret.one_or_none()
 
     async def update(self, thread_message: ThreadMessage):
         self._db.add(thread_message)
         await self._db.commit()
 
+    # only sets the estimated minutes when not already set, to avoid overriding the ones provided by users in feedback
+    async def update_missing_minutes_saved(self, message_id: int, minutes_saved: int):
+        stmt = scalar(update(ThreadMessage)
+            .where(and_(ThreadMessage.id == message_id, col(ThreadMessage.minutes_saved).is_(None)))
+            .values(minutes_saved=minutes_saved))
+        await self._db.exec(stmt)
+        await self._db.commit()
+
     async def find_by_thread_id(self, thread_id: int) -> List[ThreadMessage]:
         stmt = (
             select(ThreadMessage)
             .where(and_(ThreadMessage.thread_id == thread_id))
             .order_by(col(ThreadMessage.timestamp))
-            .options(
-                selectinload(attr(ThreadMessage.files)).selectinload(attr(ThreadMessageFile.file))
-            ))
+            .options(_load_file_metadata()))
         ret = await self._db.exec(stmt)
         return list(ret.all())
 
@@ -145,24 +162,30 @@ class ThreadMessageRepository:
         return ret.first()
 
     async def find_previous_messages(self, message: ThreadMessage) -> List[ThreadMessage]:
-        parents: List[ThreadMessage] = []
-        current = message
-        while current.parent_id is not None:
-            parent = await self.find_by_id(current.parent_id)
-            if parent is None:
-                break
-            parents.append(parent)
-            current = parent
-        parents.reverse()
-        return parents
+        if message.parent_id is None:
+            return []
+        # walk the parent chain in one query instead of one query per ancestor
+        ancestors = (
+            select(col(ThreadMessage.id).label("id"), col(ThreadMessage.parent_id).label("parent_id"), literal(1).label("depth"))
+            .where(ThreadMessage.id == message.parent_id)
+            .cte("ancestors", recursive=True))
+        parent = aliased(ThreadMessage)
+        ancestors = ancestors.union_all(
+            select(col(parent.id), col(parent.parent_id), ancestors.c.depth + 1)
+            .join(ancestors, col(parent.id) == ancestors.c.parent_id))
+        stmt = (
+            select(ThreadMessage)
+            .join(ancestors, col(ThreadMessage.id) == ancestors.c.id)
+            .order_by(ancestors.c.depth.desc())
+            .options(_load_file_contents()))
+        ret = await self._db.exec(stmt)
+        return list(ret.all())
 
     async def find_by_id(self, message_id: int) -> Optional[ThreadMessage]:
         stmt = (
             select(ThreadMessage)
             .where(ThreadMessage.id == message_id)
-            .options(
-                selectinload(attr(ThreadMessage.files)).selectinload(attr(ThreadMessageFile.file))
-            ))
+            .options(_load_file_metadata()))
         ret = await self._db.exec(stmt)
         return ret.one_or_none()
 
@@ -222,6 +245,73 @@ class ThreadMessageRepository:
         await self._db.commit()
 
 
+# avoids loading files contents (which may be quite big) when only their metadata is required (eg: when listing messages)
+def _load_file_metadata() -> Load:
+    return _load_files().options(defer(attr(File.processed_content)))
+
+
+def _load_file_contents() -> Load:
+    return _load_files().options(joinedload(attr(File.blob)))
+
+
+def _load_files() -> Load:
+    return Load(ThreadMessage).selectinload(attr(ThreadMessage.files)).selectinload(attr(ThreadMessageFile.file))
+
+
+class ThreadTurnRepository:
+    """
+    Saves everything generated while answering a message (answer, its files and usage) in one transaction,
+    avoiding a commit per row at the end of each answer.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self._db = db
+
+    async def add(self, message: ThreadMessage, file_ids: List[int], usage: Optional[MessageUsage],
+                  minutes_saved_estimation: Optional[MinutesSavedEstimation] = None) -> ThreadMessage:
+        try:
+            self._db.add(message)
+            # flush to get the message id required by files
+            await self._db.flush()
+            self._db.add_all([ThreadMessageFile(thread_message_id=message.id, file_id=file_id) for file_id in file_ids])
+            if minutes_saved_estimation:
+                minutes_saved_estimation.answer_message_id = message.id
+                self._db.add(minutes_saved_estimation)
+            UsageRepository(self._db).add_pending(usage)
+            await self._db.commit()
+        except BaseException:
+            await self._db.rollback()
+            raise
+        return message
+
+
+class MinutesSavedEstimationRepository:
+
+    def __init__(self, db: AsyncSession):
+        self._db = db
+
+    # claims estimations not claimed by any process (or whose claim expired) until the given time.
+    # Locked rows are skipped so concurrent claims from other processes don't wait for each other nor get the same estimations
+    async def claim_expired(self, claimed_until: datetime, limit: int) -> List[MinutesSavedEstimation]:
+        expired = (select(MinutesSavedEstimation.answer_message_id)
+            .where(MinutesSavedEstimation.claimed_until <= datetime.now(timezone.utc))
+            .order_by(col(MinutesSavedEstimation.claimed_until))
+            .limit(limit)
+            .with_for_update(skip_locked=True))
+        stmt = (update(MinutesSavedEstimation)
+            .where(col(MinutesSavedEstimation.answer_message_id).in_(expired))
+            .values(claimed_until=claimed_until)
+            .returning(MinutesSavedEstimation))
+        ret = list((await self._db.execute(stmt)).scalars().all())
+        await self._db.commit()
+        return ret
+
+    async def delete(self, answer_message_id: int):
+        stmt = scalar(delete(MinutesSavedEstimation).where(col(MinutesSavedEstimation.answer_message_id) == answer_message_id))
+        await self._db.exec(stmt)
+        await self._db.commit()
+
+
 class ThreadMessageFileRepository:
     def __init__(self, db: AsyncSession):
         self._db = db
@@ -232,6 +322,24 @@ class ThreadMessageFileRepository:
         await self._db.refresh(thread_message_file)
         return thread_message_file
 
+    # saves files uploaded with a message, their links to the message and their usage in one transaction.
+    # Usage is saved even without files, since it is paid even when processing files fails
+    async def add_uploaded(self, thread_message_id: int, files: List[File], usages: List[Usage]):
+        try:
+            file_repo = FileRepository(self._db)
+            for file in files:
+                await file_repo.add_pending(file)
+            # flush to get the files ids required by links
+            await self._db.flush()
+            self._db.add_all([ThreadMessageFile(thread_message_id=thread_message_id, file_id=file.id) for file in files])
+            usage_repo = UsageRepository(self._db)
+            for usage in usages:
+                usage_repo.add_pending(usage)
+            await self._db.commit()
+        except BaseException:
+            await self._db.rollback()
+            raise
+
     async def find_by_thread_id_and_file_id(self, thread_id: int, file_id: int) -> Optional[ThreadMessageFile]:
         stmt = (select(ThreadMessageFile)
             .join(ThreadMessage, and_(ThreadMessageFile.thread_message_id == ThreadMessage.id, ThreadMessage.thread_id == thread_id))
@@ -240,12 +348,13 @@ class ThreadMessageFileRepository:
         ret = await self._db.exec(stmt)
         return ret.one_or_none()
 
-    async def find_with_content_by_ids(self, thread_id: int, file_id: int) -> Optional[File]:
+    async def find_file_by_ids(self, thread_id: int, file_id: int) -> Optional[File]:
         stmt = (select(File)
             .join(ThreadMessageFile, and_(ThreadMessageFile.file_id == File.id))
             .join(ThreadMessage, and_(ThreadMessageFile.thread_message_id == ThreadMessage.id, ThreadMessage.thread_id == thread_id))
             .where(File.id == file_id)
-            .limit(1))
+            .limit(1)
+            .options(defer(attr(File.processed_content))))
         ret = await self._db.exec(stmt)
         return ret.one_or_none()
 
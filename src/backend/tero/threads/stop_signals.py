@@ -0,0 +1,110 @@
+import asyncio
+import json
+import logging
+from typing import Optional
+import uuid
+
+import psycopg
+from psycopg import sql
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..core import repos
+from ..core.env import env
+
+
+logger = logging.getLogger(__name__)
+_STOP_CHANNEL = "thread_stop"
+_STOP_ACK_CHANNEL = "thread_stop_ack"
+_LISTEN_TIMEOUT_SECONDS = 1
+_RECONNECT_DELAY_SECONDS = 2
+
+
+class ThreadStopSignals:
+    """
+    Allows stopping answers being streamed by any process of the cluster.
+
+    Each process keeps the stop events of the answers it streams, and listens (with postgres LISTEN/NOTIFY) for stop requests
+    of other processes. A process receiving a stop request for an answer it streams, sets its stop event and acknowledges the request,
+    so the requester can tell if any process was streaming the answer. Registrations only live in the memory of each process,
+    so nothing needs to be cleaned up when a process exits abnormally.
+    """
+
+    def __init__(self, ack_timeout_seconds: int):
+        self._ack_timeout_seconds = ack_timeout_seconds
+        self._stop_events: dict[int, asyncio.Event] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    def register(self, thread_id: int) -> asyncio.Event:
+        self._start_listener()
+        ret = asyncio.Event()
+        self._stop_events[thread_id] = ret
+        return ret
+
+    def unregister(self, thread_id: int, stop_event: asyncio.Event):
+        # the thread might have been registered again by a newer answer
+        if self._stop_events.get(thread_id) is stop_event:
+            del self._stop_events[thread_id]
+
+    async def stop(self, thread_id: int) -> bool:
+        stop_event = self._stop_events.get(thread_id)
+        if stop_event:
+            stop_event.set()
+            return True
+        if not _is_postgres():
+            return False
+        request_id = str(uuid.uuid4())
+        acknowledged = asyncio.Event()
+
+        def on_notify(notify: psycopg.Notify):
+            if notify.channel == _STOP_ACK_CHANNEL and json.loads(notify.payload)["request_id"] == request_id:
+                acknowledged.set()
+
+        async with await psycopg.AsyncConnection.connect(repos.get_psycopg_db_url(), autocommit=True) as conn:
+            # the handler gets notifications received at any point, even the ones received while sending the stop request
+            conn.add_notify_handler(on_notify)
+            await conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(_STOP_ACK_CHANNEL)))
+            await conn.execute("SELECT pg_notify(%s, %s)", (_STOP_CHANNEL, json.dumps({"thread_id": thread_id, "request_id": request_id})))
+            try:
+                async with asyncio.timeout(self._ack_timeout_seconds):
+                    while not acknowledged.is_set():
+                        async for notify in conn.notifies(timeout=_LISTEN_TIMEOUT_SECONDS, stop_after=1):
+                            on_notify(notify)
+            except TimeoutError:
+                return False
+        return True
+
+    def _start_listener(self):
+        # the listener is bound to the event loop where it runs, so a new one is started if the loop changes (eg: between tests)
+        if _is_postgres() and (self._listener is None or self._listener.done() or self._listener.get_loop() is not asyncio.get_running_loop()):
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while self._stop_events:
+            try:
+                async with await psycopg.AsyncConnection.connect(repos.get_psycopg_db_url(), autocommit=True) as conn:
+                    await conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(_STOP_CHANNEL)))
+                    while self._stop_events:
+                        async for notify in conn.notifies(timeout=_LISTEN_TIMEOUT_SECONDS):
+                            await self._handle_stop_request(json.loads(notify.payload))
+            except Exception:
+                # DB or LISTEN/NOTIFY connection may fail; wait before retrying to avoid tight loops
+                logger.warning("Error listening for thread stop requests", exc_info=True)
+                await asyncio.sleep(_RECONNECT_DELAY_SECONDS)
+
+    async def _handle_stop_request(self, payload: dict):
+        stop_event = self._stop_events.get(payload["thread_id"])
+        if not stop_event:
+            return
+        stop_event.set()
+        async with AsyncSession(repos.engine) as db:
+            await db.execute(text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": _STOP_ACK_CHANNEL, "payload": json.dumps({"request_id": payload["request_id"]})})
+            await db.commit()
+
+
+def _is_postgres() -> bool:
+    return repos.engine.dialect.name == "postgresql"
+
+
+thread_stop_signals = ThreadStopSignals(env.thread_stop_ack_timeout_seconds)
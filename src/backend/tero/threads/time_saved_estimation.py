@@ -1,5 +1,9 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
 import logging
-from typing import List, cast
+import time
+from typing import List, Optional, cast
 
 from langchain_core.messages import (
     SystemMessage,
@@ -16,7 +20,7 @@ from ..core.env import env
 from ..threads.core import trim_messages_to_fit_model
 from ..threads.repos import ThreadMessageRepository
 from ..usage.domain import MessageUsage
-from .domain import Thread, ThreadMessage, ThreadMessageOrigin
+from .domain import Thread, ThreadMessage, ThreadMessageOrigin, ModelRateLimitError
 
 
 logger = logging.getLogger(__name__)
@@ -73,7 +77,12 @@ async def estimate_minutes_saved(user_message: str, agent_response: str, thread:
         reference_examples=_add_reference_examples(feedback_messages, trimmed_messages)
     )
 
-    response = await llm.ainvoke([SystemMessage(system_prompt)])
+    try:
+        response = await llm.ainvoke([SystemMessage(system_prompt)])
+    except Exception as e:
+        if ai_factory.get_provider(evaluator_model_id).is_rate_limit_error(e):
+            raise ModelRateLimitError() from e
+        raise
     try:
         return int(response.content.strip())
     except ValueError:
@@ -102,6 +111,119 @@ Minutes saved: {minutes_saved}""")
     return "\n".join(examples) if examples else "[NO REFERENCE EXAMPLES]"
 
 
+@dataclass
+class MinutesSavedEstimationJob:
+    answer_message_id: int
+    thread_id: int
+    user_id: int
+    attempt: int = 0
+
+
+MinutesSavedEstimator = Callable[[MinutesSavedEstimationJob], Awaitable[None]]
+# claims up to the given number of pending estimations, so they are not processed by other processes meanwhile
+MinutesSavedEstimationClaimer = Callable[[int], Awaitable[List[MinutesSavedEstimationJob]]]
+
+
+class MinutesSavedEstimationQueue:
+    """
+    Estimates the minutes saved by answers in background, so answers are not delayed by the estimation.
+
+    A fixed pool of workers continuously takes jobs from the queue, and jobs are retried with exponential backoff when the
+    evaluator model is rate limited (pausing the processing meanwhile). The queue is bounded and never blocks producers: jobs
+    that don't fit are dropped and later recovered by sweeps, which claim the estimations persisted as pending (eg: by a
+    restart or by exhausting retries).
+    """
+
+    def __init__(self, estimator: MinutesSavedEstimator, claimer: MinutesSavedEstimationClaimer, max_size: int, max_concurrency: int,
+                 max_retries: int, retry_delay_seconds: int):
+        self._estimator = estimator
+        self._claimer = claimer
+        self._max_size = max_size
+        self._max_concurrency = max_concurrency
+        self._max_retries = max_retries
+        self._retry_delay_seconds = retry_delay_seconds
+        self._queue: Optional[asyncio.Queue[MinutesSavedEstimationJob]] = None
+        self._workers: List[asyncio.Task] = []
+        # ids of answers queued or being estimated, to avoid sweeps queueing them again
+        self._pending: set[int] = set()
+        self._resume_at = 0.0
+
+    def put_nowait(self, job: MinutesSavedEstimationJob):
+        if job.answer_message_id in self._pending:
+            return
+        if self._enqueue(job, self._start_workers()):
+            self._pending.add(job.answer_message_id)
+
+    async def join(self):
+        if self._queue:
+            await self._queue.join()
+
+    async def sweep(self):
+        queue = self._start_workers()
+        available = self._max_size - queue.qsize()
+        if available <= 0:
+            return
+        jobs = await self._claimer(available)
+        if jobs:
+            logger.info(f"Recovered {len(jobs)} pending minutes saved estimations")
+        for job in jobs:
+            self.put_nowait(job)
+
+    async def sweep_periodically(self, period_seconds: int):
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Problem recovering pending minutes saved estimations")
+            await asyncio.sleep(period_seconds)
+
+    def _start_workers(self) -> asyncio.Queue[MinutesSavedEstimationJob]:
+        # queues are bound to the event loop where they are used, so a new one is created if the loop changes (eg: between tests)
+        if self._queue is None or not self._workers or self._workers[0].get_loop() is not asyncio.get_running_loop():
+            self._queue = asyncio.Queue(self._max_size)
+            self._workers = []
+            self._pending = set()
+        queue = self._queue
+        self._workers = [w for w in self._workers if not w.done()]
+        self._workers += [asyncio.create_task(self._work(queue)) for _ in range(self._max_concurrency - len(self._workers))]
+        return queue
+
+    async def _work(self, queue: asyncio.Queue[MinutesSavedEstimationJob]):
+        while True:
+            job = await queue.get()
+            try:
+                pause = self._resume_at - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                await self._process_job(job, queue)
+            finally:
+                queue.task_done()
+
+    async def _process_job(self, job: MinutesSavedEstimationJob, queue: asyncio.Queue[MinutesSavedEstimationJob]):
+        try:
+            await self._estimator(job)
+        except ModelRateLimitError:
+            if job.attempt < self._max_retries:
+                self._resume_at = max(self._resume_at, time.monotonic() + self._retry_delay_seconds * 2 ** job.attempt)
+                job.attempt += 1
+                # the job is put back before marking the current one as done, so joining the queue also waits for retries
+                if self._enqueue(job, queue):
+                    return
+            else:
+                logger.warning(f"Evaluator model rate limit exceeded estimating minutes saved for message {job.answer_message_id}")
+        except Exception:
+            logger.exception(f"Problem estimating minutes saved for message {job.answer_message_id}")
+        self._pending.discard(job.answer_message_id)
+
+    def _enqueue(self, job: MinutesSavedEstimationJob, queue: asyncio.Queue[MinutesSavedEstimationJob]) -> bool:
+        try:
+            queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"Minutes saved estimation queue is full, estimation for message {job.answer_message_id} is left for sweeps")
+            return False
+
+
 SYSTEM_PROMPT = """
 You are an evaluator determining the value of an AI assistant's response to the user.
 AI assistant name and description: {agent_name} - \"\"\"{agent_description}\"\"\"
@@ -13,8 +13,9 @@ from langchain_core.callbacks import AsyncCallbackManagerForToolRun
 from langchain_core.messages import ToolMessage
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import BaseTool, StructuredTool, InjectedToolCallId
-from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.sessions import StreamableHttpConnection
 from langchain_mcp_adapters.tools import load_mcp_tools
+from mcp import ClientSession
 from sqlmodel.ext.asyncio.session import AsyncSession
 from json_schema_to_pydantic import create_model
 from pydantic import BaseModel
@@ -23,6 +24,7 @@ from ...core.env import env
 from ...files.domain import File, FileStatus, FileMetadata
 from ...files.repos import FileRepository
 from ..core import AgentTool, AgentToolConfig, load_schema, StatusUpdateCallbackHandler
+from ..mcp_sessions import mcp_session_pool
 
 
 logger = logging.getLogger(__name__)
@@ -156,15 +158,24 @@ class BrowserTool(AgentTool):
 
     @asynccontextmanager
     async def load(self) -> AsyncIterator['BrowserTool']:
-        server_name = "playwright"
-        client = MultiServerMCPClient({server_name: {"transport": "streamable_http", "url": env.browser_tool_playwright_mcp_url }})
-        async with client.session(server_name) as mcp_session:
-            self._tools = await load_mcp_tools(mcp_session)
-            self._tools = [ScreenshotPersistingTool(cast(StructuredTool, t), self.user_id, self._thread_id, cast(AsyncSession, self._db)) if t.name == "browser_take_screenshot" else t for t in self._tools]
-            for tool in self._tools:
+        async def tools_loader(mcp_session: ClientSession) -> list[BaseTool]:
+            ret = await load_mcp_tools(mcp_session)
+            for tool in ret:
                 tool.callbacks = [StatusUpdateCallbackHandler(tool.name, description=tool.description)]
+            return ret
+
+        url = env.browser_tool_playwright_mcp_url
+        # each session has its own browser context, so they are not shared between users or threads
+        session_key = ("streamable_http", url, self.user_id, self._thread_id)
+        async with mcp_session_pool.session(session_key, StreamableHttpConnection(transport="streamable_http", url=url), tools_loader) as tools:
+            self._tools = tools
             yield self
 
+    def _build_screenshot_tool(self, tool: BaseTool) -> BaseTool:
+        ret = ScreenshotPersistingTool(cast(StructuredTool, tool), self.user_id, self._thread_id, cast(AsyncSession, self._db))
+        ret.callbacks = [StatusUpdateCallbackHandler(ret.name, description=ret.description)]
+        return ret
+
     async def clone(
         self,
         agent_id: int,
@@ -178,4 +189,5 @@ class BrowserTool(AgentTool):
     async def build_langchain_tools(self) -> List[BaseTool]:
         if not self._tools:
             raise RuntimeError("Browser tool has not been set up properly")
-        return self._tools
+        # the screenshot tool is built when the tools are used, so it persists screenshots with the session the tool is configured with at that moment
+        return [self._build_screenshot_tool(t) if t.name == "browser_take_screenshot" else t for t in self._tools]
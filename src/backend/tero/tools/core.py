@@ -259,9 +259,8 @@ class AgentToolWithFiles(AgentTool, abc.ABC):
         db: AsyncSession,
     ) -> dict:
         tool_file_repo = AgentToolConfigFileRepository(db)
-        files = await tool_file_repo.find_with_content_by_agent_and_tool(
-            agent_id, tool_id
-        )
+        # cloned files reference same contents, so there is no need to load them
+        files = await tool_file_repo.find_by_agent_id_and_tool_id(agent_id, tool_id)
         file_id_map = {}
 
         for file in files:
@@ -187,10 +187,9 @@ class DocsTool(AgentToolWithFiles):
             raise ValueError("Internal generator model not found")
         return ret
 
-    @staticmethod
-    async def _build_document(file: File, file_quota: FileQuota):
+    async def _build_document(self, file: File, file_quota: FileQuota):
         metadata = {'id': str(file.id)}
-        content = await extract_file_text(file, file_quota)
+        content = await extract_file_text(file, file_quota, self.db)
         return Document(page_content=content, metadata=metadata)
 
     async def _generate_file_description(self, file: File, model: LlmModel, message_usage: MessageUsage) -> str:
@@ -52,6 +52,12 @@ class JiraTool(OpenApiTool):
     description: str = "Manage issues and track project activity"
     config_schema: dict = load_schema(__file__)
     _client_secret: Optional[str] = None
+    _oauth: Optional[AgentToolOauth] = None
+
+    def configure(self, agent: Agent, user_id: int, config: dict, db: AsyncSession, thread_id: Optional[int] = None):
+        super().configure(agent, user_id, config, db, thread_id)
+        # the oauth client keeps the session it was built with, so it is built again with the new one when needed
+        self._oauth = None
 
     async def _setup_tool(self, prev_config: Optional[AgentToolConfig]):
         client_info_repo = ToolOAuthClientInfoRepository(self.db)
@@ -105,7 +111,9 @@ class JiraTool(OpenApiTool):
         return ret
     
     async def _add_auth_headers(self, headers: dict) -> dict:
-        tokens = await cast(AgentToolOauth, self._oauth).solve_tokens()
+        if not self._oauth:
+            self._oauth = await self._load_oauth()
+        tokens = await self._oauth.solve_tokens()
         if tokens:
             headers["Authorization"] = f"Bearer {tokens.access_token}"
         return headers
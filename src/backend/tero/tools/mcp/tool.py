@@ -33,7 +33,3 @@ class McpTool(BaseMcpTool):
     def _get_transport(self) -> str:
         url = self._get_mcp_server_url()
         return "sse" if url.endswith("/sse") else "streamable_http"
-
-    def _get_connection_id(self) -> str:
-        return cast(str, AnyHttpUrl(self._get_mcp_server_url()).host)
-
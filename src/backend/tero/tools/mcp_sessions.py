@@ -0,0 +1,190 @@
+import asyncio
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+import logging
+import time
+from typing import Optional, cast
+
+from langchain.tools import BaseTool
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.sessions import Connection
+from mcp import ClientSession
+
+from ..core.env import env
+
+
+logger = logging.getLogger(__name__)
+_HEALTH_CHECK_TIMEOUT_SECONDS = 5
+McpToolsLoader = Callable[[ClientSession], Awaitable[list[BaseTool]]]
+McpSessionFailureHandler = Callable[["_PooledSession"], None]
+
+
+class _PooledSession:
+
+    def __init__(self, key: tuple):
+        self.key = key
+        self.tools: list[BaseTool] = []
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+        self._session: Optional[ClientSession] = None
+        self._ready: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # the mcp session is opened and closed in a task owned by the pool since mcp sessions (anyio task groups)
+    # need to be entered and exited in the same task, and pooled sessions outlive the requests using them
+    def open(self, connection: Connection, tools_loader: McpToolsLoader, on_failure: McpSessionFailureHandler):
+        self._task = asyncio.create_task(self._run(connection, tools_loader, on_failure))
+
+    async def _run(self, connection: Connection, tools_loader: McpToolsLoader, on_failure: McpSessionFailureHandler):
+        connection_id = "mcp"
+        try:
+            async with MultiServerMCPClient({connection_id: connection}).session(connection_id) as session:
+                self._session = session
+                self.tools = await tools_loader(session)
+                self._ready.set_result(None)
+                await self._closing.wait()
+        except asyncio.CancelledError:
+            if not self._ready.done():
+                self._ready.cancel()
+            raise
+        except BaseException as e:
+            if not self._ready.done():
+                self._ready.set_exception(e)
+            elif not self._closing.is_set():
+                logger.warning(f"MCP session for {self.key[1]} closed unexpectedly", exc_info=True)
+                on_failure(self)
+        finally:
+            self._closing.set()
+
+    async def wait_ready(self):
+        await asyncio.shield(self._ready)
+
+    @property
+    def is_opening(self) -> bool:
+        return not self._ready.done()
+
+    @property
+    def is_closed(self) -> bool:
+        return self._closing.is_set()
+
+    async def ping(self):
+        await asyncio.wait_for(cast(ClientSession, self._session).send_ping(), _HEALTH_CHECK_TIMEOUT_SECONDS)
+
+    async def close(self):
+        self._closing.set()
+        if self._task:
+            if self.is_opening:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class McpSessionPool:
+    """
+    Keeps initialized MCP sessions (and their list of tools) to reuse them across requests.
+
+    Sessions are identified by a key which should include everything that identifies the connection (server url, auth identity, custom headers, etc),
+    and are closed after being idle for a given time, when they fail a health check, or when the pool exceeds its max size.
+    """
+
+    def __init__(self, max_size: int, idle_ttl_seconds: int, health_check_seconds: int):
+        self._max_size = max_size
+        self._idle_ttl_seconds = idle_ttl_seconds
+        self._health_check_seconds = health_check_seconds
+        self._sessions: OrderedDict[tuple, _PooledSession] = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    @asynccontextmanager
+    async def session(self, key: tuple, connection: Connection, tools_loader: McpToolsLoader) -> AsyncIterator[list[BaseTool]]:
+        entry = await self._acquire(key, connection, tools_loader)
+        try:
+            yield entry.tools
+        finally:
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            if self._sessions.get(key) is not entry:
+                # the session was discarded while in use
+                await self._discard(entry)
+            await self._evict()
+
+    async def _acquire(self, key: tuple, connection: Connection, tools_loader: McpToolsLoader) -> _PooledSession:
+        self._start_sweeper()
+        while True:
+            entry = self._sessions.get(key)
+            if entry is None:
+                entry = _PooledSession(key)
+                self._sessions[key] = entry
+                entry.open(connection, tools_loader, self._on_session_failure)
+            # the lease is taken before any await, so the session is not closed (by the sweeper or other requests) while checking it
+            entry.leases += 1
+            try:
+                # the session might be discarded by another request while checking it
+                if await self._is_healthy(entry) and self._sessions.get(key) is entry:
+                    self._sessions.move_to_end(key)
+                    return entry
+            except BaseException:
+                entry.leases -= 1
+                # sessions which failed to open are discarded so next requests try to open them again
+                if entry.is_closed:
+                    await self._discard(entry)
+                raise
+            entry.leases -= 1
+            await self._discard(entry)
+
+    async def _is_healthy(self, entry: _PooledSession) -> bool:
+        # when the session is being opened by another request, we wait for it and share its result (even errors like auth ones)
+        await entry.wait_ready()
+        if entry.is_closed:
+            return False
+        now = time.monotonic()
+        # sessions used by other requests (besides the lease of the current one) are known to be alive
+        if entry.leases > 1 or now - entry.last_checked < self._health_check_seconds:
+            return True
+        try:
+            await entry.ping()
+            entry.last_checked = now
+            return True
+        except Exception:
+            logger.warning(f"MCP session for {entry.key[1]} failed health check", exc_info=True)
+            return False
+
+    async def _discard(self, entry: _PooledSession):
+        if self._sessions.get(entry.key) is entry:
+            del self._sessions[entry.key]
+        # sessions in use are closed once released
+        if entry.leases == 0:
+            await entry.close()
+
+    # sessions dropped after being opened (eg: server restarts) are discarded so next requests open new ones.
+    # Requests using them when dropped get the errors from their tools calls and release them afterwards
+    def _on_session_failure(self, entry: _PooledSession):
+        if self._sessions.get(entry.key) is entry:
+            del self._sessions[entry.key]
+
+    # closes idle sessions that expired or exceed the max size of the pool (least recently used first).
+    # Sessions in use are never closed, so the pool may temporarily exceed the max size
+    async def _evict(self):
+        now = time.monotonic()
+        idle = [e for e in self._sessions.values() if e.leases == 0 and not e.is_opening]
+        excess = len(self._sessions) - self._max_size
+        for entry in idle:
+            if now - entry.last_used >= self._idle_ttl_seconds or excess > 0 or entry.is_closed:
+                excess -= 1
+                await self._discard(entry)
+
+    def _start_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def _sweep(self):
+        while self._sessions:
+            await asyncio.sleep(self._idle_ttl_seconds)
+            try:
+                await self._evict()
+            except Exception:
+                logger.warning("Problem closing idle MCP sessions", exc_info=True)
+
+
+mcp_session_pool = McpSessionPool(env.mcp_session_pool_max_size, env.mcp_session_idle_ttl_seconds, env.mcp_session_health_check_seconds)
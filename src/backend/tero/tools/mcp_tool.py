@@ -3,18 +3,21 @@ from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
 from datetime import timedelta
 from enum import Enum
+import hashlib
+import json
 import logging
-from typing import Any, Mapping, Optional, cast
+from typing import Any, Optional, cast
 
 from httpx import HTTPStatusError
 from langchain.tools import BaseTool
-from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.sessions import Connection, SSEConnection, StreamableHttpConnection
 from langchain_mcp_adapters.tools import load_mcp_tools
+from mcp import ClientSession
 from mcp.shared.session import RequestResponder
 from mcp.types import ServerRequest, ClientResult, ServerNotification
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from ..agents.domain import AgentToolConfig
+from ..agents.domain import Agent, AgentToolConfig
 from ..tools.auth import (
     AgentToolOauth,
     ToolAuthCallback,
@@ -29,6 +32,7 @@ from ..tools.auth import (
     ToolOAuthClientInfoRepository,
 )
 from .core import AgentTool, StatusUpdateCallbackHandler
+from .mcp_sessions import mcp_session_pool
 
 
 class AuthType(str, Enum):
@@ -98,25 +102,27 @@ class BaseMcpTool(AgentTool, abc.ABC):
             if isinstance(message, Exception):
                 raise message
 
+        async def tools_loader(mcp_session: ClientSession) -> list[BaseTool]:
+            ret = self._fix_tools_schemas(await load_mcp_tools(mcp_session))
+            for tool in ret:
+                tool.callbacks = [StatusUpdateCallbackHandler(tool.name, description=tool.description)]
+            return ret
+
         server_url = self._get_mcp_server_url()
         auth_token = await self._get_auth_token()
-        connection_id = self._get_connection_id()
-        base_config: dict[str, Any] = {
-            "transport": self._get_transport(),
-            "url": server_url,
-            "headers": self._build_headers(await self._get_auth_headers(auth_token)),
-            "session_kwargs": {
-                "message_handler": error_raising_message_handler,
-                "read_timeout_seconds": timedelta(seconds=30),
-            },
+        transport = self._get_transport()
+        headers = self._build_headers(await self._get_auth_headers(auth_token))
+        session_kwargs: dict[str, Any] = {
+            "message_handler": error_raising_message_handler,
+            "read_timeout_seconds": timedelta(seconds=30),
         }
-        connections: Mapping[str, Any] = {connection_id: base_config}
+        connection: Connection = SSEConnection(transport="sse", url=server_url, headers=headers, session_kwargs=session_kwargs) \
+            if transport == "sse" else StreamableHttpConnection(transport="streamable_http", url=server_url, headers=headers, session_kwargs=session_kwargs)
+        # sessions are shared by any tool instance using the same server and headers (which include auth identity and custom headers)
+        session_key = (transport, server_url, hashlib.sha256(json.dumps(headers, sort_keys=True).encode()).hexdigest())
         try:
-            async with MultiServerMCPClient(connections).session(connection_id) as mcp_session:
-                tools = await load_mcp_tools(mcp_session)
-                self._tools = self._fix_tools_schemas(tools)
-                for tool in self._tools:
-                    tool.callbacks = [StatusUpdateCallbackHandler(tool.name, description=tool.description)]
+            async with mcp_session_pool.session(session_key, connection, tools_loader) as tools:
+                self._tools = tools
                 yield self
         except ExceptionGroup as exception:
             if any(
@@ -149,6 +155,11 @@ class BaseMcpTool(AgentTool, abc.ABC):
             raise ToolAuthRequestException(ToolAuthTokenRequest(tool_id=self.id, agent_id=self.agent.id))
         return token.access_token
 
+    def configure(self, agent: Agent, user_id: int, config: dict, db: AsyncSession, thread_id: Optional[int] = None):
+        super().configure(agent, user_id, config, db, thread_id)
+        # the oauth client keeps the session it was built with, so it is built again with the new one when needed
+        self._oauth = None
+
     def _get_oauth(self) -> AgentToolOauth:
         if not self._oauth:
             server_url = self._get_mcp_server_url()
@@ -159,9 +170,6 @@ class BaseMcpTool(AgentTool, abc.ABC):
         url = self._get_mcp_server_url()
         return "sse" if url.endswith("/sse") else "streamable_http"
 
-    def _get_connection_id(self) -> str:
-        return self.id
-
     async def _get_auth_headers(self, auth_token: Optional[str] = None) -> dict[str, str]:
         if auth_token:
             return {"Authorization": auth_token}
@@ -32,15 +32,20 @@ class UsageRepository:
         return ret.one() or 0.0
 
     async def add(self, usage: Usage | MessageUsage | None):
+        if self.add_pending(usage):
+            await self._db.commit()
+
+    # adds the usage to the session without committing, so it is saved in the same transaction as other changes.
+    # Returns False when there is nothing to save
+    def add_pending(self, usage: Usage | MessageUsage | None) -> bool:
         if not usage or usage.usd_cost == 0:
-            return
+            return False
 
         if isinstance(usage, MessageUsage):
-            for usage in usage.usages():
-                self._db.add(usage)
+            self._db.add_all(usage.usages())
         else:
             self._db.add(usage)
-        await self._db.commit()
+        return True
 
     async def _get_human_hours(self, from_date: datetime, to_date: datetime, team_id: int, user_id: int) -> float:
         human_hours_query = select(func.sum(User.monthly_hours)).where(and_(User.created_at <= to_date, or_(col(User.deleted_at).is_(None), col(User.deleted_at) >= from_date), 
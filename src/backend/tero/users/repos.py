@@ -1,13 +1,16 @@
+from collections import OrderedDict
 from datetime import datetime, timezone
 import logging
+import time
 from typing import Optional
 
 from sqlalchemy.orm import selectinload
 from sqlmodel import col, select, and_, delete, or_
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from ..core.env import env
 from ..core.repos import attr, scalar
-from ..teams.domain import TeamRole
+from ..teams.domain import Team, TeamRole
 from .domain import User
 
 
@@ -69,9 +72,65 @@ class UserRepository:
         self._db.add(user)
         await self._db.commit()
         await self._db.refresh(user, ['id', 'team_roles'])
+        user_cache.invalidate_user(user.id)
         return user
 
     async def delete_user(self, user_id: int):
         stmt = delete(User).where(col(User.id) == user_id)
         await self._db.exec(scalar(stmt))
         await self._db.commit()
+        user_cache.invalidate_user(user_id)
+
+
+# Keeps authenticated users (with their team roles) in memory for a short period of time to avoid querying the db on every request.
+# Entries are invalidated when the user or their team roles change in this process, and the TTL bounds staleness for changes made
+# by other processes.
+class UserCache:
+
+    def __init__(self, ttl_seconds: int, max_size: int):
+        self._ttl_seconds = ttl_seconds
+        self._max_size = max_size
+        self._entries: OrderedDict[str, tuple[float, User]] = OrderedDict()
+
+    def get(self, username: str) -> Optional[User]:
+        entry = self._entries.get(username)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            del self._entries[username]
+            return None
+        self._entries.move_to_end(username)
+        # return a copy so changes done while processing a request don't leak to other requests
+        return _copy_user(user)
+
+    def put(self, user: User):
+        if self._ttl_seconds <= 0 or self._max_size <= 0:
+            return
+        self._entries[user.username] = (time.monotonic() + self._ttl_seconds, _copy_user(user))
+        self._entries.move_to_end(user.username)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        for username in [username for username, (_, user) in self._entries.items() if user.id == user_id]:
+            del self._entries[username]
+
+    def clear(self):
+        self._entries.clear()
+
+
+def _copy_user(user: User) -> User:
+    ret = User(**user.model_dump())
+    ret.team_roles = [_copy_team_role(tr) for tr in user.team_roles]
+    return ret
+
+
+def _copy_team_role(team_role: TeamRole) -> TeamRole:
+    ret = TeamRole(**team_role.model_dump())
+    if team_role.team:
+        ret.team = Team(**team_role.team.model_dump())
+    return ret
+
+
+user_cache = UserCache(env.user_cache_ttl_seconds, env.user_cache_max_size)
@@ -51,8 +51,11 @@ insert into user_agent (user_id, agent_id, creation) values
 insert into agent_tool_config (agent_id, tool_id, config, draft) values
 (4, 'docs', '{}', false);
 
-insert into file (name, status, content_type, user_id, timestamp, content, processed_content, file_processor) values
-('test.txt', 'PROCESSED','text/plain', 2, '2025-02-21 12:00', '\x48656c6c6f21', 'Hello!', 'BASIC');
+insert into file_blob (hash, content) values
+('334d016f755cd6dc58c53a86e183882f8ec14f52fb05345887c8a5edd42c87b7', '\x48656c6c6f21');
+
+insert into file (name, status, content_type, user_id, timestamp, content_hash, processed_content, file_processor) values
+('test.txt', 'PROCESSED','text/plain', 2, '2025-02-21 12:00', '334d016f755cd6dc58c53a86e183882f8ec14f52fb05345887c8a5edd42c87b7', 'Hello!', 'BASIC');
 
 insert into agent_tool_config_file (agent_id, tool_id, file_id) values
 (4, 'docs', 1);
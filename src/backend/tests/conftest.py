@@ -30,6 +30,7 @@ from tero.core import repos as repos_module, auth
 from tero.core.env import env
 from tero.core.repos import get_db
 from tero.teams.domain import Role, Team, TeamRole, TeamRoleStatus
+from tero.threads.api import answer_streams, minutes_saved_estimations
 from tero.threads.domain import Thread, ThreadMessage
 from tero.users.domain import User, UserListItem
 
@@ -124,6 +125,9 @@ async def client_fixture(session: AsyncSession) -> AsyncGenerator[AsyncClient, N
     app.dependency_overrides[auth.get_current_user] = get_current_user_override
     async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
         yield client
+    # avoid background answers and minutes saved estimations outliving the test database
+    await answer_streams.join()
+    await minutes_saved_estimations.join()
     app.dependency_overrides.clear()
 
 
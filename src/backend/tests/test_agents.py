@@ -1,4 +1,6 @@
-from typing import Any, cast
+from typing import Any, Awaitable, Callable, cast
+
+import chardet
 
 from sqlmodel import col
 
@@ -9,7 +11,7 @@ from tero.agents.api import AGENTS_PATH, AGENT_PIN_PATH, AGENT_PATH, AGENT_TOOL_
 from tero.agents.domain import PublicAgent, AgentToolConfig, AutomaticAgentField, LlmTemperature, ReasoningEffort, AgentUpdate, AgentListItem
 from tero.agents.prompts.api import AGENT_PROMPTS_PATH
 from tero.agents.prompts.domain import AgentPromptPublic, AgentPrompt
-from tero.files.domain import FileMetadata, FileStatus, FileProcessor
+from tero.files.domain import FileMetadata, FileStatus, FileProcessor, FileBlob
 from tero.teams.domain import Team, Role
 from tero.tools.docs import DOCS_TOOL_ID
 from tero.users.domain import UserListItem
@@ -256,6 +258,55 @@ async def test_upload_agent_tool_file(client: AsyncClient):
     assert resp.content == file_content
 
 
+@freeze_time(CURRENT_TIME)
+@pytest.mark.usefixtures("stub_docs_tool_generate_description")
+async def test_upload_agent_tool_files_with_same_content(client: AsyncClient, session: AsyncSession):
+    await _configure_docs_tool(client)
+    file_content = b"Hello"
+    file_id = await upload_agent_tool_config_file(AGENT_ID, DOCS_TOOL_ID, client, "test.txt", file_content)
+    other_file_id = await upload_agent_tool_config_file(AGENT_ID, DOCS_TOOL_ID, client, "other.txt", file_content)
+    resp = await _await_docs_tool_file_processed(other_file_id, client)
+    assert_response(resp, [_build_uploaded_file_metadata(file_id, "test.txt"), _build_uploaded_file_metadata(other_file_id, "other.txt")])
+    assert await _count_file_blobs(file_content, session) == 1
+    resp = await _delete_agent_tool_config_file(AGENT_ID, DOCS_TOOL_ID, file_id, client)
+    resp.raise_for_status()
+    resp = await _find_agent_tool_config_file_content(AGENT_ID, DOCS_TOOL_ID, other_file_id, client)
+    resp.raise_for_status()
+    assert resp.content == file_content
+    resp = await _delete_agent_tool_config_file(AGENT_ID, DOCS_TOOL_ID, other_file_id, client)
+    resp.raise_for_status()
+    assert await _count_file_blobs(file_content, session) == 0
+
+
+async def _build_large_asset_bytes(filename: str, encoding: str) -> bytes:
+    text = await find_asset_text(filename)
+    # big enough to only sample some parts of the content when detecting its encoding
+    return (text * (256 * 1024 // len(text) + 1)).encode(encoding)
+
+
+@pytest.mark.parametrize("filename,build_content", [
+    ("sample.txt", lambda: find_asset_bytes("sample.txt")),
+    ("users.csv", lambda: find_asset_bytes("users.csv")),
+    ("pdf_basic_content.txt", lambda: find_asset_bytes("pdf_basic_content.txt")),
+    ("large_utf8.txt", lambda: _build_large_asset_bytes("pdf_basic_content.txt", "utf-8")),
+    ("large_cp1252.txt", lambda: _build_large_asset_bytes("pdf_basic_content.txt", "cp1252")),
+])
+async def test_upload_agent_tool_file_detects_encoding(filename: str, build_content: Callable[[], Awaitable[bytes]], client: AsyncClient):
+    await _configure_docs_tool(client)
+    content = await build_content()
+    # only the encoding detection is checked, so the file is not processed by the tool
+    with patch("tero.agents.tool_file._add_tool_file", new=AsyncMock()):
+        resp = await try_upload_agent_tool_config_file(AGENT_ID, DOCS_TOOL_ID, client, filename, content)
+    resp.raise_for_status()
+    expected_encoding = cast(str, chardet.detect(content)["encoding"]).lower()
+    assert resp.json()["contentType"].endswith(f"; charset={expected_encoding}")
+
+
+async def _count_file_blobs(content: bytes, session: AsyncSession) -> int:
+    ret = await session.exec(select(func.count()).select_from(FileBlob).where(FileBlob.hash == FileBlob.from_content(content).hash))
+    return ret.one()
+
+
 async def _await_docs_tool_file_processed(file_id: int, client: AsyncClient) -> Response:
     return await await_files_processed(AGENT_ID, DOCS_TOOL_ID, file_id, client)
 
@@ -472,6 +523,25 @@ async def _clone_agent(agent_id: int, client: AsyncClient) -> int:
     return resp.json()["id"]
 
 
+@freeze_time(CURRENT_TIME)
+@pytest.mark.usefixtures("stub_docs_tool_generate_description")
+async def test_clone_agent_tool_files(client: AsyncClient, session: AsyncSession):
+    await _configure_docs_tool(client)
+    filename = "test.txt"
+    file_content = b"Hello"
+    file_id = await upload_agent_tool_config_file(AGENT_ID, DOCS_TOOL_ID, client, filename, file_content)
+    await _await_docs_tool_file_processed(file_id, client)
+    cloned_agent_id = await _clone_agent(AGENT_ID, client)
+    resp = await find_agent_tool_config_files(cloned_agent_id, DOCS_TOOL_ID, client)
+    resp.raise_for_status()
+    cloned_files = resp.json()
+    assert [f["name"] for f in cloned_files] == [filename]
+    resp = await _find_agent_tool_config_file_content(cloned_agent_id, DOCS_TOOL_ID, cloned_files[0]["id"], client)
+    resp.raise_for_status()
+    assert resp.content == file_content
+    assert await _count_file_blobs(file_content, session) == 1
+
+
 async def test_clone_protected_agent_as_non_editor(client: AsyncClient):
     resp = await client.post(f"{AGENT_PATH.format(agent_id=NON_EDITABLE_AGENT_ID)}/clone")
     assert resp.status_code == status.HTTP_403_FORBIDDEN
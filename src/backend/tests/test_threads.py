@@ -1,4 +1,4 @@
-from datetime import timezone
+from datetime import timedelta, timezone
 import re
 import threading
 import time
@@ -12,8 +12,8 @@ from .common import find_last_message_id_for_thread
 
 from tero.agents.domain import AgentListItem
 from tero.files.domain import FileMetadata, FileProcessor, FileMetadataWithContent
-from tero.threads.api import THREADS_PATH, THREAD_PATH, THREAD_MESSAGES_PATH, THREAD_MESSAGE_PATH, THREAD_FILE_PATH
-from tero.threads.domain import ThreadListItem, ThreadMessageOrigin, ThreadMessagePublic
+from tero.threads.api import THREADS_PATH, THREAD_PATH, THREAD_MESSAGES_PATH, THREAD_MESSAGE_PATH, THREAD_FILE_PATH, minutes_saved_estimations
+from tero.threads.domain import ThreadListItem, ThreadMessageOrigin, ThreadMessagePublic, ThreadMessage, MinutesSavedEstimation
 from tero.tools.core import AgentActionEvent, AgentAction
 from tero.usage.domain import Usage, UsageType
 
@@ -170,8 +170,9 @@ async def test_add_thread_message(last_message_id: int, client: AsyncClient, ses
 
 
 async def _assert_response(resp: Response, response: str, user_message_id: int, minutes_saved: Optional[int] = None, stopped = False,
-                    send_pre_model_status: bool = True, status_updates: List[AgentActionEvent] = [], user_files: List[FileMetadata] = []):
-    buffer, events = [], []
+                    send_pre_model_status: bool = True, status_updates: List[AgentActionEvent] = [], user_files: List[FileMetadata] = [],
+                    thread_name: Optional[str] = None):
+    buffer, events, thread_name_events = [], [], []
     separator = "\r\n\r\n"
 
     def flush_buffer():
@@ -182,14 +183,19 @@ async def _assert_response(resp: Response, response: str, user_message_id: int,
     async for chunk in resp.aiter_bytes():
         decoded_chunk = chunk.decode()
         for event in decoded_chunk.split(separator):
+            event = re.sub(r'\r\nid: \d+$', '', event)
             if event.startswith("data: "):
                 buffer.append(event[6:])
             elif event.startswith("event: heartbeat"):
                 continue
+            # thread name is generated concurrently with the answer, so it may be sent at any point before metadata
+            elif event.startswith("event: threadName"):
+                flush_buffer()
+                thread_name_events.append(f"{event}{separator}".encode())
             else:
                 flush_buffer()
                 if event.startswith("event: metadata") and minutes_saved is None:
-                    event = re.sub(r'"minutesSaved":\s*\d+,\s*', '', event)
+                    event = re.sub(r'"minutesSaved":\s*(\d+|null),\s*', '', event)
                 if event.startswith("event: userMessage"):
                     event = re.sub(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})Z', r'\1', event)
                 if event: events.append(f"{event}{separator}".encode())
@@ -229,6 +235,7 @@ async def _assert_response(resp: Response, response: str, user_message_id: int,
                 "stopped": stopped
             }))).encode())
     assert events == expected_events
+    assert thread_name_events == ([ServerSentEvent(event="threadName", data=json.dumps({"name": thread_name})).encode()] if thread_name else [])
 
 
 @freeze_time(CURRENT_TIME)
@@ -260,6 +267,23 @@ async def test_add_thread_message_stopped_response(last_message_id: int, client:
         stop_thread.join(timeout=2)
 
 
+async def test_resume_thread_message_stream(last_message_id: int, client: AsyncClient, session: AsyncSession):
+    parent_message_id = await find_last_message_id_for_thread(THREAD_ID, session)
+    async with add_message_to_thread(client, THREAD_ID,
+                                     "Which is the first natural number? Only provide the number", parent_message_id=parent_message_id) as resp:
+        # events are sent without compression to avoid buffering them
+        assert "content-encoding" not in resp.headers
+        await _assert_response(resp, "1", last_message_id + 1)
+    async with client.stream("GET", _build_thread_message_stream_path(THREAD_ID, last_message_id + 1), headers={"Last-Event-ID": "0"}) as resp:
+        await _assert_response(resp, "1", last_message_id + 1)
+    resp = await client.get(_build_thread_message_stream_path(THREAD_ID, last_message_id + 2))
+    assert resp.status_code == status.HTTP_404_NOT_FOUND
+
+
+def _build_thread_message_stream_path(thread_id: int, message_id: int) -> str:
+    return THREAD_MESSAGE_PATH.format(thread_id=thread_id, message_id=message_id) + "/stream"
+
+
 @freeze_time(CURRENT_TIME)
 async def test_add_thread_message_with_reasoning_model(last_message_id: int, client: AsyncClient, session: AsyncSession):
     parent_message_id = await find_last_message_id_for_thread(OTHER_THREAD_ID, session)
@@ -309,7 +333,45 @@ async def test_thread_message_minutes_saved_estimation_with_positive_feedback(la
         await _assert_response(resp, "2", last_message_id + 1)
     await _update_thread_message(client, THREAD_ID, last_message_id + 2, {"hasPositiveFeedback": True, "minutesSaved": minutes_saved})
     async with add_message_to_thread(client, THREAD_ID, "Which is 2 + 2? Only provide the number", parent_message_id=last_message_id + 2) as resp:
-        await _assert_response(resp, "4", last_message_id + 3, minutes_saved)
+        await _assert_response(resp, "4", last_message_id + 3)
+    await minutes_saved_estimations.join()
+    answer_minutes_saved = await session.scalar(select(ThreadMessage.minutes_saved).where(ThreadMessage.id == last_message_id + 4))
+    assert answer_minutes_saved == minutes_saved
+
+
+async def test_recover_pending_minutes_saved_estimation(last_message_id: int, client: AsyncClient, session: AsyncSession):
+    parent_message_id = await find_last_message_id_for_thread(THREAD_ID, session)
+    async with add_message_to_thread(client, THREAD_ID, "Which is 1 + 1? Only provide the number", parent_message_id=parent_message_id) as resp:
+        await _assert_response(resp, "2", last_message_id + 1)
+    await minutes_saved_estimations.join()
+    answer_id = last_message_id + 2
+    assert await session.get(MinutesSavedEstimation, answer_id) is None
+    # simulates an estimation interrupted by a restart
+    answer = cast(ThreadMessage, await session.get(ThreadMessage, answer_id))
+    answer.minutes_saved = None
+    session.add(answer)
+    session.add(MinutesSavedEstimation(answer_message_id=answer_id, thread_id=THREAD_ID, user_id=USER_ID,
+                                       claimed_until=datetime.now(timezone.utc) - timedelta(minutes=1)))
+    await session.commit()
+    resp = await _find_thread_message(client, THREAD_ID, answer_id)
+    resp.raise_for_status()
+    assert resp.json()["minutesSaved"] is None
+    await minutes_saved_estimations.sweep()
+    await minutes_saved_estimations.join()
+    resp = await _find_thread_message(client, THREAD_ID, answer_id)
+    resp.raise_for_status()
+    assert resp.json()["minutesSaved"] == 0
+    session.expire_all()
+    assert await session.get(MinutesSavedEstimation, answer_id) is None
+
+
+async def _find_thread_message(client: AsyncClient, thread_id: int, message_id: int) -> Response:
+    return await client.get(THREAD_MESSAGE_PATH.format(thread_id=thread_id, message_id=message_id))
+
+
+async def test_find_thread_message_from_other_thread(client: AsyncClient):
+    resp = await _find_thread_message(client, OTHER_THREAD_ID, 1)
+    assert resp.status_code == status.HTTP_404_NOT_FOUND
 
 
 async def _update_thread_message(client: AsyncClient, thread_id: int, message_id: int, body: dict[str, Any]) -> Response:
@@ -498,7 +560,7 @@ async def test_thread_with_model(model_id: str, last_message_id: int, client: As
     thread_id = thread_resp.json()["id"]
 
     async with add_message_to_thread(client, thread_id, "What is 2 + 2? Only provide the number.") as resp:
-        await _assert_response(resp, "4", last_message_id + 1)
+        await _assert_response(resp, "4", last_message_id + 1, thread_name="stub chat title")
 
     usages = await session.execute(select(Usage).where(Usage.agent_id == agent_id))
     for usage in usages.scalars().all():
@@ -544,8 +606,27 @@ async def test_download_thread_file(client: AsyncClient, session: AsyncSession):
     assert resp.content == b"Sample test"
 
 
-async def _download_thread_file(thread_id: int, file_id: int, client: AsyncClient) -> Response:
-    return await client.get(f"{THREAD_FILE_PATH.format(thread_id=THREAD_ID, file_id=file_id)}/content")
+async def test_download_thread_file_range(client: AsyncClient, session: AsyncSession):
+    parent_message_id = await find_last_message_id_for_thread(THREAD_ID, session)
+    file_id = await _add_thread_file(THREAD_ID, client, parent_message_id=parent_message_id)
+    resp = await _download_thread_file(THREAD_ID, file_id, client, {"Range": "bytes=7-"})
+    assert resp.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert resp.headers["content-range"] == "bytes 7-10/11"
+    assert resp.content == b"test"
+
+
+async def test_download_thread_file_not_modified(client: AsyncClient, session: AsyncSession):
+    parent_message_id = await find_last_message_id_for_thread(THREAD_ID, session)
+    file_id = await _add_thread_file(THREAD_ID, client, parent_message_id=parent_message_id)
+    resp = await _download_thread_file(THREAD_ID, file_id, client)
+    resp.raise_for_status()
+    resp = await _download_thread_file(THREAD_ID, file_id, client, {"If-None-Match": resp.headers["etag"]})
+    assert resp.status_code == status.HTTP_304_NOT_MODIFIED
+    assert resp.content == b""
+
+
+async def _download_thread_file(thread_id: int, file_id: int, client: AsyncClient, headers: Optional[dict[str, str]] = None) -> Response:
+    return await client.get(f"{THREAD_FILE_PATH.format(thread_id=THREAD_ID, file_id=file_id)}/content", headers=headers)
 
 
 async def test_download_thread_file_from_another_user_thread(client: AsyncClient, override_user: Callable[[int], None]):
@@ -44,6 +44,7 @@ export const GLOBAL_TEAM_ID = 1;
 export const MY_TEAM_ID = 0;
 export const PRIVATE_TEAM_ID = -1;
 export const PRIVATE_AGENT_ID = -1;
+const MAX_STREAM_RECONNECTIONS = 3;
 const PRIVATE_AGENT_ICON_BASE64 = 'iVBORw0KGgoAAAANSUhEUgAAADAAAAAwCAYAAABXAvmHAAAAAXNSR0IArs4c6QAAA+NJREFUaEPtmU2IV2UUxn9PaRFoGBkVmKZ9GFFEpQRWRh+LkDYhCUVBklGR9iW5KVoMtXGIMfowWohQaKjUrlWEWS2KgsQ2ZaGDRSGlWBJl2uk+cAYGnZn/e+feYf4T/wPDfxbvfd/z3POec57zXDHFTVPcf3oAJjuCvQj8LyMQEacB04HTE+Bx4Likf9sG3OoViogzgDnAZcBiYAEQwLfAXuAbYFDSsbaAtAYgIs4F7gZWpPOzTnLyL+AL4G3gfUm/tQGiFQARcU51ZV4C7gFmA/8A+4Ef0slLgIvzWv0KbK/WPCfpcFMQbQHoB9YAZ6bTbwAfA4fSwfOApcBDwBXA38Crkp6ddAARcRuwrXLIV+h74DFg1/B7HhF+UU5qg9gIXFoB9hVaIemjJiAaRSCrzbvAcuBP4BFJW8ZyKCJWARsAJ/xbVZSeaFKdmgKYD+wArgO+Bm6XNHRtRsQREWcBnwHXAl868SX9ON4oNAWwBNgELPRblfR0iSMRMQA8lVfuYUk7S54baU1TAMuA17PCrJPkZO5oEeHkXZ+V6nFJH3R8aJQFPQC9CEDvCtXOn4hwx51XcRsn8TrgQnfW5Dkl+z2QnfvnTGYnsUmeO3Qtq53EEXF1VT0eBPxrEP4zoAPAL4WnXwBclJRi0M5XzXBPVc02S/JvsdUCEBFXVTV/K3B5dtLigwoWmmJ/V1HveyWZdhdZXQAmaOYzHlB2Z0etHfaTPHP03Mk9P/h/86hbiryHclUiIhYBHwIzgPeS9zSmw3Y06fg7wJ3AH8AdkkwzOlpxBCLC995d18+slWRW2ZpFhFnsyznBubRuLtl8PAC8b/EBJU5kFIZeUK39JwxARHg29iTmQX63pN/HAjMswpMPICJuqBL9+WSpdsilcb2kz0cD0TUAIsJJbrq8cpisciLn4GckuXmdYt0E4JpqsH+tqlg3pYxiZ90/PgVWS3L57WoAVyaAW4F96aknN5dgJ7+bVVcDsB7kgcUqxcz01LXdw06/JOtD3QsgS6L50V3Azdk3PC9vkWTOM6J1TQ4MeZcyo0Uul+ojko5OmTI6lqOTGYH7gTezNLrGDzTRc4YDSX3JKsWL2fgelWRu1NHqdGKraZ9Uytr5qeesBX7KAzseNMYCS/FzgT7gRuCgc0eSVb6OVgwgk9OK2pMp3rpEWsA1tW5i03K+MAiDeUWSo1FkdQF4dHyhGjzuA84uOqF8kbmSZcm+0br1SFvVApBRsIh7fQ42JmxtmKXFXcBXdb8b1AaQIPycxdmhT0hNQZgrHZPkrzm1bFwAap0wwYt7ACb4BXfcvheBjq9oghdM+Qj8B4wJmEDEKTttAAAAAElFTkSuQmCC';
 
 export enum LlmModelType {
@@ -673,8 +674,8 @@ export class ApiService {
     return await response.json()
   }
 
-  private async fetch(path: string, method: string = 'GET', body: object | undefined = undefined, authEnabled: boolean = true) {
-    const headers: Record<string, string> = {}
+  private async fetch(path: string, method: string = 'GET', body: object | undefined = undefined, authEnabled: boolean = true, extraHeaders: Record<string, string> = {}) {
+    const headers: Record<string, string> = { ...extraHeaders }
     if (authEnabled) {
       headers['Authorization'] = await this.getUserAuth()
     }
@@ -994,6 +995,10 @@ export class ApiService {
     return await this.fetchJson(`/threads/${threadId}/messages`)
   }
 
+  async findThreadMessage(threadId: number, threadMessageId: number): Promise<ThreadMessage> {
+    return await this.fetchJson(`/threads/${threadId}/messages/${threadMessageId}`)
+  }
+
   async findThreadMessageFile(threadId: number, fileId: number): Promise<ThreadMessageFile> {
     return await this.fetchJson(`/threads/${threadId}/files/${fileId}`)
   }
@@ -1095,32 +1100,31 @@ export class ApiService {
 
     const contentType = resp.headers.get('content-type')
     if (contentType?.startsWith('text/event-stream')) {
-      const ret = await this.fetchSSEStream(resp, url)
-      for await (const part of ret) {
-        if (part.event == 'userMessage') {
-          yield { userMessage: part.data }
-        } else if (part.event == 'message') {
-          yield { answerText: part.data }
-        } else if (part.event == 'metadata') {
-          yield {
-            metadata: {
-              answerMessageId: part.data.answerMessageId,
-              files: part.data.files,
-              minutesSaved: part.data.minutesSaved,
-              stopped: part.data.stopped
+      let ret = this.fetchSSEStream(resp, url)
+      let userMessageId: number | undefined
+      let lastEventId = 0
+      let reconnections = 0
+      while (true) {
+        try {
+          for await (const part of ret) {
+            lastEventId = part.id ?? lastEventId
+            if (part.event == 'userMessage') {
+              userMessageId = part.data.id
             }
-          }
-        } else if (part.event == 'status') {
-          yield {
-            status: {
-              action: part.data.action,
-              toolName: part.data.toolName,
-              step: part.data.step,
-              description: part.data.description,
-              args: part.data.args,
-              result: part.data.result
+            const messagePart = this.parseThreadMessagePart(part)
+            if (messagePart) {
+              yield messagePart
             }
           }
+          return
+        } catch (e) {
+          if (e instanceof HttpError || userMessageId === undefined || reconnections >= MAX_STREAM_RECONNECTIONS) {
+            throw e
+          }
+          // the connection was lost while answering, so we reattach to the answer getting the events we missed
+          reconnections++
+          const streamUrl = `/threads/${threadId}/messages/${userMessageId}/stream`
+          ret = this.fetchSSEStream(await this.fetch(streamUrl, 'GET', undefined, true, { 'Last-Event-ID': lastEventId.toString() }), streamUrl)
         }
       }
     } else {
@@ -1128,6 +1132,36 @@ export class ApiService {
     }
   }
 
+  private parseThreadMessagePart(part: SSEPayload<any>): ThreadMessagePart | undefined {
+    if (part.event == 'userMessage') {
+      return { userMessage: part.data }
+    } else if (part.event == 'message') {
+      return { answerText: part.data }
+    } else if (part.event == 'threadName') {
+      return { threadName: part.data.name }
+    } else if (part.event == 'metadata') {
+      return {
+        metadata: {
+          answerMessageId: part.data.answerMessageId,
+          files: part.data.files,
+          minutesSaved: part.data.minutesSaved,
+          stopped: part.data.stopped
+        }
+      }
+    } else if (part.event == 'status') {
+      return {
+        status: {
+          action: part.data.action,
+          toolName: part.data.toolName,
+          step: part.data.step,
+          description: part.data.description,
+          args: part.data.args,
+          result: part.data.result
+        }
+      }
+    }
+  }
+
   private addFileToForm(file: File, formData: FormData, name: string) {
     // on windows it is not properly solving the mime type of markdown files
     if (file.name.toLowerCase().endsWith('.md')) {
@@ -1158,7 +1192,8 @@ export class ApiService {
         }
         yield {
           event: ev.event || 'message',
-          data: ev.event && ev.data ? (JSON.parse(ev.data) as T) : (ev.data as T)
+          data: ev.event && ev.data ? (JSON.parse(ev.data) as T) : (ev.data as T),
+          id: ev.id
         }
       }
     }
@@ -1255,6 +1290,7 @@ export class ApiService {
 export class ThreadMessagePart {
   userMessage?: { id: number, files: UploadedFile[] }
   answerText?: string
+  threadName?: string
   metadata?: {
     answerMessageId?: number
     files: UploadedFile[],
@@ -1276,15 +1312,19 @@ type SSEPayload<T> = {
   event: string;
   /** parsed data payload */
   data: T;
+  /** the event id, used to resume the stream from it */
+  id?: number;
 };
 
 class ServerSentEvent {
   event?: string
   data: string
+  id?: number
 
-  constructor(data: string, event?: string) {
+  constructor(data: string, event?: string, id?: number) {
     this.data = data
     this.event = event
+    this.id = id
   }
 
   public static fromBytes(bs: Uint8Array): ServerSentEvent[] {
@@ -1305,6 +1345,8 @@ class ServerSentEvent {
       .filter((p) => p.startsWith(dataPrefix))
       .map((p) => p.substring(dataPrefix.length))
       .join('\n')
-    return new ServerSentEvent(data, eventType)
+    const idPrefix = 'id: '
+    const id = parts.find((p) => p.startsWith(idPrefix))?.substring(idPrefix.length)
+    return new ServerSentEvent(data, eventType, id ? parseInt(id) : undefined)
   }
 }